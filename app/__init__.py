@@ -8,6 +8,13 @@ from datetime import datetime, timedelta
 
 # Import models and db
 from app.models import db
+from app.utils.audit_log import access_log_buffer
+from app.utils.counters import download_counter
+from app.utils.share_cache import share_cache
+from app.utils.content_cache import content_cache
+from app.utils.bloom_filter import share_token_filter
+from app.utils.jobs import job_runner
+from app.utils.storage import storage
 
 # Import blueprints
 from app.auth.routes import auth as auth_blueprint
@@ -24,6 +31,13 @@ def create_app(config_class=Config):
     from app.models import User
     db.init_app(app)
     bcrypt = Bcrypt(app)
+    access_log_buffer.init_app(app)
+    download_counter.init_app(app)
+    share_cache.init_app(app)
+    content_cache.init_app(app)
+    share_token_filter.init_app(app)
+    job_runner.init_app(app)
+    storage.init_app(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager(app)
@@ -70,6 +84,13 @@ def create_app(config_class=Config):
             g.session_warning = time_left <= app.config['SESSION_TIMEOUT_WARNING']
             g.time_left_minutes = int(time_left.total_seconds() / 60)
 
+    # Derive the file encryption key up front so the first upload or
+    # download does not pay for PBKDF2
+    from app.utils.file_utils import get_encryption_key, get_cipher
+    get_encryption_key()
+    # Fail at startup, not on the first upload, if the cipher name is wrong
+    get_cipher(app.config.get('ENCRYPTION_CIPHER') or 'aes-256-gcm')
+
     # Register blueprints
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     app.register_blueprint(main_blueprint)
@@ -1,7 +1,15 @@
-from flask import render_template, redirect, url_for, flash, abort, Blueprint, request
+from flask import render_template, redirect, url_for, flash, abort, Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from functools import wraps  # <--- Add this line
-from app.models import db, User
+from datetime import datetime
+from app.models import db, User, File, Job
+from app.utils.share_cache import share_cache
+from app.utils.content_cache import content_cache
+from app.utils.bloom_filter import share_token_filter
+from app.utils.blob_store import release_user_storage
+from app.utils.jobs import enqueue, job_runner, job_stats
+from app.utils import reconciler  # registers the reconcile_storage job
+from app.utils.tiering import tier_report, tier_stats
 
 admin = Blueprint('admin', __name__)
 
@@ -64,8 +72,15 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     try:
         username = user.username
+        # Files on disk are removed by a background job once this commits
+        file_ids = [file_id for (file_id,) in user.files.with_entities(File.id)]
+        share_tokens = release_user_storage(user)
         db.session.delete(user)
         db.session.commit()
+        for token in share_tokens:
+            share_cache.invalidate(token)
+        for file_id in file_ids:
+            content_cache.invalidate_file(file_id)
         flash(f'User "{username}" has been deleted successfully.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -73,4 +88,92 @@ def delete_user(user_id):
     
     return redirect(url_for('admin.view_users'))
 
+@admin.route('/metrics')
+@login_required
+@admin_required
+def metrics():
+    """In-process cache metrics for this worker, as JSON"""
+    return jsonify({'share_cache': share_cache.stats(),
+                    'share_filter': share_token_filter.stats(),
+                    'content_cache': content_cache.stats(),
+                    'storage_tiers': tier_stats.stats()})
+
+@admin.route('/share-filter/rebuild', methods=['POST'])
+@login_required
+@admin_required
+def rebuild_share_filter():
+    """Rebuild this worker's share token filter from the database"""
+    count = share_token_filter.rebuild()
+    flash(f'Share link filter rebuilt with {count} active tokens.', 'success')
+    return redirect(url_for('admin.dashboard'))
+
+@admin.route('/jobs')
+@login_required
+@admin_required
+def jobs():
+    """Background job queue status"""
+    recent = Job.query.order_by(Job.id.desc()).limit(50).all()
+    failed = Job.query.filter_by(status='failed').order_by(Job.finished_at.desc()).limit(20).all()
+    legacy_files = File.query.filter(File.blob_id.is_(None)).count()
+    return render_template('admin/jobs.html', stats=job_stats(), recent=recent, failed=failed,
+                           running=job_runner.running, workers=job_runner.workers,
+                           legacy_files=legacy_files)
+
+@admin.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+@admin_required
+def retry_job(job_id):
+    """Queue a failed job to run again from scratch"""
+    job = Job.query.get_or_404(job_id)
+    if job.status != 'failed':
+        flash('Only failed jobs can be retried.', 'warning')
+        return redirect(url_for('admin.jobs'))
+    job.status = 'queued'
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    db.session.commit()
+    job_runner.wake()
+    flash(f'Job {job.id} queued again.', 'success')
+    return redirect(url_for('admin.jobs'))
+
+@admin.route('/jobs/reencrypt-legacy', methods=['POST'])
+@login_required
+@admin_required
+def reencrypt_legacy_files():
+    """Queue every file stored before the blob store for re-encryption into it"""
+    file_ids = [file_id for (file_id,) in db.session.query(File.id).filter(File.blob_id.is_(None))]
+    for file_id in file_ids:
+        enqueue('reencrypt_file', file_id=file_id)
+    db.session.commit()
+    flash(f'Queued {len(file_ids)} legacy file(s) for re-encryption.', 'success')
+    return redirect(url_for('admin.jobs'))
+
+@admin.route('/jobs/reconcile-storage', methods=['POST'])
+@login_required
+@admin_required
+def reconcile_storage():
+    """Queue a pass diffing the upload folder against the database"""
+    enqueue('reconcile_storage', dry_run=request.form.get('dry_run') == '1')
+    db.session.commit()
+    flash('Storage reconciliation queued; its report goes to the application log.', 'success')
+    return redirect(url_for('admin.jobs'))
+
+@admin.route('/storage-tiers')
+@login_required
+@admin_required
+def storage_tiers():
+    """Hot/cold tier occupancy and how often downloads find their file hot"""
+    return render_template('admin/storage_tiers.html', report=tier_report())
+
+@admin.route('/jobs/tier-storage', methods=['POST'])
+@login_required
+@admin_required
+def tier_storage():
+    """Queue batches moving blobs nobody has used lately to the cold tier"""
+    enqueue('tier_storage')
+    db.session.commit()
+    flash('Storage tiering queued; cold blobs move in throttled batches.', 'success')
+    return redirect(url_for('admin.storage_tiers'))
+
 # Add other admin routes like user management here
\ No newline at end of file
@@ -0,0 +1,147 @@
+import secrets
+
+from flask import jsonify, request, current_app, flash, redirect, url_for
+from flask_login import login_required, current_user
+from sqlalchemy import bindparam
+
+from app.models import db, File, AccessLog, User
+from app.utils.blob_store import release_blobs
+from app.utils.bloom_filter import share_token_filter
+from app.utils.content_cache import content_cache
+from app.utils.jobs import enqueue
+from app.utils.share_cache import share_cache
+from .routes import main
+
+
+# Bulk file operations
+#
+#   POST /files/bulk/delete     {"file_ids": [...]} or form field file_ids
+#   POST /files/bulk/share
+#   POST /files/bulk/unshare
+#
+# Ownership of all ids is checked with one query; ids that are not the
+# user's are reported as not_found and left alone. The changes are applied
+# with set-based statements in one transaction. JSON requests get a JSON
+# summary, form posts a flash message and a redirect to the file list.
+
+
+def _requested_ids():
+    if request.is_json:
+        file_ids = (request.get_json(silent=True) or {}).get('file_ids') or []
+        return [file_id for file_id in file_ids if isinstance(file_id, int)]
+    return request.form.getlist('file_ids', type=int)
+
+
+def _owned_files(file_ids):
+    """The current user's files among file_ids, as plain rows"""
+    return (db.session.query(File.id, File.share_token, File.is_shared, File.blob_id,
+                             File.encrypted_path, File.file_size)
+            .filter(File.id.in_(file_ids), File.owner_id == current_user.id)
+            .all())
+
+
+def _bulk_delete(rows):
+    file_ids = [row.id for row in rows]
+    legacy_paths = [row.encrypted_path for row in rows if row.blob_id is None]
+    blob_ids = release_blobs([row.blob_id for row in rows])
+    # Counted before their log rows are deleted with the files
+    downloads = User.downloads_of(current_user.id, file_ids)
+
+    db.session.query(AccessLog).filter(AccessLog.file_id.in_(file_ids)).delete(synchronize_session=False)
+    db.session.query(File).filter(File.id.in_(file_ids)).delete(synchronize_session=False)
+    User.adjust_counters(current_user.id, file_count=-len(rows),
+                         storage_bytes=-sum(row.file_size or 0 for row in rows),
+                         active_shares=-sum(1 for row in rows if row.is_shared),
+                         total_downloads=-downloads)
+    # Unlinking and blob collection happen off the request, once this commits
+    enqueue('purge_storage', paths=legacy_paths, blob_ids=sorted(blob_ids))
+    db.session.commit()
+
+    for row in rows:
+        share_cache.invalidate(row.share_token)
+        content_cache.invalidate_file(row.id)
+    return {}
+
+
+def _bulk_share(rows):
+    tokens = {row.id: secrets.token_urlsafe(32) for row in rows if not row.is_shared}
+    if tokens:
+        table = File.__table__
+        statement = table.update().where(table.c.id == bindparam('file_id')).values(
+            share_token=bindparam('token'), is_shared=True
+        )
+        db.session.execute(statement, [{'file_id': file_id, 'token': token}
+                                       for file_id, token in tokens.items()])
+        User.adjust_counters(current_user.id, active_shares=len(tokens))
+    db.session.commit()
+
+    for token in tokens.values():
+        # Drop any negative entry cached for the new token
+        share_cache.invalidate(token)
+        share_token_filter.add(token)
+    links = {row.id: tokens.get(row.id) or row.share_token for row in rows}
+    return {'links': {file_id: url_for('main.download_shared_file', token=token, _external=True)
+                      for file_id, token in links.items()}}
+
+
+def _bulk_unshare(rows):
+    shared = [row for row in rows if row.is_shared]
+    if shared:
+        unshared = db.session.query(File).filter(
+            File.id.in_([row.id for row in shared]), File.is_shared.is_(True)
+        ).update({File.share_token: None, File.is_shared: False}, synchronize_session=False)
+        User.adjust_counters(current_user.id, active_shares=-unshared)
+    db.session.commit()
+
+    for row in shared:
+        share_cache.invalidate(row.share_token)
+        content_cache.invalidate_file(row.id)
+    return {}
+
+
+BULK_ACTIONS = {
+    'delete': (_bulk_delete, '{} file(s) deleted successfully!'),
+    'share': (_bulk_share, 'Sharing enabled for {} file(s).'),
+    'unshare': (_bulk_unshare, 'Sharing disabled for {} file(s).'),
+}
+
+
+@main.route('/files/bulk/<action>', methods=['POST'])
+@login_required
+def bulk_files(action):
+    """Delete, share or unshare many files in one request"""
+    if action not in BULK_ACTIONS:
+        return jsonify({'error': f'Unknown action: {action}'}), 404
+    operation, message = BULK_ACTIONS[action]
+
+    def respond(body, status=200):
+        if request.is_json:
+            return jsonify(body), status
+        if status >= 400:
+            flash(body['error'], 'danger')
+        elif not body['processed']:
+            flash('None of the selected files could be found.', 'warning')
+        else:
+            flash(message.format(body['processed']), 'success')
+        return redirect(url_for('main.files'))
+
+    file_ids = list(dict.fromkeys(_requested_ids()))
+    max_files = current_app.config.get('BULK_MAX_FILES', 1000)
+    if not file_ids:
+        return respond({'error': 'Select at least one file.'}, 400)
+    if len(file_ids) > max_files:
+        return respond({'error': f'At most {max_files} files can be changed at once.'}, 413)
+
+    rows = _owned_files(file_ids)
+    owned = {row.id for row in rows}
+    try:
+        body = operation(rows) if rows else {}
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk {action} failed: {e}')
+        return respond({'error': f'Error during bulk {action}. Please try again.'}, 500)
+
+    current_app.logger.info(f'Bulk {action}: {len(rows)} of {len(file_ids)} files for user {current_user.id}')
+    body.update(action=action, processed=len(rows), file_ids=sorted(owned),
+                not_found=[file_id for file_id in file_ids if file_id not in owned])
+    return respond(body)
@@ -1,14 +1,28 @@
-import os
-from flask import render_template, Blueprint, redirect, url_for, request, flash, send_file, current_app, abort, jsonify
+import hashlib
+from flask import render_template, Blueprint, redirect, url_for, request, flash, current_app, abort, jsonify, Response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from werkzeug.datastructures import ContentRange
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from datetime import datetime, timezone
 
 from app.models import db, File, AccessLog, User
 from app.main.forms import ProfileForm, ChangePasswordForm
+from app.utils.audit_log import access_log_buffer
+from app.utils.counters import download_counter
+from app.utils.share_cache import share_cache, shared_file_from_record
+from app.utils.content_cache import content_cache
+from app.utils.bloom_filter import share_token_filter
+from app.utils.zip_stream import iter_zip, unique_member_name
+from app.utils.blob_store import store_blob, stage_blobs, adopt_staged_blob, release_blobs
+from app.utils.jobs import enqueue
+from app.utils.storage import iter_decrypted_file, iter_decrypted_range, storage
+from app.utils.storage_layout import tier_of
+from app.utils.tiering import note_download
 from app.utils.file_utils import (
-    allowed_file, generate_unique_filename, get_file_path, 
-    ensure_upload_directory, encrypt_file, decrypt_file, 
+    allowed_file, generate_unique_filename,
+    ensure_upload_directory,
     get_mime_type, delete_file, is_audio_file, is_image_file,
     is_document_file, get_file_category, get_file_icon_class
 )
@@ -34,28 +48,28 @@ def dashboard():
     
     # Get user's recent files
     recent_files = current_user.files.order_by(File.upload_time.desc()).limit(5).all()
-    total_files = current_user.files.count()
     
-    # Calculate total downloads from access logs
-    total_downloads = db.session.query(AccessLog).filter_by(
-        user_id=current_user.id, action='download'
-    ).count()
+    # Totals come from the user's denormalized counters
+    total_files = current_user.file_count
+    total_downloads = current_user.total_downloads
+    active_shares = current_user.active_shares
+    total_size_mb = current_user.storage_used_mb
     
-    # Calculate active shares (files that have been shared)
-    active_shares = db.session.query(AccessLog).filter_by(
-        user_id=current_user.id, action='share'
-    ).distinct(AccessLog.file_id).count()
-    
-    # Calculate total storage used
-    total_size = sum(file.file_size or 0 for file in current_user.files)
-    total_size_mb = total_size / (1024 * 1024)
+    # Per-category counts in one grouped query
+    category = File.category.label('category')
+    category_counts = {'audio': 0, 'image': 0, 'document': 0, 'other': 0}
+    category_counts.update(
+        db.session.query(category, func.count(File.id))
+        .filter(File.owner_id == current_user.id).group_by(category).all()
+    )
     
     # Storage limit (in MB) - this could be configurable per user
     storage_limit_mb = 100  # Default 100MB limit
     
-    # Create recent activity data
+    # Create recent activity data (files eager-loaded in the same query)
     recent_activity = []
-    recent_logs = AccessLog.query.filter_by(user_id=current_user.id)\
+    recent_logs = AccessLog.query.options(joinedload(AccessLog.file))\
+        .filter_by(user_id=current_user.id)\
         .order_by(AccessLog.timestamp.desc()).limit(5).all()
     
     for log in recent_logs:
@@ -69,23 +83,6 @@ def dashboard():
             activity['description'] = f'You {log.action}ed "{log.file.original_filename}"'
         recent_activity.append(activity)
     
-    # Calculate file type statistics
-    audio_files = 0
-    image_files = 0
-    document_files = 0
-    other_files = 0
-    
-    for file in current_user.files:
-        category = get_file_category(file.original_filename)
-        if category == 'audio':
-            audio_files += 1
-        elif category == 'image':
-            image_files += 1
-        elif category == 'document':
-            document_files += 1
-        else:
-            other_files += 1
-    
     return render_template('main/dashboard.html', 
                          user=current_user, 
                          recent_files=recent_files,
@@ -95,10 +92,10 @@ def dashboard():
                          total_size_mb=total_size_mb,
                          storage_limit_mb=storage_limit_mb,
                          recent_activity=recent_activity,
-                         audio_files=audio_files,
-                         image_files=image_files,
-                         document_files=document_files,
-                         other_files=other_files,
+                         audio_files=category_counts['audio'],
+                         image_files=category_counts['image'],
+                         document_files=category_counts['document'],
+                         other_files=category_counts['other'],
                          get_file_icon_class=get_file_icon_class,
                          get_file_category=get_file_category)
 
@@ -126,6 +123,18 @@ def upload_file():
             flash('No file selected.', 'danger')
             return redirect(request.url)
         
+        # Several files from one form post are stored as a batch
+        uploads = request.files.getlist('file')
+        if len(uploads) > 1:
+            results = store_uploads(uploads[:current_app.config.get('UPLOAD_BATCH_MAX_FILES', 100)])
+            uploaded = sum(1 for result in results if result['ok'])
+            if uploaded:
+                flash(f'{uploaded} file(s) uploaded successfully!', 'success')
+            for result in results:
+                if not result['ok']:
+                    flash(f'Could not upload "{result["filename"]}": {result["error"]}', 'danger')
+            return redirect(url_for('main.files') if uploaded else request.url)
+        
         file = request.files['file']
         print(f"File received: {file.filename}")  # Debug
         
@@ -143,46 +152,19 @@ def upload_file():
                 ensure_upload_directory(current_app.config['UPLOAD_FOLDER'])
                 print("Upload directory ensured")  # Debug
                 
-                # Generate unique filename
-                unique_filename = generate_unique_filename(file.filename)
-                file_path = get_file_path(current_app.config['UPLOAD_FOLDER'], unique_filename)
-                print(f"File path: {file_path}")  # Debug
-                
-                # Read and encrypt file data
-                file_data = file.read()
-                print(f"File data read: {len(file_data)} bytes")  # Debug
-                encrypted_data = encrypt_file(file_data)
-                print("File encrypted")  # Debug
-                
-                # Save encrypted file
-                with open(file_path, 'wb') as f:
-                    f.write(encrypted_data)
-                print("Encrypted file saved")  # Debug
-                
-                # Create file record in database
-                new_file = File(
-                    filename=unique_filename,
-                    original_filename=secure_filename(file.filename),
-                    encrypted_path=file_path,
-                    file_size=len(file_data),
-                    mime_type=get_mime_type(file.filename),
-                    owner_id=current_user.id
+                # Stream the upload through the encrypter chunk by chunk;
+                # identical content is stored once and shared
+                blob, file_size = store_blob(
+                    file.stream, current_app.config['UPLOAD_FOLDER'],
+                    chunk_size=current_app.config['ENCRYPTION_CHUNK_SIZE'],
+                    filename=file.filename
                 )
-                print("File object created")  # Debug
+                current_app.logger.debug(f'Encrypted blob stored: {blob.path} ({file_size} bytes, '
+                                         f'{blob.codec}, {blob.refcount} refs)')
                 
-                db.session.add(new_file)
-                db.session.flush()  # This assigns the ID without committing
+                new_file = record_upload(blob, file_size, file.filename)
                 print(f"File added to session with ID: {new_file.id}")  # Debug
                 
-                # Log the upload action
-                log_entry = AccessLog(
-                    action='upload',
-                    user_id=current_user.id,
-                    file_id=new_file.id
-                )
-                db.session.add(log_entry)
-                print("Access log created")  # Debug
-                
                 db.session.commit()
                 print("Database committed")  # Debug
                 
@@ -203,6 +185,196 @@ def upload_file():
     
     return render_template('main/upload.html')
 
+def record_uploads(uploads):
+    """Create the File rows for (blob, file_size, filename) uploads, with log entries and counters.
+
+    All rows are inserted with one flush. Joins the caller's transaction;
+    the caller commits. Returns the new File rows in order.
+    """
+    new_files = [
+        File(
+            filename=generate_unique_filename(filename),
+            original_filename=secure_filename(filename),
+            encrypted_path=blob.path,
+            file_size=file_size,
+            mime_type=get_mime_type(filename),
+            owner_id=current_user.id,
+            blob_id=blob.id,
+            storage_tier=tier_of(blob.path)
+        )
+        for blob, file_size, filename in uploads
+    ]
+    db.session.add_all(new_files)
+    db.session.flush()  # This assigns the IDs without committing
+    
+    # Log the upload actions
+    for new_file in new_files:
+        access_log_buffer.record('upload', current_user.id, new_file.id)
+    User.adjust_counters(current_user.id, file_count=len(new_files),
+                         storage_bytes=sum(new_file.file_size for new_file in new_files))
+    return new_files
+
+
+def record_upload(blob, file_size, filename):
+    """Create the File row for an upload stored as blob; see record_uploads()"""
+    return record_uploads([(blob, file_size, filename)])[0]
+
+
+def store_uploads(uploads):
+    """Validate, encrypt and record several uploaded files in one transaction.
+
+    Files are encrypted concurrently on UPLOAD_BATCH_WORKERS threads, then
+    their blobs, File rows, log entries and counters are written with a
+    single commit. A file that fails validation or encryption is reported
+    and skipped without affecting the rest. Returns one result dict per
+    upload, in order.
+    """
+    config = current_app.config
+    upload_folder = config['UPLOAD_FOLDER']
+    results = [{'filename': upload.filename, 'ok': False} for upload in uploads]
+    accepted = []
+    for result, upload in zip(results, uploads):
+        if not upload.filename:
+            result['error'] = 'No file selected.'
+        elif not allowed_file(upload.filename, config['ALLOWED_EXTENSIONS']):
+            result['error'] = 'File type not allowed.'
+        else:
+            accepted.append((result, upload))
+    if not accepted:
+        return results
+
+    ensure_upload_directory(upload_folder)
+    staged = stage_blobs([(upload.stream, upload.filename) for _, upload in accepted], upload_folder,
+                         chunk_size=config['ENCRYPTION_CHUNK_SIZE'],
+                         workers=config.get('UPLOAD_BATCH_WORKERS', 1))
+
+    stored = []
+    try:
+        for (result, upload), item in zip(accepted, staged):
+            if isinstance(item, Exception):
+                current_app.logger.error(f'Encrypting {upload.filename} failed: {item}')
+                result['error'] = 'Could not encrypt the file.'
+                continue
+            blob = adopt_staged_blob(item.path, item.digest, item.size, item.codec)
+            stored.append((result, (blob, item.size, upload.filename)))
+        new_files = record_uploads([entry for _, entry in stored])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Batch upload failed: {e}')
+        for result, _ in accepted:
+            result.setdefault('error', 'Could not save the file.')
+        return results
+    finally:
+        # Staging files not adopted (failed or skipped) are dropped
+        for item in staged:
+            if not isinstance(item, Exception):
+                delete_file(item.path)
+
+    for (result, _), new_file in zip(stored, new_files):
+        result.update(ok=True, file_id=new_file.id, size=new_file.file_size)
+    return results
+
+
+@main.route('/upload/batch', methods=['POST'])
+@login_required
+def upload_batch():
+    """Upload many files in one request; reports success or failure per file as JSON"""
+    uploads = request.files.getlist('files') or request.files.getlist('file')
+    if not uploads:
+        return jsonify({'error': 'No files selected.'}), 400
+    max_files = current_app.config.get('UPLOAD_BATCH_MAX_FILES', 100)
+    if len(uploads) > max_files:
+        return jsonify({'error': f'At most {max_files} files can be uploaded at once.'}), 413
+
+    results = store_uploads(uploads)
+    uploaded = sum(1 for result in results if result['ok'])
+    current_app.logger.info(f'Batch upload: {uploaded} of {len(results)} files stored')
+    return jsonify({
+        'uploaded': uploaded,
+        'failed': len(results) - uploaded,
+        'results': results,
+    }), 200 if uploaded else 400
+
+
+def _file_etag(file_record):
+    """Strong validator for a file's decrypted content"""
+    return hashlib.sha256(f'{file_record.id}:{file_record.filename}:{file_record.file_size}'.encode()).hexdigest()[:32]
+
+
+def _requested_range(file_record, etag):
+    """Return the Range header to honour, or None to send the whole file"""
+    byte_range = request.range
+    if byte_range is None or len(byte_range.ranges) != 1:
+        # Multi-range requests are answered with the full file
+        return None
+    if_range = request.if_range
+    if if_range.etag is not None and if_range.etag != etag:
+        return None
+    if if_range.date is not None:
+        upload_time = file_record.upload_time.replace(tzinfo=timezone.utc, microsecond=0)
+        if if_range.date < upload_time:
+            return None
+    return byte_range
+
+
+def _decrypted_file_response(file_record):
+    """Build a streaming attachment response that decrypts the file as it is sent.
+
+    Honours single Range/If-Range requests with 206 Partial Content, decrypting
+    only the chunks that cover the requested bytes.
+    """
+    size = file_record.file_size
+    read_size = current_app.config['ENCRYPTION_CHUNK_SIZE']
+    etag = _file_etag(file_record)
+
+    byte_range = _requested_range(file_record, etag)
+    span = byte_range.range_for_length(size) if byte_range is not None else None
+    if byte_range is not None and span is None:
+        response = Response(status=416)
+        response.content_range = ContentRange('bytes', None, None, size)
+        return response
+
+    # Hot files are served from the decrypted content cache when it is enabled
+    location = file_record.encrypted_path
+    if span is None:
+        chunks = content_cache.iter_file(file_record.id, location, size,
+                                         lambda: iter_decrypted_file(location, read_size=read_size), read_size)
+    else:
+        chunks = content_cache.iter_range(file_record.id, location, span[0], span[1],
+                                          lambda: iter_decrypted_range(location, span[0], span[1],
+                                                                       read_size=read_size), read_size)
+    # Decrypt the first chunk eagerly so a missing or corrupt file is reported
+    # before any response headers go out
+    first_chunk = next(chunks, b'')
+
+    def generate():
+        yield first_chunk
+        yield from chunks
+
+    response = Response(generate(), mimetype=file_record.mime_type, direct_passthrough=True)
+    if span is None:
+        response.content_length = size
+    else:
+        response.status_code = 206
+        response.content_length = span[1] - span[0]
+        response.content_range = ContentRange('bytes', span[0], span[1], size)
+    response.headers.set('Content-Disposition', 'attachment', filename=file_record.original_filename)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.accept_ranges = 'bytes'
+    response.set_etag(etag)
+    if file_record.upload_time:
+        response.last_modified = file_record.upload_time.replace(tzinfo=timezone.utc)
+    return response
+
+
+def _counts_as_download(response):
+    """Resumed or seeking Range requests should not inflate download statistics"""
+    if response.status_code == 200:
+        return True
+    return response.status_code == 206 and response.content_range.start == 0
+
+
 @main.route('/download/<int:file_id>')
 @login_required
 def download_file(file_id):
@@ -214,51 +386,103 @@ def download_file(file_id):
         abort(403)  # Forbidden
     
     try:
-        # Read encrypted file
-        with open(file_record.encrypted_path, 'rb') as f:
-            encrypted_data = f.read()
-        
-        # Decrypt file data
-        decrypted_data = decrypt_file(encrypted_data)
-        
-        # Create temporary file for download
-        import tempfile
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        temp_file.write(decrypted_data)
-        temp_file.close()
+        # Decrypt straight into the response, chunk by chunk
+        response = _decrypted_file_response(file_record)
+        if not _counts_as_download(response):
+            return response
         
         # Update download count
-        file_record.download_count += 1
+        download_counter.increment(file_record.id)
         
         # Log the download action
-        log_entry = AccessLog(
-            action='download',
-            user_id=current_user.id,
-            file_id=file_record.id
-        )
-        db.session.add(log_entry)
+        access_log_buffer.record('download', current_user.id, file_record.id)
+        note_download(file_record)
+        User.adjust_counters(current_user.id, total_downloads=1)
         db.session.commit()
         
-        return send_file(
-            temp_file.name,
-            as_attachment=True,
-            download_name=file_record.original_filename,
-            mimetype=file_record.mime_type
-        )
+        return response
         
     except Exception as e:
         flash('Error downloading file. Please try again.', 'danger')
         return redirect(url_for('main.files'))
 
 
+@main.route('/download/zip', methods=['POST'])
+@login_required
+def download_zip():
+    """Download several of the user's files as one ZIP archive, built as it is sent"""
+    file_ids = request.form.getlist('file_ids', type=int)
+    max_files = current_app.config.get('DOWNLOAD_ZIP_MAX_FILES', 500)
+    if not file_ids:
+        flash('Select at least one file to download.', 'warning')
+        return redirect(url_for('main.files'))
+    if len(file_ids) > max_files:
+        flash(f'At most {max_files} files can be downloaded at once.', 'warning')
+        return redirect(url_for('main.files'))
+    
+    # Only the user's own files, and only those still stored: once the
+    # archive starts streaming an error can no longer be reported
+    records = [record for record in current_user.files.filter(File.id.in_(file_ids))
+               .order_by(File.upload_time, File.id)
+               if storage.exists(record.encrypted_path)]
+    if not records:
+        flash('None of the selected files could be found.', 'danger')
+        return redirect(url_for('main.files'))
+    
+    try:
+        # Count every member as a download, in one batch
+        download_counter.increment([record.id for record in records])
+        access_log_buffer.record_many('download', current_user.id, [record.id for record in records])
+        for record in records:
+            note_download(record)
+        User.adjust_counters(current_user.id, total_downloads=len(records))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Counting ZIP download failed: {e}')
+        flash('Error downloading files. Please try again.', 'danger')
+        return redirect(url_for('main.files'))
+    
+    # Plain values only: the generator outlives the request's session
+    read_size = current_app.config['ENCRYPTION_CHUNK_SIZE']
+    names = set()
+    members = [(unique_member_name(record.original_filename, names), record.file_size,
+                record.upload_time or datetime.utcnow(), record.encrypted_path)
+               for record in records]
+    current_app.logger.info(f'Streaming ZIP of {len(members)} files for user {current_user.id}')
+    
+    def generate():
+        yield from iter_zip(
+            (name, size, modified, iter_decrypted_file(path, read_size=read_size))
+            for name, size, modified, path in members
+        )
+    
+    response = Response(generate(), mimetype='application/zip', direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename=f'secureshare-{datetime.utcnow():%Y%m%d-%H%M%S}.zip')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _load_shared_file(token):
+    """Share cache loader: the shared file for token, or None"""
+    file_record = File.query.filter_by(share_token=token, is_shared=True).first()
+    return shared_file_from_record(file_record) if file_record else None
+
+
 @main.route('/shared/<token>')
 def download_shared_file(token):
     """Download a file using a share token (no login required)"""
     print(f"🔍 Attempting to download file with token: {token}")
     
     try:
-        file_record = File.query.filter_by(share_token=token, is_shared=True).first()
-        print(f"🔍 Database query result: {file_record}")
+        # Random or mistyped tokens are turned away without a query
+        if not share_token_filter.might_contain(token):
+            current_app.logger.debug('Share token rejected by the share filter')
+            flash('File not found or link is invalid.', 'danger')
+            return redirect(url_for('main.home'))
+        
+        file_record = share_cache.lookup(token, _load_shared_file)
         
         if not file_record:
             print("❌ No file found with this token")
@@ -268,45 +492,32 @@ def download_shared_file(token):
         print(f"📁 Found file: {file_record.original_filename}")
         print(f"🔍 Encrypted file path: {file_record.encrypted_path}")
         
-        # Read the encrypted file content
-        with open(file_record.encrypted_path, 'rb') as encrypted_file:
-            encrypted_data = encrypted_file.read()
-        
-        print(f"📊 Encrypted data size: {len(encrypted_data)} bytes")
-        
-        # Decrypt the file
-        decrypted_content = decrypt_file(encrypted_data)
-        print(f"🔓 File decrypted successfully, size: {len(decrypted_content)} bytes")
-        
-        # Create temporary file for download
-        temp_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'temp_' + file_record.filename)
-        with open(temp_path, 'wb') as temp_file:
-            temp_file.write(decrypted_content)
+        # Decrypt straight into the response, chunk by chunk
+        response = _decrypted_file_response(file_record)
+        current_app.logger.debug(f"Streaming shared file {file_record.id}")
+        counted = _counts_as_download(response)
         
-        print(f"💾 Temporary file created at: {temp_path}")
-        
-        # Update download count
-        file_record.download_count += 1
-        db.session.commit()
+        # Update download count; the guarded UPDATE also catches links
+        # revoked by another process while this one had them cached.
+        # Ranges that do not count still run it, with nothing to add.
+        if not download_counter.increment(file_record.id, amount=1 if counted else 0, share_token=token):
+            share_cache.invalidate(token)
+            response.close()
+            flash('File not found or link is invalid.', 'danger')
+            return redirect(url_for('main.home'))
+        if not counted:
+            db.session.commit()
+            return response
         
-        # Log the download action (anonymous user)
-        log_entry = AccessLog(
-            action='download',
-            user_id=None,  # Anonymous download
-            file_id=file_record.id
-        )
-        db.session.add(log_entry)
+        # Log the download (anonymous user)
+        access_log_buffer.record('download', None, file_record.id)
+        note_download(file_record)
         db.session.commit()
         
         print("📊 Download logged successfully")
         
         # Send the file
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=file_record.original_filename,
-            mimetype=file_record.mime_type
-        )
+        return response
         
     except Exception as e:
         print(f"❌ Error in download_shared_file: {e}")
@@ -326,20 +537,25 @@ def delete_user_file(file_id):
         abort(403)  # Forbidden
     
     try:
-        # Delete physical file
-        delete_file(file_record.encrypted_path)
+        # Drop this file's reference to its blob; the disk work is a job
+        blob_ids = release_blobs([file_record.blob_id])
+        legacy_paths = [file_record.encrypted_path] if file_record.blob_id is None else []
+        enqueue('purge_storage', paths=legacy_paths, blob_ids=sorted(blob_ids))
         
         # Log the delete action
-        log_entry = AccessLog(
-            action='delete',
-            user_id=current_user.id,
-            file_id=file_record.id
-        )
-        db.session.add(log_entry)
+        access_log_buffer.record('delete', current_user.id, file_record.id)
+        
+        User.adjust_counters(current_user.id, file_count=-1,
+                             storage_bytes=-(file_record.file_size or 0),
+                             active_shares=-1 if file_record.is_shared else 0,
+                             total_downloads=-User.downloads_of(current_user.id, [file_record.id]))
         
         # Delete database record
+        share_token = file_record.share_token
         db.session.delete(file_record)
         db.session.commit()
+        share_cache.invalidate(share_token)
+        content_cache.invalidate_file(file_id)
         
         flash('File deleted successfully!', 'success')
         
@@ -360,16 +576,22 @@ def toggle_share_file(file_id):
         abort(403)  # Forbidden
     
     try:
+        revoked_token = None
         if file_record.is_shared:
             # Revoke sharing
-            file_record.revoke_share_token()
+            revoked_token = file_record.revoke_share_token()
+            User.adjust_counters(current_user.id, active_shares=-1)
             flash('File sharing disabled. The link is no longer valid.', 'info')
         else:
             # Generate share token
             file_record.generate_share_token()
+            User.adjust_counters(current_user.id, active_shares=1)
             flash('File sharing enabled! Share link copied to clipboard.', 'success')
         
         db.session.commit()
+        if revoked_token:
+            share_cache.invalidate(revoked_token)
+            content_cache.invalidate_file(file_id)
         
     except Exception as e:
         db.session.rollback()
@@ -430,11 +652,9 @@ def profile():
     
     # Calculate user stats
     stats = {
-        'total_files': current_user.files.count(),
-        'total_downloads': db.session.query(AccessLog).filter_by(
-            user_id=current_user.id, action='download'
-        ).count(),
-        'storage_used_mb': sum(file.file_size or 0 for file in current_user.files) / (1024 * 1024)
+        'total_files': current_user.file_count,
+        'total_downloads': current_user.total_downloads,
+        'storage_used_mb': current_user.storage_used_mb
     }
     
     return render_template('main/profile.html', 
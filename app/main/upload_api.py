@@ -0,0 +1,115 @@
+from flask import jsonify, request, current_app, abort, url_for
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+
+from app.models import db, UploadSession
+from app.utils.file_utils import allowed_file
+from app.utils.resumable_upload import (
+    UploadError, create_session, received_parts, store_part, complete_session, abort_session
+)
+from .routes import main, record_upload
+
+
+# Resumable upload API
+#
+#   POST   /api/uploads                      {"filename", "size"} -> session
+#   GET    /api/uploads/<id>                 session with the parts received so far
+#   PUT    /api/uploads/<id>/parts/<n>       raw bytes of part n (0-based)
+#   POST   /api/uploads/<id>/complete        assemble into a file
+#   DELETE /api/uploads/<id>                 abandon the upload
+#
+# Every part is part_size bytes except the last. Parts may be sent in any
+# order and concurrently; a part that is already stored is acknowledged
+# again without being rewritten.
+
+
+@main.errorhandler(UploadError)
+def upload_error(error):
+    return jsonify({'error': error.message}), error.status
+
+
+def _session_json(upload):
+    return {
+        'id': upload.id,
+        'filename': upload.original_filename,
+        'size': upload.total_size,
+        'part_size': upload.part_size,
+        'part_count': upload.part_count,
+        'received': received_parts(upload),
+        'expires_at': upload.expires_at.isoformat(),
+    }
+
+
+def _own_session(session_id):
+    upload = db.session.get(UploadSession, session_id)
+    if upload is None or upload.owner_id != current_user.id:
+        abort(404)
+    return upload
+
+
+@main.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    """Start a resumable upload"""
+    payload = request.get_json(silent=True) or {}
+    filename = payload.get('filename') or ''
+    size = payload.get('size')
+    if not isinstance(size, int) or not secure_filename(filename):
+        raise UploadError('filename and size are required.')
+    if not allowed_file(filename, current_app.config['ALLOWED_EXTENSIONS']):
+        raise UploadError('File type not allowed.')
+
+    upload = create_session(current_user.id, filename, size)
+    current_app.logger.info(f'Upload session {upload.id} started: {size} bytes in {upload.part_count} parts')
+    return jsonify(_session_json(upload)), 201
+
+
+@main.route('/api/uploads/<session_id>', methods=['GET'])
+@login_required
+def upload_status(session_id):
+    """Which parts of an upload have been received"""
+    return jsonify(_session_json(_own_session(session_id)))
+
+
+@main.route('/api/uploads/<session_id>/parts/<int:part_number>', methods=['PUT'])
+@login_required
+def upload_part(session_id, part_number):
+    """Receive and encrypt one part"""
+    upload = _own_session(session_id)
+    store_part(upload, part_number, request.get_data(cache=False))
+    return jsonify({'part': part_number, 'received': True})
+
+
+@main.route('/api/uploads/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(session_id):
+    """Assemble a fully received upload into a file"""
+    upload = _own_session(session_id)
+    filename = upload.original_filename
+    try:
+        blob, file_size = complete_session(upload)
+        new_file = record_upload(blob, file_size, filename)
+        db.session.commit()
+    except UploadError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Completing upload {session_id} failed: {e}')
+        return jsonify({'error': 'Could not complete the upload.'}), 500
+
+    current_app.logger.info(f'Upload session {session_id} completed as file {new_file.id}')
+    return jsonify({
+        'file_id': new_file.id,
+        'filename': new_file.original_filename,
+        'size': new_file.file_size,
+        'url': url_for('main.view_file', file_id=new_file.id),
+    }), 201
+
+
+@main.route('/api/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def abort_upload(session_id):
+    """Abandon an upload and free its staging space"""
+    abort_session(_own_session(session_id))
+    return '', 204
@@ -6,7 +6,10 @@ db = SQLAlchemy()
 # Import all models to make them available when importing from app.models
 from .user import User
 from .file import File
+from .blob import Blob
+from .upload_session import UploadSession, UploadPart
 from .access_log import AccessLog
 from .contact_message import ContactMessage
+from .job import Job
 
-__all__ = ['db', 'User', 'File', 'AccessLog', 'ContactMessage']
+__all__ = ['db', 'User', 'File', 'Blob', 'UploadSession', 'UploadPart', 'AccessLog', 'ContactMessage', 'Job']
@@ -5,6 +5,16 @@ from . import db
 class AccessLog(db.Model):
     """Access log model for tracking user actions on files"""
     
+    __table_args__ = (
+        # Per-user activity counts and recent-activity feeds
+        db.Index('ix_access_log_user_action', 'user_id', 'action'),
+        db.Index('ix_access_log_user_timestamp', 'user_id', 'timestamp'),
+        # Per-file download history (view_file)
+        db.Index('ix_access_log_file_action_timestamp', 'file_id', 'action', 'timestamp'),
+        # Time-window scans across all users
+        db.Index('ix_access_log_timestamp', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     action = db.Column(db.String(50), nullable=False)  # 'upload', 'download', 'delete'
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,20 @@
+from datetime import datetime
+from . import db
+
+
+class Blob(db.Model):
+    """One stored ciphertext, shared by every File with the same content"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # Keyed hash of the plaintext
+    path = db.Column(db.String(300), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False)  # Plaintext size in bytes
+    stored_size = db.Column(db.BigInteger, nullable=False)  # Bytes on disk
+    codec = db.Column(db.String(16), nullable=False, default='none', server_default='none')  # Compression
+    refcount = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    files = db.relationship('File', backref='blob', lazy='dynamic')
+
+    def __repr__(self):
+        return f"Blob('{self.digest[:12]}', refs={self.refcount})"
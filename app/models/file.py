@@ -1,15 +1,25 @@
 from datetime import datetime
 import secrets
+from sqlalchemy import case, func, or_
+from sqlalchemy.ext.hybrid import hybrid_property
 from . import db
+from app.utils.file_utils import (
+    get_file_category, AUDIO_EXTENSIONS, IMAGE_EXTENSIONS, DOCUMENT_EXTENSIONS
+)
 
 
 class File(db.Model):
     """File model for secure file storage and sharing"""
     
+    __table_args__ = (
+        # A user's files, newest first (dashboard, files, profile)
+        db.Index('ix_file_owner_upload_time', 'owner_id', 'upload_time'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     original_filename = db.Column(db.String(200), nullable=False)
-    encrypted_path = db.Column(db.String(300), nullable=False)
+    encrypted_path = db.Column(db.String(300), nullable=False, index=True)  # Sorted walk in the reconciler
     file_size = db.Column(db.Integer, nullable=False)  # Size in bytes
     mime_type = db.Column(db.String(100), nullable=False)
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)
@@ -17,6 +27,10 @@ class File(db.Model):
     is_shared = db.Column(db.Boolean, default=False)
     share_token = db.Column(db.String(64), unique=True, nullable=True)  # Secure token for sharing
     download_count = db.Column(db.Integer, default=0)
+    # Deduplicated storage; NULL for files uploaded before the blob store
+    blob_id = db.Column(db.Integer, db.ForeignKey('blob.id'), nullable=True, index=True)
+    # Where the stored copy is: 'hot' (the storage roots) or 'cold' (TIER_COLD_ROOT)
+    storage_tier = db.Column(db.String(8), nullable=False, default='hot', server_default='hot')
     
     # Relationship to access logs
     access_logs = db.relationship('AccessLog', backref='file', lazy='dynamic', cascade='all, delete-orphan')
@@ -24,6 +38,32 @@ class File(db.Model):
     def __repr__(self):
         return f"File('{self.original_filename}', Owner ID: {self.owner_id})"
     
+    @hybrid_property
+    def category(self):
+        """File category ('audio', 'image', 'document' or 'other')"""
+        return get_file_category(self.original_filename)
+
+    @category.expression
+    def category(cls):
+        """SQL equivalent of get_file_category() so categories can be grouped in the database"""
+        name = func.lower(cls.original_filename)
+
+        def matches(extensions):
+            return or_(*[name.like(f'%.{ext}') for ext in sorted(extensions)])
+
+        return case(
+            (matches(AUDIO_EXTENSIONS), 'audio'),
+            (matches(IMAGE_EXTENSIONS), 'image'),
+            (matches(DOCUMENT_EXTENSIONS), 'document'),
+            else_='other'
+        )
+
+    @property
+    def downloads(self):
+        """Download count including increments still buffered in this process"""
+        from app.utils.counters import download_counter
+        return (self.download_count or 0) + download_counter.pending(self.id)
+
     @property
     def formatted_size(self):
         """Return human-readable file size"""
@@ -36,11 +76,23 @@ class File(db.Model):
     
     def generate_share_token(self):
         """Generate a secure token for file sharing"""
+        from app.utils.share_cache import share_cache
+        from app.utils.bloom_filter import share_token_filter
         self.share_token = secrets.token_urlsafe(32)
         self.is_shared = True
+        # Drop any negative entry cached for the new token
+        share_cache.invalidate(self.share_token)
+        share_token_filter.add(self.share_token)
         return self.share_token
     
     def revoke_share_token(self):
-        """Revoke the share token and disable sharing"""
+        """Revoke the share token and disable sharing.
+
+        Returns the revoked token. The caller drops it from the share and
+        content caches once this commits: invalidating earlier would let a
+        concurrent lookup cache the still-committed share again.
+        """
+        token = self.share_token
         self.share_token = None
         self.is_shared = False
+        return token
@@ -0,0 +1,31 @@
+from datetime import datetime
+from . import db
+
+
+class Job(db.Model):
+    """A unit of deferred work, run by the background job runner"""
+    
+    __table_args__ = (
+        # The runner's poll: due queued jobs, oldest first
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        # Finding the pending job for a given piece of work
+        db.Index('ix_job_kind_dedupe_key', 'kind', 'dedupe_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    dedupe_key = db.Column(db.String(255), nullable=True)  # What the job works on, see enqueue()
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(64), nullable=True)  # Worker that claimed it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed while it runs
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"Job({self.id}, '{self.kind}', {self.status}, attempts={self.attempts})"
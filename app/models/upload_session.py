@@ -0,0 +1,53 @@
+from datetime import datetime
+from . import db
+
+
+class UploadSession(db.Model):
+    """A resumable upload in progress: parts are encrypted into staging_path as they arrive"""
+    
+    id = db.Column(db.String(32), primary_key=True)  # Random hex, used in the API URLs
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    original_filename = db.Column(db.String(200), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)  # Plaintext bytes declared up front
+    part_size = db.Column(db.Integer, nullable=False)
+    staging_path = db.Column(db.String(300), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    parts = db.relationship('UploadPart', backref='session', lazy='dynamic',
+                            cascade='all, delete-orphan')
+    owner = db.relationship('User', backref=db.backref('upload_sessions', lazy='dynamic',
+                                                       cascade='all, delete-orphan'))
+
+    @property
+    def part_count(self):
+        return max(1, -(-self.total_size // self.part_size))
+
+    def part_length(self, part_number):
+        """Expected size in bytes of a part"""
+        start = part_number * self.part_size
+        return max(0, min(self.part_size, self.total_size - start))
+
+    def __repr__(self):
+        return f"UploadSession('{self.original_filename}', {self.total_size} bytes)"
+
+
+class UploadPart(db.Model):
+    """One received part of a resumable upload"""
+    
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'part_number', name='uq_upload_part_session_number'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_session.id'), nullable=False)
+    part_number = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    # Content digest leaves of the part's plaintext; a retried part must match
+    # them, since its chunks are sealed under the same nonces
+    leaf_digests = db.Column(db.LargeBinary, nullable=False)
+    written = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"UploadPart({self.session_id}, #{self.part_number})"
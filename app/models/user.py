@@ -2,6 +2,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import func, select
 from . import db
 
 
@@ -22,6 +23,13 @@ class User(db.Model, UserMixin):
     timezone = db.Column(db.String(50), nullable=True)
     language = db.Column(db.String(10), nullable=True)
     
+    # Denormalized usage counters, kept in step with File/AccessLog changes by
+    # adjust_counters() and rebuilt in bulk by reconcile_counters()
+    storage_bytes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    file_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_downloads = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    active_shares = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     files = db.relationship('File', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
     access_logs = db.relationship('AccessLog', backref='user', lazy='dynamic', cascade='all, delete-orphan')
@@ -42,5 +50,61 @@ class User(db.Model, UserMixin):
     def verify_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def storage_used_mb(self):
+        return (self.storage_bytes or 0) / (1024 * 1024)
+
+    @classmethod
+    def adjust_counters(cls, user_id, **deltas):
+        """Atomically add deltas to a user's counters as part of the current transaction"""
+        values = {getattr(cls, name): getattr(cls, name) + delta
+                  for name, delta in deltas.items() if delta}
+        if user_id is not None and values:
+            db.session.query(cls).filter(cls.id == user_id).update(values)
+
+    @classmethod
+    def downloads_of(cls, user_id, file_ids):
+        """Downloads of file_ids in user_id's total_downloads, logged or still buffered.
+
+        Their AccessLog rows go with the files, so deleting the files takes
+        this many off total_downloads, as reconcile_counters() would.
+        """
+        from .access_log import AccessLog
+        from app.utils.audit_log import access_log_buffer
+
+        file_ids = list(file_ids)
+        logged = db.session.query(func.count(AccessLog.id)).filter(
+            AccessLog.user_id == user_id, AccessLog.action == 'download', AccessLog.file_id.in_(file_ids)
+        ).scalar()
+        return logged + access_log_buffer.count_pending('download', user_id, file_ids)
+
+    @classmethod
+    def reconcile_counters(cls, user_ids=None):
+        """Recompute the usage counters from the File and AccessLog tables.
+
+        Runs as a single UPDATE with correlated subqueries, for every user or
+        only for user_ids, after writing out buffered access log rows.
+        total_downloads counts downloads of files the user still has.
+        Returns the number of users updated.
+        """
+        from .file import File
+        from .access_log import AccessLog
+        from app.utils.audit_log import access_log_buffer
+
+        access_log_buffer.flush()
+
+        owned = File.owner_id == cls.id
+        values = {
+            cls.file_count: select(func.count(File.id)).where(owned).scalar_subquery(),
+            cls.storage_bytes: select(func.coalesce(func.sum(File.file_size), 0)).where(owned).scalar_subquery(),
+            cls.active_shares: select(func.count(File.id)).where(owned, File.is_shared.is_(True)).scalar_subquery(),
+            cls.total_downloads: select(func.count(AccessLog.id)).where(
+                AccessLog.user_id == cls.id, AccessLog.action == 'download').scalar_subquery(),
+        }
+        query = db.session.query(cls)
+        if user_ids is not None:
+            query = query.filter(cls.id.in_(list(user_ids)))
+        return query.update(values, synchronize_session=False)
+
     def __repr__(self):
         return f"User('{self.username}', '{self.email}', '{self.role}')"
@@ -146,8 +146,12 @@ function initializeDragAndDrop() {
     function handleDrop(e) {
         const dt = e.dataTransfer;
         const files = dt.files;
+        const batchUrl = e.currentTarget.dataset.batchUpload;
         
-        if (files.length > 0) {
+        if (files.length > 1 && batchUrl) {
+            // Multi-file drops are sent straight away, in batches
+            uploadDroppedFiles(files, batchUrl, e.currentTarget.dataset.uploadRedirect);
+        } else if (files.length > 0) {
             const fileInput = document.querySelector('input[type="file"]');
             if (fileInput) {
                 fileInput.files = files;
@@ -157,6 +161,28 @@ function initializeDragAndDrop() {
     }
 }
 
+async function uploadDroppedFiles(files, batchUrl, redirectUrl) {
+    showToast(`Encrypting & uploading ${files.length} files...`, 'info');
+    const results = await uploadFiles(files, { batchUrl });
+    reportUploadResults(results);
+    if (results.some(result => result.ok)) {
+        setTimeout(() => { window.location.href = redirectUrl || window.location.href; }, 1000);
+    }
+}
+
+/**
+ * Show a toast summarising per-file upload results
+ */
+function reportUploadResults(results) {
+    const uploaded = results.filter(result => result.ok).length;
+    if (uploaded) {
+        showToast(`${uploaded} of ${results.length} files uploaded successfully!`, 'success');
+    }
+    results.filter(result => !result.ok).forEach(result => {
+        showToast(`Could not upload "${result.filename}": ${result.error}`, 'danger');
+    });
+}
+
 /**
  * Update file input display with selected files
  */
@@ -478,11 +504,167 @@ document.querySelectorAll('a[href^="#"]').forEach(anchor => {
     });
 });
 
+/**
+ * Upload a file through the resumable upload API.
+ * The file is sent in parts, several at a time; failed parts are retried and
+ * an interrupted upload resumes from the parts the server already has when
+ * called again with the same resumeKey.
+ */
+async function uploadFileResumable(file, options = {}) {
+    const parallel = options.parallel || 3;
+    const retries = options.retries || 3;
+    const onProgress = options.onProgress || function() {};
+    const resumeKey = `secureshare-upload:${file.name}:${file.size}:${file.lastModified}`;
+
+    async function api(method, url, body, headers) {
+        const response = await fetch(url, {
+            method,
+            body,
+            headers,
+            credentials: 'same-origin'
+        });
+        const data = response.status === 204 ? {} : await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(data.error || `Upload failed (${response.status})`);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }
+
+    let session = null;
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        session = await api('GET', `/api/uploads/${savedId}`).catch(() => null);
+    }
+    if (!session) {
+        session = await api('POST', '/api/uploads',
+            JSON.stringify({ filename: file.name, size: file.size }),
+            { 'Content-Type': 'application/json' });
+        localStorage.setItem(resumeKey, session.id);
+    }
+
+    const received = new Set(session.received);
+    const pending = [];
+    for (let part = 0; part < session.part_count; part++) {
+        if (!received.has(part)) pending.push(part);
+    }
+
+    const partBytes = part => Math.min(session.part_size, file.size - part * session.part_size);
+    let sent = Array.from(received).reduce((total, part) => total + partBytes(part), 0);
+    onProgress(sent, file.size);
+
+    async function sendPart(part) {
+        const start = part * session.part_size;
+        const blob = file.slice(start, start + partBytes(part));
+        for (let attempt = 1; ; attempt++) {
+            try {
+                await api('PUT', `/api/uploads/${session.id}/parts/${part}`, blob,
+                    { 'Content-Type': 'application/octet-stream' });
+                sent += blob.size;
+                onProgress(sent, file.size);
+                return;
+            } catch (error) {
+                if (attempt >= retries || (error.status && error.status < 500)) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+            }
+        }
+    }
+
+    async function worker() {
+        while (pending.length) {
+            await sendPart(pending.shift());
+        }
+    }
+
+    await Promise.all(Array.from({ length: Math.min(parallel, pending.length) }, worker));
+    const result = await api('POST', `/api/uploads/${session.id}/complete`);
+    localStorage.removeItem(resumeKey);
+    return result;
+}
+
+/**
+ * Upload several files: small ones are grouped into batches sent to the
+ * batch upload endpoint, which encrypts each batch concurrently and stores
+ * it with one transaction; files too large for a batch use the resumable
+ * upload API. Resolves to one {filename, ok, file_id | error} per file.
+ */
+async function uploadFiles(files, options = {}) {
+    const batchUrl = options.batchUrl || '/upload/batch';
+    const maxFiles = options.maxFiles || 20;
+    const maxBytes = options.maxBytes || 32 * 1024 * 1024;
+    const onProgress = options.onProgress || function() {};
+
+    files = Array.from(files);
+    const totalBytes = files.reduce((total, file) => total + file.size, 0) || 1;
+    let doneBytes = 0;
+    const results = [];
+
+    const batches = [];
+    const large = [];
+    let batch = [];
+    let batchBytes = 0;
+    files.forEach(file => {
+        if (file.size > maxBytes) {
+            large.push(file);
+            return;
+        }
+        if (batch.length && (batch.length >= maxFiles || batchBytes + file.size > maxBytes)) {
+            batches.push(batch);
+            batch = [];
+            batchBytes = 0;
+        }
+        batch.push(file);
+        batchBytes += file.size;
+    });
+    if (batch.length) batches.push(batch);
+
+    for (const group of batches) {
+        const form = new FormData();
+        group.forEach(file => form.append('files', file, file.name));
+        try {
+            const response = await fetch(batchUrl, {
+                method: 'POST',
+                body: form,
+                credentials: 'same-origin'
+            });
+            const data = await response.json().catch(() => ({}));
+            if (data.results) {
+                results.push(...data.results);
+            } else {
+                const error = data.error || `Upload failed (${response.status})`;
+                group.forEach(file => results.push({ filename: file.name, ok: false, error }));
+            }
+        } catch (error) {
+            group.forEach(file => results.push({ filename: file.name, ok: false, error: error.message }));
+        }
+        doneBytes += group.reduce((total, file) => total + file.size, 0);
+        onProgress(doneBytes, totalBytes);
+    }
+
+    for (const file of large) {
+        try {
+            const result = await uploadFileResumable(file, {
+                onProgress: sent => onProgress(doneBytes + sent, totalBytes)
+            });
+            results.push({ filename: file.name, ok: true, file_id: result.file_id, size: result.size });
+        } catch (error) {
+            results.push({ filename: file.name, ok: false, error: error.message });
+        }
+        doneBytes += file.size;
+        onProgress(doneBytes, totalBytes);
+    }
+    return results;
+}
+
 // Expose utility functions globally
 window.SecureShare = {
     showToast,
     showButtonLoading,
     hideButtonLoading,
     copyToClipboard,
-    formatFileSize
+    formatFileSize,
+    uploadFileResumable,
+    uploadFiles,
+    reportUploadResults
 };
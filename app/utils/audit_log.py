@@ -0,0 +1,106 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.utils.write_behind import WriteBehindBuffer
+
+
+class AccessLogBuffer(WriteBehindBuffer):
+    """In-process write-behind buffer for AccessLog rows.
+
+    record() queues a row in memory and returns immediately; queued rows are
+    written with one bulk INSERT when the batch fills up, every
+    ACCESS_LOG_FLUSH_INTERVAL seconds from a background thread, and at
+    interpreter shutdown. flush() writes everything synchronously (tests use
+    it to make pending rows visible). With ACCESS_LOG_BUFFERED off, rows
+    are added to the caller's session and commit with its transaction.
+    """
+
+    thread_name = 'access-log-flusher'
+
+    def __init__(self, app=None):
+        self._pending = []
+        super().__init__(app)
+
+    def init_app(self, app):
+        super().init_app(app)
+        self.enabled = app.config.get('ACCESS_LOG_BUFFERED', True)
+        self.batch_size = app.config.get('ACCESS_LOG_BATCH_SIZE', 100)
+        self.flush_interval = app.config.get('ACCESS_LOG_FLUSH_INTERVAL', 2.0)
+        self.max_pending = self.batch_size * 50
+        app.extensions['access_log_buffer'] = self
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def count_pending(self, action, user_id, file_ids):
+        """Queued entries for action by user_id on any of file_ids"""
+        file_ids = set(file_ids)
+        with self._lock:
+            return sum(1 for row in self._pending if row['action'] == action
+                       and row['user_id'] == user_id and row['file_id'] in file_ids)
+
+    def record(self, action, user_id, file_id):
+        """Queue an access log entry (or add it to the current transaction when unbuffered)"""
+        from app.models import db, AccessLog
+
+        row = {'action': action, 'user_id': user_id, 'file_id': file_id,
+               'timestamp': datetime.utcnow()}
+        if not self.enabled:
+            db.session.add(AccessLog(**row))
+            return
+
+        with self._lock:
+            self._pending.append(row)
+            batch_full = len(self._pending) >= self.batch_size
+
+        self._ensure_worker()
+        if batch_full:
+            self._wake_flusher()
+
+    def record_many(self, action, user_id, file_ids):
+        """Queue one entry per file id (or insert them with one bulk INSERT when unbuffered)"""
+        from app.models import db, AccessLog
+
+        timestamp = datetime.utcnow()
+        rows = [{'action': action, 'user_id': user_id, 'file_id': file_id, 'timestamp': timestamp}
+                for file_id in file_ids]
+        if not rows:
+            return
+        if not self.enabled:
+            db.session.execute(insert(AccessLog), rows)
+            return
+
+        with self._lock:
+            self._pending.extend(rows)
+            batch_full = len(self._pending) >= self.batch_size
+
+        self._ensure_worker()
+        if batch_full:
+            self._wake_flusher()
+
+    def _take_pending(self):
+        rows, self._pending = self._pending, []
+        return rows
+
+    def _restore_pending(self, rows):
+        # Keep the rows for the next attempt, within reason
+        room = max(0, self.max_pending - len(self._pending))
+        self._pending[:0] = rows[:room]
+
+    def _write(self, rows):
+        from app.models import db, File, AccessLog
+
+        # Files deleted since the row was queued would break the foreign key
+        file_ids = {row['file_id'] for row in rows}
+        existing = {file_id for (file_id,) in
+                    db.session.query(File.id).filter(File.id.in_(file_ids))}
+        rows = [row for row in rows if row['file_id'] in existing]
+        if rows:
+            db.session.execute(insert(AccessLog), rows)
+        return len(rows)
+
+
+access_log_buffer = AccessLogBuffer()
@@ -0,0 +1,413 @@
+import hashlib
+import hmac
+import os
+import time
+import uuid
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+
+from app.utils.file_utils import (
+    DEFAULT_CHUNK_SIZE, encrypt_stream_to_path, get_encryption_key, delete_file, select_codec,
+    sharded_path
+)
+from app.utils.jobs import enqueue, register_job
+from app.utils.storage import iter_decrypted_file, storage
+from app.utils.storage_layout import choose_root, storage_roots, tier_of
+
+
+BLOB_DIRECTORY = 'blobs'
+INCOMING_DIRECTORY = 'incoming'
+# Content is digested in blocks of this size; resumable upload parts are a
+# whole number of blocks so their digests combine into the file's
+DIGEST_BLOCK_SIZE = 64 * 1024
+
+
+def _digest_key():
+    # Keyed so the database never holds a plain hash anyone could match
+    # against a known file
+    return hmac.new(get_encryption_key(), b'secureshare blob digest', hashlib.sha256).digest()
+
+
+def leaf_digests(data, key=None):
+    """Concatenated keyed digests of each DIGEST_BLOCK_SIZE block of data"""
+    key = key or _digest_key()
+    view = memoryview(data)
+    return b''.join(hmac.new(key, view[offset:offset + DIGEST_BLOCK_SIZE], hashlib.sha256).digest()
+                    for offset in range(0, len(view), DIGEST_BLOCK_SIZE))
+
+
+def digest_from_leaves(leaves, key=None):
+    """The content digest of a file from the leaf digests of all its blocks, in order"""
+    return hmac.new(key or _digest_key(), leaves, hashlib.sha256).hexdigest()
+
+
+class ContentDigest:
+    """Incremental form of digest_from_leaves(leaf_digests(data))"""
+
+    def __init__(self):
+        self._key = _digest_key()
+        self._root = hmac.new(self._key, digestmod=hashlib.sha256)
+        self._pending = bytearray()
+
+    def update(self, data):
+        self._pending += data
+        full = len(self._pending) - len(self._pending) % DIGEST_BLOCK_SIZE
+        if full:
+            self._root.update(leaf_digests(self._pending[:full], self._key))
+            del self._pending[:full]
+
+    def hexdigest(self):
+        root = self._root.copy()
+        root.update(leaf_digests(self._pending, self._key))
+        return root.hexdigest()
+
+
+class _HashingReader:
+    """Readable wrapper that feeds everything read through the content digest"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = ContentDigest()
+
+        self._peeked = b''
+
+    def peek(self, size):
+        """Read ahead up to size bytes; they are returned again by the next read()"""
+        while len(self._peeked) < size:
+            data = self.stream.read(size - len(self._peeked))
+            if not data:
+                break
+            self._peeked += data
+        return self._peeked
+
+    def read(self, size=-1):
+        if self._peeked:
+            data, self._peeked = self._peeked, b''
+        else:
+            data = self.stream.read(size)
+        self.hash.update(data)
+        return data
+
+
+def blob_root(upload_folder):
+    return os.path.join(upload_folder, BLOB_DIRECTORY)
+
+
+def blob_path(upload_folder, digest):
+    """Where the blob with this digest lives under a root: blobs/ab/cd/<digest>"""
+    return sharded_path(blob_root(upload_folder), digest, digest)
+
+
+def incoming_directory(upload_folder):
+    """Staging area for blobs being written to a root"""
+    return os.path.join(blob_root(upload_folder), INCOMING_DIRECTORY)
+
+
+def _staging_root(staging_path):
+    # <root>/blobs/incoming/<name>: blobs are adopted on the root they were
+    # staged on, so moving them into place is a rename, not a copy
+    return os.path.dirname(os.path.dirname(os.path.dirname(staging_path)))
+
+
+StagedBlob = namedtuple('StagedBlob', 'path digest size codec')
+
+
+def stage_blob(stream, upload_folder, chunk_size=DEFAULT_CHUNK_SIZE, filename=None,
+               codec=None, min_ratio=0.9, cipher=None):
+    """Encrypt stream into a staging file on the storage root upload_folder,
+    hashing its plaintext as it goes.
+
+    With a filename, the upload is compressed with codec first if its type
+    and first chunk suggest it is worth it (see select_codec). Touches
+    neither the database nor the app context, so it can run on worker
+    threads. Returns a StagedBlob for adopt_staged_blob().
+    """
+    incoming = incoming_directory(upload_folder)
+    os.makedirs(incoming, exist_ok=True)
+    staging_path = os.path.join(incoming, uuid.uuid4().hex)
+
+    reader = _HashingReader(stream)
+    if filename:
+        codec = select_codec(filename, reader.peek(chunk_size), codec, min_ratio)
+    else:
+        codec = None
+    size = encrypt_stream_to_path(reader, staging_path, chunk_size=chunk_size, codec=codec,
+                                  cipher=cipher)
+    return StagedBlob(staging_path, reader.hash.hexdigest(), size, codec)
+
+
+def _staging_options():
+    config = current_app.config
+    return {'codec': config.get('COMPRESSION_CODEC'),
+            'min_ratio': config.get('COMPRESSION_MIN_RATIO', 0.9),
+            'cipher': config.get('ENCRYPTION_CIPHER')}
+
+
+def store_blob(stream, upload_folder, chunk_size=DEFAULT_CHUNK_SIZE, filename=None):
+    """Encrypt stream into the blob store and take one reference to the result.
+
+    The upload is staged with the app's compression and cipher settings
+    (see stage_blob). If a blob with the same digest exists, its refcount
+    is bumped and the staging file dropped; otherwise the staging file
+    becomes the new blob. New blobs go to one of the storage roots (the
+    upload folder and UPLOAD_ROOTS, see choose_root). Runs in the caller's
+    transaction, so a rollback also undoes the reference. Returns
+    (blob, plaintext_size).
+    """
+    root = choose_root(uuid.uuid4().hex, storage_roots(upload_folder))
+    staged = stage_blob(stream, root, chunk_size, filename, **_staging_options())
+    blob = adopt_staged_blob(staged.path, staged.digest, staged.size, staged.codec)
+    return blob, staged.size
+
+
+def stage_blobs(uploads, upload_folder, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """Stage several (stream, filename) uploads concurrently.
+
+    Returns one entry per upload, in order: a StagedBlob, or the exception
+    that staging it raised, so one bad file does not fail the others.
+    """
+    options = _staging_options()
+    roots = storage_roots(upload_folder)
+    # Placed here: the worker threads have no app context
+    uploads = [(stream, filename, choose_root(uuid.uuid4().hex, roots)) for stream, filename in uploads]
+
+    def stage(upload):
+        stream, filename, root = upload
+        try:
+            return stage_blob(stream, root, chunk_size, filename, **options)
+        except Exception as e:
+            return e
+
+    if workers <= 1 or len(uploads) <= 1:
+        return [stage(upload) for upload in uploads]
+    with ThreadPoolExecutor(max_workers=min(workers, len(uploads)),
+                            thread_name_prefix='stage') as pool:
+        return list(pool.map(stage, uploads))
+
+
+def adopt_staged_blob(staging_path, digest, size, codec=None):
+    """Take one reference to the blob for digest, using staging_path if it is new.
+
+    If no blob has this digest yet, the staging file is moved into the
+    store: onto its own root, or uploaded to the object store when that is
+    STORAGE_BACKEND. Otherwise it is deleted. Runs in the caller's
+    transaction.
+    """
+    try:
+        blob = _reference_existing(digest)
+        if blob is None:
+            root = storage.blob_root(_staging_root(staging_path))
+            blob, created = _create_blob(digest, blob_path(root, digest),
+                                         size, os.path.getsize(staging_path), codec)
+            if created:
+                storage.move_in(blob.path, staging_path)
+    finally:
+        delete_file(staging_path)
+    return blob
+
+
+def _create_blob(digest, path, size, stored_size, codec):
+    """Insert a blob row with one reference; returns (blob, created)"""
+    from app.models import db, Blob
+
+    blob = Blob(digest=digest, path=path, size=size, stored_size=stored_size,
+                codec=codec or 'none', refcount=1)
+    try:
+        # Savepoint: a concurrent upload of the same content may win the insert
+        with db.session.begin_nested():
+            db.session.add(blob)
+        return blob, True
+    except IntegrityError:
+        blob = _reference_existing(digest)
+        if blob is None:
+            raise
+        return blob, False
+
+
+def _reference_existing(digest):
+    """Take a reference to the blob with this digest, if there is one"""
+    from app.models import db, Blob
+
+    updated = db.session.query(Blob).filter(Blob.digest == digest).update(
+        {Blob.refcount: Blob.refcount + 1}, synchronize_session=False
+    )
+    if not updated:
+        return None
+    return db.session.query(Blob).filter(Blob.digest == digest).one()
+
+
+def release_blobs(blob_ids):
+    """Drop one reference per id (ids may repeat); returns the distinct ids touched.
+
+    Runs in the caller's transaction. Blobs left without references are
+    removed by collect_garbage() once that transaction has committed.
+    """
+    from app.models import db, Blob
+
+    counts = Counter(blob_id for blob_id in blob_ids if blob_id is not None)
+    if not counts:
+        return set()
+    table = Blob.__table__
+    statement = table.update().where(table.c.id == bindparam('blob_id')).values(
+        refcount=table.c.refcount - bindparam('amount')
+    )
+    db.session.execute(statement, [
+        {'blob_id': blob_id, 'amount': amount} for blob_id, amount in counts.items()
+    ])
+    return set(counts)
+
+
+def release_user_storage(user):
+    """Release everything a user stores, ahead of deleting the user row.
+
+    In the caller's transaction: drops the references the user's files hold
+    on blobs and queues a purge_storage job for those blobs, the user's
+    legacy files and the staging files of unfinished resumable uploads.
+    Returns the user's share tokens, to invalidate once the caller commits.
+    """
+    from app.models import File, UploadSession
+
+    files = user.files.with_entities(File.share_token, File.blob_id, File.encrypted_path).all()
+    blob_ids = release_blobs([blob_id for _, blob_id, _ in files])
+    legacy_paths = [encrypted_path for _, blob_id, encrypted_path in files if blob_id is None]
+    staging_paths = [path for (path,) in user.upload_sessions.with_entities(UploadSession.staging_path)]
+    enqueue('purge_storage', paths=legacy_paths + staging_paths, blob_ids=sorted(blob_ids))
+    return [token for token, _, _ in files if token]
+
+
+def collect_garbage(blob_ids=None):
+    """Delete unreferenced blobs (all of them, or only those in blob_ids).
+
+    Each row is deleted and its file unlinked before the commit, so an
+    upload that re-references the blob concurrently either keeps it alive
+    (the conditional delete matches nothing) or waits and stores a fresh
+    copy. Blobs that cannot be removed are logged and left for the next
+    run. Returns (blobs removed, bytes reclaimed).
+    """
+    from app.models import db, Blob
+
+    query = db.session.query(Blob.id, Blob.path, Blob.stored_size).filter(Blob.refcount <= 0)
+    if blob_ids is not None:
+        blob_ids = list(blob_ids)
+        if not blob_ids:
+            return 0, 0
+        query = query.filter(Blob.id.in_(blob_ids))
+
+    removed = reclaimed = 0
+    for blob_id, path, stored_size in query.all():
+        try:
+            deleted = db.session.query(Blob).filter(
+                Blob.id == blob_id, Blob.refcount <= 0
+            ).delete(synchronize_session=False)
+            if deleted:
+                # False if it was already gone; the row can still go
+                storage.delete(path)
+            db.session.commit()
+        except Exception as e:
+            # Leave it for the next collection rather than failing the caller
+            db.session.rollback()
+            current_app.logger.error(f'Could not remove blob {blob_id}: {e}')
+            continue
+        if deleted:
+            removed += 1
+            reclaimed += stored_size or 0
+    return removed, reclaimed
+
+
+def sweep_orphan_files(upload_folder, min_age=3600):
+    """Remove files under the blob store that no Blob row points at.
+
+    These are left behind by uploads whose transaction rolled back after the
+    blob was moved into place, or by crashes mid-upload. Files younger than
+    min_age seconds are skipped so in-flight uploads are not touched, and so
+    are the staging files of resumable uploads that have not expired.
+    Every storage root is swept. Returns (files removed, bytes reclaimed).
+    """
+    from app.models import db, Blob, UploadSession
+
+    cutoff = time.time() - min_age
+    candidates = []
+    for root in storage_roots(upload_folder):
+        for directory, _, names in os.walk(blob_root(root)):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # ctime too: a blob just hard-linked into place keeps its old mtime
+                if max(stat.st_mtime, stat.st_ctime) < cutoff:
+                    candidates.append((path, stat.st_size))
+
+    removed = reclaimed = 0
+    for start in range(0, len(candidates), 500):
+        batch = candidates[start:start + 500]
+        paths = [path for path, _ in batch]
+        known = {path for (path,) in db.session.query(Blob.path).filter(Blob.path.in_(paths))}
+        known.update(path for (path,) in db.session.query(UploadSession.staging_path)
+                     .filter(UploadSession.staging_path.in_(paths)))
+        for path, size in batch:
+            if path not in known and delete_file(path):
+                removed += 1
+                reclaimed += size
+    return removed, reclaimed
+
+
+@register_job('purge_storage')
+def purge_storage(paths=(), blob_ids=()):
+    """Job: remove deleted legacy files and collect blobs whose references were released"""
+    for path in paths:
+        storage.delete(path)
+    collect_garbage(blob_ids)
+
+
+class _ChunkReader:
+    """read() over an iterable of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+@register_job('reencrypt_file', concurrency=1)
+def reencrypt_legacy_file(file_id):
+    """Job: move a file stored before the blob store into it.
+
+    The old file (legacy AES-CBC or per-file chunked) is decrypted as a
+    stream and re-encrypted into a deduplicated blob with the current
+    cipher and compression settings; the old file is removed once the
+    File row points at the blob.
+    """
+    from app.models import db, File
+
+    file_record = db.session.get(File, file_id)
+    if file_record is None or file_record.blob_id is not None:
+        return
+    old_path = file_record.encrypted_path
+    config = current_app.config
+    blob, size = store_blob(_ChunkReader(iter_decrypted_file(old_path, config['ENCRYPTION_CHUNK_SIZE'])),
+                            config['UPLOAD_FOLDER'], chunk_size=config['ENCRYPTION_CHUNK_SIZE'],
+                            filename=file_record.original_filename)
+    if size != file_record.file_size:
+        raise ValueError(f'decrypted {size} bytes, expected {file_record.file_size}')
+    file_record.blob_id = blob.id
+    file_record.encrypted_path = blob.path
+    file_record.storage_tier = tier_of(blob.path)
+    db.session.commit()
+    storage.delete(old_path)
@@ -0,0 +1,161 @@
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized for `capacity` items at a false-positive rate of `error_rate`. Bit
+    positions come from one BLAKE2b digest split into two 64-bit halves
+    (Kirsch-Mitzenmacher double hashing). Items cannot be removed.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class ShareTokenFilter:
+    """Bloom filter of active share tokens, checked before any database lookup.
+
+    A token the filter has never seen cannot be an active share, so
+    /shared/<token> can reject it without a query; a "maybe" still goes
+    through the share cache and the database. The filter is built from the
+    file table by a background thread, never inside a request: first on
+    use (everything passes until it is ready), then every
+    SHARE_FILTER_REFRESH_INTERVAL seconds and when it fills past its
+    capacity. The admin rebuild endpoint rebuilds it in place. Revoked
+    tokens stay in it until the next rebuild, which only costs a lookup.
+
+    generate_share_token() adds new tokens to this process's filter only.
+    With several worker processes, a link created in one worker can be
+    rejected by another until that worker's next refresh, which is why
+    SHARE_FILTER_ENABLED defaults to False.
+    """
+
+    def __init__(self, app=None, error_rate=0.001, refresh_interval=10):
+        self.app = None
+        self.enabled = False
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self._filter = None
+        self._built_at = 0.0
+        self._adds_during_rebuild = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self.rejected = self.passed = self.rebuilds = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SHARE_FILTER_ENABLED', False)
+        self.error_rate = app.config.get('SHARE_FILTER_ERROR_RATE', self.error_rate)
+        self.refresh_interval = app.config.get('SHARE_FILTER_REFRESH_INTERVAL', self.refresh_interval)
+        self._filter = None
+        self.rejected = self.passed = self.rebuilds = 0
+        app.extensions['share_token_filter'] = self
+
+    def rebuild(self):
+        """Reload every active share token from the database; returns the count"""
+        from app.models import db, File
+
+        with self._lock:
+            self._adds_during_rebuild = []
+        tokens = [token for (token,) in db.session.query(File.share_token).filter(
+            File.is_shared.is_(True), File.share_token.isnot(None))]
+        # Leave room to grow so adds between rebuilds keep the error rate
+        bloom = BloomFilter(max(1024, len(tokens) * 2), self.error_rate)
+        for token in tokens:
+            bloom.add(token)
+        with self._lock:
+            # Tokens shared while the query ran may be missing from its result
+            for token in self._adds_during_rebuild:
+                bloom.add(token)
+            self._adds_during_rebuild = None
+            self._filter = bloom
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+        return len(tokens)
+
+    def _needs_rebuild(self):
+        bloom = self._filter
+        if bloom is None or bloom.count > bloom.capacity:
+            return True
+        return self.refresh_interval > 0 and time.monotonic() - self._built_at > self.refresh_interval
+
+    def might_contain(self, token):
+        """False only if token is definitely not an active share token"""
+        if not self.enabled:
+            return True
+        if self._needs_rebuild() and self._rebuild_lock.acquire(blocking=False):
+            # Requests keep using the old filter while it is rebuilt
+            threading.Thread(target=self._rebuild_in_background, args=(self.app,),
+                             name='share-filter-rebuild', daemon=True).start()
+        bloom = self._filter
+        if bloom is None:
+            return True
+        if token in bloom:
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def _rebuild_in_background(self, app):
+        from app.models import db
+
+        try:
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    app.logger.error(f'Share filter rebuild failed: {e}')
+                finally:
+                    db.session.remove()
+        finally:
+            self._rebuild_lock.release()
+
+    def add(self, token):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(token)
+            if self._adds_during_rebuild is not None:
+                self._adds_during_rebuild.append(token)
+
+    def stats(self):
+        bloom = self._filter
+        return {
+            'enabled': self.enabled,
+            'tokens': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else 0,
+            'size_bytes': len(bloom._bits) if bloom else 0,
+            'rejected': self.rejected,
+            'passed': self.passed,
+            'rebuilds': self.rebuilds,
+        }
+
+
+share_token_filter = ShareTokenFilter()
@@ -0,0 +1,146 @@
+import lzma
+import zlib
+
+
+class Codec:
+    """A streaming compression codec usable in front of the encrypter.
+
+    codec_id is stored in the encrypted file header, so it must never be
+    reused for a different algorithm once files have been written with it.
+    """
+
+    codec_id = None
+    name = None
+
+    def compressor(self):
+        """Return an object with compress(data) and flush() methods"""
+        raise NotImplementedError
+
+    def decompressor(self):
+        """Return an object with decompress(data, max_length) like zlib's"""
+        raise NotImplementedError
+
+    def iter_decompress(self, chunks, max_output):
+        """Decompress an iterable of compressed chunks, max_output bytes at a time"""
+        decompressor = self.decompressor()
+        for chunk in chunks:
+            data = decompressor.decompress(chunk, max_output)
+            while data:
+                yield data
+                data = self._more(decompressor, max_output)
+        if not decompressor.eof:
+            raise ValueError(f'{self.name} stream is truncated')
+
+    def _more(self, decompressor, max_output):
+        """Output still held back by the decompressor after a max_length call"""
+        raise NotImplementedError
+
+    def compress_block(self, data):
+        """Compress one self-contained block"""
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress_block(self, data, max_output):
+        """Decompress a block from compress_block(); it may not inflate past max_output bytes"""
+        decompressor = self.decompressor()
+        output = decompressor.decompress(data, max_output)
+        if not decompressor.eof:
+            raise ValueError(f'{self.name} block is truncated or too large')
+        return output
+
+
+class ZlibCodec(Codec):
+    codec_id = 1
+    name = 'zlib'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+    def _more(self, decompressor, max_output):
+        if not decompressor.unconsumed_tail:
+            return b''
+        return decompressor.decompress(decompressor.unconsumed_tail, max_output)
+
+
+class LzmaCodec(Codec):
+    codec_id = 2
+    name = 'lzma'
+
+    def __init__(self, preset=6):
+        self.preset = preset
+
+    def compressor(self):
+        return lzma.LZMACompressor(preset=self.preset)
+
+    def decompressor(self):
+        return lzma.LZMADecompressor()
+
+    def _more(self, decompressor, max_output):
+        if decompressor.eof or decompressor.needs_input:
+            return b''
+        return decompressor.decompress(b'', max_output)
+
+
+# Codec id 0 means "stored uncompressed"
+CODEC_NONE = 0
+_codecs_by_id = {}
+_codecs_by_name = {}
+
+
+def register_codec(codec):
+    """Make a codec available for writing (by name) and reading (by id)"""
+    if not codec.codec_id or not 0 < codec.codec_id <= 0xFFFF:
+        raise ValueError('codec_id must be between 1 and 65535')
+    existing = _codecs_by_id.get(codec.codec_id)
+    if existing is not None and existing.name != codec.name:
+        raise ValueError(f'codec id {codec.codec_id} is already used by {existing.name}')
+    _codecs_by_id[codec.codec_id] = codec
+    _codecs_by_name[codec.name] = codec
+
+
+def get_codec(name_or_id):
+    """Look up a codec by name or header id; None and 0 mean no compression"""
+    if not name_or_id or name_or_id == 'none':
+        return None
+    codecs = _codecs_by_id if isinstance(name_or_id, int) else _codecs_by_name
+    try:
+        return codecs[name_or_id]
+    except KeyError:
+        raise ValueError(f'Unknown compression codec: {name_or_id}') from None
+
+
+register_codec(ZlibCodec())
+register_codec(LzmaCodec())
+
+
+# Formats that are compressed already; deflating them again wastes CPU
+PRECOMPRESSED_MIME_PREFIXES = (
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'audio/mpeg', 'audio/mp4', 'audio/ogg', 'audio/flac', 'audio/aac', 'audio/x-flac',
+    'video/',
+    'application/zip', 'application/gzip', 'application/x-gzip', 'application/x-7z-compressed',
+    'application/x-rar', 'application/vnd.rar',
+    'application/vnd.openxmlformats-officedocument.',
+)
+
+SAMPLE_LEVEL = 1
+
+
+def is_worth_compressing(mime_type, sample, min_ratio=0.9):
+    """Decide from the mime type and a sample of the data whether to compress.
+
+    Known compressed formats are skipped outright; anything else is
+    compressed only if a fast zlib pass over the sample saves more than
+    (1 - min_ratio) of its size.
+    """
+    if mime_type.startswith(PRECOMPRESSED_MIME_PREFIXES):
+        return False
+    if not sample:
+        return False
+    return len(zlib.compress(sample, SAMPLE_LEVEL)) <= len(sample) * min_ratio
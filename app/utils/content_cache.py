@@ -0,0 +1,224 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ('expires_at', 'size', 'data', 'path')
+
+    def __init__(self, expires_at, size, data=None, path=None):
+        self.expires_at = expires_at
+        self.size = size
+        self.data = data    # The plaintext, when kept in memory
+        self.path = path    # Or the file holding it, under CONTENT_CACHE_PATH
+
+
+class DecryptedContentCache:
+    """Bounded LRU cache of decrypted file contents, for files downloaded over and over.
+
+    Opt-in: CONTENT_CACHE_SIZE bytes of plaintext (0 disables it), each
+    entry kept for at most CONTENT_CACHE_TTL seconds; files larger than
+    CONTENT_CACHE_MAX_ENTRY are never cached. Entries are held in memory,
+    or with CONTENT_CACHE_PATH set (meant for a tmpfs: it is plaintext) as
+    files in a private 0700 directory created for this process.
+
+    Entries are keyed by file id and the file's stored location, which
+    names its ciphertext: content that changes is stored somewhere new, so
+    a stale entry is never hit. Deleting or unsharing a file purges its
+    entries in this process; other processes only serve a download after
+    the request has been authorized against the database, and drop their
+    copies by TTL.
+    """
+
+    def __init__(self, app=None, max_bytes=0, max_entry_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.directory = None
+        self._entries = OrderedDict()   # (file id, location) -> _Entry
+        self._keys_by_file = {}          # file id -> its keys, for invalidate_file()
+        self._lock = threading.Lock()
+        self._generation = 0             # bumped by every invalidation
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('CONTENT_CACHE_SIZE', self.max_bytes)
+        self.max_entry_bytes = app.config.get('CONTENT_CACHE_MAX_ENTRY', self.max_entry_bytes)
+        self.ttl = app.config.get('CONTENT_CACHE_TTL', self.ttl)
+        self.clear()
+        self._remove_directory()
+        path = app.config.get('CONTENT_CACHE_PATH')
+        if path and self.max_bytes > 0:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            # mkdtemp creates it 0700, and mkstemp creates entries 0600
+            self.directory = tempfile.mkdtemp(prefix='content-cache-', dir=path)
+            atexit.register(shutil.rmtree, self.directory, True)
+        app.extensions['content_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def iter_file(self, file_id, location, size, load, read_size=64 * 1024):
+        """Yield a file's plaintext, from the cache or from load().
+
+        load() returns an iterator of decrypted chunks; on a miss they are
+        passed through and the file is cached once all size bytes have gone
+        by, so an aborted download caches nothing.
+        """
+        if not self.enabled:
+            return load()
+        entry, generation = self._lookup((file_id, location))
+        if entry is not None:
+            return self._read(entry, 0, entry.size, read_size)
+        if size > self.max_entry_bytes:
+            return load()
+        return self._fill((file_id, location), size, load(), generation)
+
+    def iter_range(self, file_id, location, start, stop, load, read_size=64 * 1024):
+        """Yield plaintext bytes [start, stop) of a file, from the cache or from load().
+
+        A miss is not filled: a range does not hold the whole file.
+        """
+        if not self.enabled:
+            return load()
+        entry, _ = self._lookup((file_id, location))
+        if entry is None:
+            return load()
+        return self._read(entry, start, stop, read_size)
+
+    def invalidate_file(self, file_id):
+        """Drop every cached copy of a file, e.g. when it is deleted or unshared"""
+        with self._lock:
+            self._generation += 1
+            for key in self._keys_by_file.pop(file_id, ()):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                self._remove(key)
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _lookup(self, key):
+        """(entry or None, generation to fill under)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None and entry.path is not None and not os.path.exists(entry.path):
+                self._remove(key)  # Cleared from under us, e.g. a tmpfs wiped by hand
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return entry, self._generation
+
+    def _read(self, entry, start, stop, read_size):
+        if entry.data is not None:
+            for offset in range(start, stop, read_size):
+                yield entry.data[offset:min(offset + read_size, stop)]
+            return
+        # An open file keeps its contents even if the entry is evicted meanwhile
+        with open(entry.path, 'rb') as f:
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = f.read(min(read_size, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+
+    def _fill(self, key, size, chunks, generation):
+        parts, total = [], 0
+        temp = None
+        try:
+            if self.directory is not None:
+                fd, temp = tempfile.mkstemp(dir=self.directory)
+                sink = os.fdopen(fd, 'wb')
+            for chunk in chunks:
+                total += len(chunk)
+                if temp is not None:
+                    sink.write(chunk)
+                else:
+                    parts.append(chunk)
+                yield chunk
+            if temp is not None:
+                sink.close()
+            if total == size:
+                entry = _Entry(0, size, data=None if temp else b''.join(parts), path=temp)
+                if self._put(key, entry, generation):
+                    temp = None
+        finally:
+            if temp is not None:
+                if not sink.closed:
+                    sink.close()
+                os.remove(temp)
+
+    def _put(self, key, entry, generation):
+        """Cache entry; skipped if an invalidation ran since `generation`. Returns whether it was kept."""
+        with self._lock:
+            if generation != self._generation or entry.size > self.max_bytes:
+                return False
+            self._remove(key)
+            entry.expires_at = time.monotonic() + self.ttl
+            self._entries[key] = entry
+            self._keys_by_file.setdefault(key[0], set()).add(key)
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry.size
+        keys = self._keys_by_file.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_file[key[0]]
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_directory(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+content_cache = DecryptedContentCache()
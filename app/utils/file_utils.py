@@ -1,31 +1,78 @@
+import io
+import logging
 import os
 import uuid
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from flask import current_app, has_app_context
 from werkzeug.utils import secure_filename
-from Crypto.Cipher import AES
+from Crypto.Cipher import AES, ChaCha20_Poly1305
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Hash import SHA256
 from Crypto.Random import get_random_bytes
+from app.utils.compression import CODEC_NONE, get_codec, is_worth_compressing
 import secrets
 import base64
 import hashlib
 
+# Child of the Flask app's logger, usable from threads with no app context
+logger = logging.getLogger(__name__)
+
 
 def generate_aes_key_from_password(password, salt):
     """Generate AES key from password using PBKDF2"""
     return PBKDF2(password, salt, dkLen=32, count=100000, hmac_hash_module=SHA256)
 
 
+# Derived key cache: (configured secret, derived key). PBKDF2 is deliberately
+# slow, so the key is derived once per process and re-derived only when
+# Config.ENCRYPTION_KEY changes.
+_key_cache = (None, None)
+_key_lock = threading.Lock()
+
+
+def derive_encryption_key(secret):
+    """Derive the AES key for a configured secret (slow, uncached)"""
+    # Use a fixed salt for consistency (in production, use environment variable)
+    salt = hashlib.sha256(secret.encode()).digest()[:16]
+    return generate_aes_key_from_password(secret.encode(), salt)
+
+
 def get_encryption_key():
-    """Get the encryption key from config"""
+    """Get the encryption key from config, derived once and cached in memory"""
+    global _key_cache
     from config import Config
-    # Use a fixed salt for consistency (in production, use environment variable)
-    salt = hashlib.sha256(Config.ENCRYPTION_KEY.encode()).digest()[:16]
-    return generate_aes_key_from_password(Config.ENCRYPTION_KEY.encode(), salt)
+    secret = Config.ENCRYPTION_KEY
+
+    cached_secret, cached_key = _key_cache
+    if cached_key is not None and cached_secret == secret:
+        return cached_key
+
+    with _key_lock:
+        # Another thread may have derived the key while we waited
+        cached_secret, cached_key = _key_cache
+        if cached_key is None or cached_secret != secret:
+            cached_key = derive_encryption_key(secret)
+            _key_cache = (secret, cached_key)
+        return cached_key
+
+
+def clear_encryption_key_cache():
+    """Forget the cached key so the next call re-derives it"""
+    global _key_cache
+    with _key_lock:
+        _key_cache = (None, None)
 
 
 def encrypt_file_aes(file_data):
-    """Encrypt file data using AES-256-CBC"""
+    """Encrypt file data using AES-256-CBC (legacy format, no integrity check).
+
+    New data is written with encrypt_file(); this is kept only so legacy
+    files can be produced for migration tests.
+    """
     # Generate a random initialization vector (IV)
     iv = get_random_bytes(16)  # 16 bytes for AES
     
@@ -66,15 +113,599 @@ def decrypt_file_aes(encrypted_data):
     return padded_data[:-padding_length]
 
 
+# Chunked encrypted file format
+#
+#   header: magic(4) | version(1) | cipher(1) | codec(2) | chunk_size(4) | nonce_prefix(8)
+#   body:   one record per chunk, each record = ciphertext + 16-byte tag
+#
+# cipher is the id of an AEAD cipher from the registry below.
+# When codec is not 0 the plaintext is compressed with that codec (see
+# app.utils.compression) before it is cut into chunks, and readers
+# decompress the decrypted chunks as they stream.
+#
+# Every chunk holds exactly chunk_size bytes of plaintext except the last one,
+# which may be shorter (or empty for empty files). Each chunk is encrypted on
+# its own with nonce = nonce_prefix + chunk index and the header plus a "final
+# chunk" flag as associated data, so chunks cannot be reordered, truncated or
+# appended without failing authentication. Files that do not start with the
+# magic bytes are legacy single-blob AES-CBC files (IV + padded ciphertext).
+#
+# Compressed files (version 2) compress each chunk on its own before sealing
+# it, so records vary in size: each is prefixed with its length (the top bit
+# flags the final one), and an index of the record sizes follows the last
+# record so a range can seek straight to the chunks that cover it. Version 1
+# files with a codec compressed the whole stream and can only be read from
+# the start.
+FORMAT_MAGIC = b'SSEF'
+FORMAT_VERSION = 1
+FORMAT_VERSION_CHUNK_COMPRESSED = 2
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+HEADER = struct.Struct('>4sBBHI8s')
+RECORD_PREFIX = struct.Struct('>I')
+FINAL_RECORD = 0x80000000
+INDEX_MAGIC = b'SSIX'
+INDEX_TRAILER = struct.Struct('>I4s')  # record count, INDEX_MAGIC
+
+
+class AeadCipher:
+    """An AEAD cipher for the chunked format: 256-bit key, 96-bit nonce, 16-byte tag.
+
+    new(key, nonce) must return a pycryptodome-style cipher object with
+    update(), encrypt_and_digest() and decrypt_and_verify(). cipher_id is
+    stored in file headers and must never be reused for another cipher.
+    """
+
+    def __init__(self, cipher_id, name, new):
+        self.cipher_id = cipher_id
+        self.name = name
+        self.new = new
+
+
+CIPHER_AES_256_GCM = 1
+CIPHER_CHACHA20_POLY1305 = 2
+DEFAULT_CIPHER = 'aes-256-gcm'
+_ciphers_by_id = {}
+_ciphers_by_name = {}
+
+
+def register_cipher(cipher):
+    """Make an AEAD cipher available for writing (by name) and reading (by id)"""
+    if not 0 < cipher.cipher_id <= 0xFF:
+        raise ValueError('cipher_id must be between 1 and 255')
+    existing = _ciphers_by_id.get(cipher.cipher_id)
+    if existing is not None and existing.name != cipher.name:
+        raise ValueError(f'cipher id {cipher.cipher_id} is already used by {existing.name}')
+    _ciphers_by_id[cipher.cipher_id] = cipher
+    _ciphers_by_name[cipher.name] = cipher
+
+
+def get_cipher(name_or_id):
+    """Look up a registered cipher by name or header id"""
+    ciphers = _ciphers_by_id if isinstance(name_or_id, int) else _ciphers_by_name
+    try:
+        return ciphers[name_or_id]
+    except KeyError:
+        raise ValueError(f'Unsupported cipher: {name_or_id}') from None
+
+
+def available_ciphers():
+    """Names of the ciphers new files can be written with"""
+    return sorted(_ciphers_by_name)
+
+
+register_cipher(AeadCipher(CIPHER_AES_256_GCM, 'aes-256-gcm',
+                           lambda key, nonce: AES.new(key, AES.MODE_GCM, nonce=nonce)))
+register_cipher(AeadCipher(CIPHER_CHACHA20_POLY1305, 'chacha20-poly1305',
+                           lambda key, nonce: ChaCha20_Poly1305.new(key=key, nonce=nonce)))
+
+
+# Chunks are independent, so large files are encrypted and decrypted on a
+# shared thread pool (the pycryptodome ciphers release the GIL while they
+# work). Files switch to the pool once PARALLEL_THRESHOLD bytes have gone
+# through, and at most two chunks per worker are in flight at any time.
+PARALLEL_THRESHOLD = 8 * 1024 * 1024
+_crypto_pools = {}
+_crypto_pools_lock = threading.Lock()
+
+
+def _parallel_settings(workers, threshold):
+    """Fill in ENCRYPTION_WORKERS / ENCRYPTION_PARALLEL_THRESHOLD from the app config.
+
+    Outside an app context (scripts, thread pools) the Config defaults apply.
+    """
+    if has_app_context():
+        config = current_app.config
+    else:
+        from config import Config
+        config = vars(Config)
+    if workers is None:
+        workers = config.get('ENCRYPTION_WORKERS', 1)
+    if threshold is None:
+        threshold = config.get('ENCRYPTION_PARALLEL_THRESHOLD', PARALLEL_THRESHOLD)
+    return max(1, workers), threshold
+
+
+def _crypto_pool(workers):
+    with _crypto_pools_lock:
+        pool = _crypto_pools.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crypto')
+            _crypto_pools[workers] = pool
+        return pool
+
+
+def _chunk_nonce(nonce_prefix, index):
+    return nonce_prefix + struct.pack('>I', index)
+
+
+def _chunk_aad(header, final):
+    return header + (b'\x01' if final else b'\x00')
+
+
+def _seal_chunk(cipher, key, header, nonce_prefix, index, final, chunk):
+    """Encrypt one chunk into its record (ciphertext + tag)"""
+    aead = cipher.new(key, _chunk_nonce(nonce_prefix, index))
+    aead.update(_chunk_aad(header, final))
+    ciphertext, tag = aead.encrypt_and_digest(chunk)
+    return ciphertext + tag
+
+
+class EncryptedFileWriter:
+    """File-like object that encrypts everything written to it into the chunked format.
+
+    At most one chunk of plaintext is buffered, so memory use is bounded by
+    the chunk size no matter how much data is written. Call close() (or use
+    it as a context manager) to write the final chunk. cipher names a
+    registered AEAD cipher. With a codec name ('zlib', 'lzma') each chunk is
+    compressed before it is encrypted (format version 2); plaintext_size
+    always counts the uncompressed bytes written. Past parallel_threshold bytes, chunks are
+    encrypted on `workers` threads and written back in order.
+    """
+
+    def __init__(self, fileobj, key=None, chunk_size=DEFAULT_CHUNK_SIZE, codec=None,
+                 cipher=DEFAULT_CIPHER, workers=None, parallel_threshold=None):
+        if chunk_size <= 0:
+            raise ValueError('chunk_size must be positive')
+        self._fileobj = fileobj
+        self._key = key or get_encryption_key()
+        self.chunk_size = chunk_size
+        self.cipher = get_cipher(cipher or DEFAULT_CIPHER)
+        self.codec = get_codec(codec)
+        self._nonce_prefix = get_random_bytes(8)
+        version = FORMAT_VERSION_CHUNK_COMPRESSED if self.codec else FORMAT_VERSION
+        self._header = HEADER.pack(FORMAT_MAGIC, version, self.cipher.cipher_id,
+                                   self.codec.codec_id if self.codec else CODEC_NONE,
+                                   chunk_size, self._nonce_prefix)
+        self.workers, self._parallel_threshold = _parallel_settings(workers, parallel_threshold)
+        self._in_flight = deque()
+        self._buffer = bytearray()
+        self._index = 0
+        self._record_sizes = []
+        self.plaintext_size = 0
+        self.closed = False
+        fileobj.write(self._header)
+
+    def _seal(self, chunk, index, final):
+        if self.codec is None:
+            return _seal_chunk(self.cipher, self._key, self._header, self._nonce_prefix, index, final, chunk)
+        record = _seal_chunk(self.cipher, self._key, self._header, self._nonce_prefix, index, final,
+                             self.codec.compress_block(chunk))
+        return RECORD_PREFIX.pack(len(record) | (FINAL_RECORD if final else 0)) + record
+
+    def _emit(self, record):
+        self._fileobj.write(record)
+        self._record_sizes.append(len(record))
+
+    def _write_chunk(self, chunk, final):
+        if self.workers > 1 and self._index * self.chunk_size >= self._parallel_threshold:
+            self._in_flight.append(_crypto_pool(self.workers).submit(self._seal, chunk, self._index, final))
+            while len(self._in_flight) > 2 * self.workers:
+                self._emit(self._in_flight.popleft().result())
+        else:
+            self._emit(self._seal(chunk, self._index, final))
+        self._index += 1
+
+    def _drain(self):
+        while self._in_flight:
+            self._emit(self._in_flight.popleft().result())
+
+    def _append(self, data):
+        view = memoryview(data).cast('B')
+        while view:
+            room = self.chunk_size - len(self._buffer)
+            if room == 0:
+                # More data follows a full buffer, so it is not the final chunk
+                self._write_chunk(bytes(self._buffer), final=False)
+                self._buffer.clear()
+                continue
+            self._buffer += view[:room]
+            view = view[room:]
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed EncryptedFileWriter')
+        size = memoryview(data).nbytes
+        self._append(data)
+        self.plaintext_size += size
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        self._write_chunk(bytes(self._buffer), final=True)
+        self._drain()
+        if self.codec is not None:
+            self._fileobj.write(struct.pack(f'>{len(self._record_sizes)}I', *self._record_sizes)
+                                + INDEX_TRAILER.pack(len(self._record_sizes), INDEX_MAGIC))
+        self._buffer.clear()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave the output unterminated so it can never authenticate
+            for future in self._in_flight:
+                future.cancel()
+            self._in_flight.clear()
+            self.closed = True
+
+
+class EncryptedFileReader:
+    """Streaming reader for files written by EncryptedFileWriter.
+
+    Past parallel_threshold bytes, iter_chunks() decrypts ahead on `workers`
+    threads and yields the chunks in order.
+    """
+
+    def __init__(self, fileobj, key=None, header=None, workers=None, parallel_threshold=None):
+        self._fileobj = fileobj
+        self._key = key or get_encryption_key()
+        self.workers, self._parallel_threshold = _parallel_settings(workers, parallel_threshold)
+        if header is None:
+            header = fileobj.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError('Encrypted file header is truncated')
+        magic, version, cipher, codec_id, chunk_size, nonce_prefix = HEADER.unpack(header)
+        if magic != FORMAT_MAGIC:
+            raise ValueError('Not a chunked encrypted file')
+        if version not in (FORMAT_VERSION, FORMAT_VERSION_CHUNK_COMPRESSED) or cipher not in _ciphers_by_id:
+            raise ValueError(f'Unsupported encrypted file format (version {version}, cipher {cipher})')
+        self.cipher = _ciphers_by_id[cipher]
+        self.codec = get_codec(codec_id)
+        self.chunk_compressed = version == FORMAT_VERSION_CHUNK_COMPRESSED
+        if self.chunk_compressed and self.codec is None:
+            raise ValueError('Chunk-compressed file without a codec')
+        if chunk_size <= 0:
+            raise ValueError('Invalid chunk size in encrypted file header')
+        self._header = header
+        self._nonce_prefix = nonce_prefix
+        self.chunk_size = chunk_size
+        self.record_size = chunk_size + TAG_SIZE
+
+    def _decrypt_record(self, record, index, final):
+        if len(record) < TAG_SIZE:
+            raise ValueError('Encrypted file is truncated')
+        cipher = self.cipher.new(self._key, _chunk_nonce(self._nonce_prefix, index))
+        cipher.update(_chunk_aad(self._header, final))
+        return cipher.decrypt_and_verify(record[:-TAG_SIZE], record[-TAG_SIZE:])
+
+    def _open_record(self, record, index, final):
+        """Decrypt and decompress one record of a chunk-compressed file"""
+        chunk = self.codec.decompress_block(self._decrypt_record(record, index, final), self.chunk_size)
+        if len(chunk) != self.chunk_size and not final:
+            raise ValueError('Compressed chunk has the wrong size')
+        return chunk
+
+    def iter_chunks(self):
+        """Yield the plaintext in order, decompressing it if the file is compressed"""
+        if self.codec is None or self.chunk_compressed:
+            return self._iter_records()
+        return self.codec.iter_decompress(self._iter_records(), self.chunk_size)
+
+    def _iter_sealed(self):
+        """Yield (record, index, final) in order, reading one record ahead to spot the final one"""
+        if self.chunk_compressed:
+            yield from self._iter_prefixed()
+            return
+        index = 0
+        record = self._fileobj.read(self.record_size)
+        while True:
+            next_record = self._fileobj.read(self.record_size) if len(record) == self.record_size else b''
+            final = not next_record
+            yield record, index, final
+            if final:
+                return
+            record = next_record
+            index += 1
+
+    def _iter_prefixed(self):
+        """(record, index, final) for a chunk-compressed file, up to the record flagged final"""
+        index = 0
+        while True:
+            prefix = self._fileobj.read(RECORD_PREFIX.size)
+            if len(prefix) != RECORD_PREFIX.size:
+                raise ValueError('Encrypted file is truncated')
+            (length,) = RECORD_PREFIX.unpack(prefix)
+            final = bool(length & FINAL_RECORD)
+            yield self._fileobj.read(length & ~FINAL_RECORD), index, final
+            if final:
+                return
+            index += 1
+
+    def _iter_records(self):
+        """Yield decrypted (and, per chunk, decompressed) chunks in order"""
+        open_record = self._open_record if self.chunk_compressed else self._decrypt_record
+        in_flight = deque()
+        try:
+            for record, index, final in self._iter_sealed():
+                if self.workers > 1 and index * self.chunk_size >= self._parallel_threshold:
+                    in_flight.append(_crypto_pool(self.workers).submit(open_record, record, index, final))
+                    if len(in_flight) > 2 * self.workers:
+                        yield in_flight.popleft().result()
+                else:
+                    yield open_record(record, index, final)
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            # The consumer stopped early (client went away) or a chunk failed
+            for future in in_flight:
+                future.cancel()
+
+    def iter_range(self, start, stop):
+        """Yield plaintext bytes [start, stop), decrypting only the chunks that cover them.
+
+        Chunk-compressed files are entered through their record index. Only
+        version 1 files compressed as one stream have everything before start
+        decompressed and discarded.
+        """
+        if stop <= start:
+            return
+        if self.chunk_compressed:
+            yield from self._iter_indexed_range(start, stop)
+            return
+        if self.codec is not None:
+            yield from _slice_stream(self.iter_chunks(), start, stop)
+            return
+        fileobj = self._fileobj
+        body_size = fileobj.seek(0, os.SEEK_END) - HEADER.size
+        chunk_count = max(1, -(-body_size // self.record_size))
+        first = start // self.chunk_size
+        last = min((stop - 1) // self.chunk_size, chunk_count - 1)
+        fileobj.seek(HEADER.size + first * self.record_size)
+        for index in range(first, last + 1):
+            record = fileobj.read(self.record_size)
+            chunk = self._decrypt_record(record, index, final=index == chunk_count - 1)
+            chunk_start = index * self.chunk_size
+            yield chunk[max(0, start - chunk_start):stop - chunk_start]
+
+    def _record_offsets(self):
+        """(offset, size) of every record of a chunk-compressed file, from its index"""
+        fileobj = self._fileobj
+        end = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(end - INDEX_TRAILER.size)
+        count, magic = INDEX_TRAILER.unpack(fileobj.read(INDEX_TRAILER.size))
+        table_size = 4 * count
+        if magic != INDEX_MAGIC or not count or HEADER.size + table_size + INDEX_TRAILER.size > end:
+            raise ValueError('Compressed file index is missing or damaged')
+        fileobj.seek(end - INDEX_TRAILER.size - table_size)
+        sizes = struct.unpack(f'>{count}I', fileobj.read(table_size))
+        offsets, offset = [], HEADER.size
+        for size in sizes:
+            offsets.append((offset, size))
+            offset += size
+        return offsets
+
+    def _iter_indexed_range(self, start, stop):
+        # A wrong offset or size only yields a record that fails to authenticate
+        records = self._record_offsets()
+        first = start // self.chunk_size
+        last = min((stop - 1) // self.chunk_size, len(records) - 1)
+        for index in range(first, last + 1):
+            offset, size = records[index]
+            self._fileobj.seek(offset)
+            data = self._fileobj.read(size)
+            (length,) = RECORD_PREFIX.unpack(data[:RECORD_PREFIX.size])
+            final = index == len(records) - 1
+            if bool(length & FINAL_RECORD) != final or (length & ~FINAL_RECORD) != size - RECORD_PREFIX.size:
+                raise ValueError('Compressed file index does not match its records')
+            chunk = self._open_record(data[RECORD_PREFIX.size:], index, final)
+            chunk_start = index * self.chunk_size
+            yield chunk[max(0, start - chunk_start):stop - chunk_start]
+
+    def __iter__(self):
+        return self.iter_chunks()
+
+
+def new_file_header(chunk_size=DEFAULT_CHUNK_SIZE, cipher=DEFAULT_CIPHER):
+    """A header with a fresh nonce prefix, for a file built with seal_chunks()"""
+    return HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, get_cipher(cipher or DEFAULT_CIPHER).cipher_id,
+                       CODEC_NONE, chunk_size, get_random_bytes(8))
+
+
+def encrypted_file_size(plaintext_size, chunk_size):
+    """Size of the uncompressed chunked file holding plaintext_size bytes"""
+    chunks = max(1, -(-plaintext_size // chunk_size))
+    return HEADER.size + plaintext_size + chunks * TAG_SIZE
+
+
+def seal_chunks(header, data, first_index, plaintext_size, key=None, workers=None):
+    """Encrypt data as the chunks of a file starting at chunk first_index.
+
+    Lets a file be encrypted piece by piece and out of order, as resumable
+    uploads need: data must start on a chunk boundary and hold whole
+    chunks, except at the end of the file, whose total plaintext_size
+    decides which chunk is flagged final. The records returned belong at
+    offset HEADER.size + first_index * (chunk_size + TAG_SIZE).
+
+    Each (header, chunk index) pair must only ever be sealed with the same
+    plaintext: resealing it with different data reuses a nonce.
+    """
+    reader = EncryptedFileReader(None, key=key, header=header)
+    if reader.codec is not None:
+        raise ValueError('seal_chunks cannot write compressed files')
+    chunk_size = reader.chunk_size
+    last_index = max(1, -(-plaintext_size // chunk_size)) - 1
+    view = memoryview(data)
+    jobs = []
+    for offset in range(0, max(1, len(view)), chunk_size):
+        index = first_index + offset // chunk_size
+        if index > last_index:
+            raise ValueError('data runs past the end of the file')
+        jobs.append((reader.cipher, reader._key, header, reader._nonce_prefix,
+                     index, index == last_index, bytes(view[offset:offset + chunk_size])))
+
+    workers, threshold = _parallel_settings(workers, None)
+    if workers > 1 and len(data) >= threshold:
+        records = _crypto_pool(workers).map(lambda job: _seal_chunk(*job), jobs)
+    else:
+        records = (_seal_chunk(*job) for job in jobs)
+    return b''.join(records)
+
+
+def _slice_stream(chunks, start, stop):
+    """Yield bytes [start, stop) of a stream given as an iterable of chunks"""
+    position = 0
+    for chunk in chunks:
+        end = position + len(chunk)
+        if end > start:
+            yield chunk[max(0, start - position):stop - position]
+        position = end
+        if position >= stop:
+            return
+
+
+def _iter_legacy_cbc(fileobj, prefix, read_size):
+    """Stream-decrypt a legacy AES-CBC blob, holding back the last block for unpadding"""
+    data = prefix + fileobj.read(max(0, 16 - len(prefix)))
+    if len(data) < 16:
+        raise ValueError('Encrypted file is truncated')
+    cipher = AES.new(get_encryption_key(), AES.MODE_CBC, data[:16])
+    pending = data[16:]
+    read_size = max(16, read_size - read_size % 16)
+    while True:
+        block = fileobj.read(read_size)
+        pending += block
+        if not block:
+            break
+        # Decrypt everything except the last block, which carries the padding
+        usable = len(pending) - 16
+        usable -= usable % 16
+        if usable > 0:
+            yield cipher.decrypt(pending[:usable])
+            pending = pending[usable:]
+    if len(pending) != 16:
+        raise ValueError('Encrypted file is truncated')
+    last = cipher.decrypt(pending)
+    padding_length = last[-1]
+    if not 1 <= padding_length <= 16:
+        raise ValueError('Invalid padding in encrypted file')
+    if last[:-padding_length]:
+        yield last[:-padding_length]
+
+
+def _iter_legacy_cbc_range(fileobj, start, stop, read_size):
+    """Decrypt part of a legacy AES-CBC blob by seeking to the covering blocks"""
+    key = get_encryption_key()
+    total = fileobj.seek(0, os.SEEK_END)
+    if total < 32 or total % 16:
+        raise ValueError('Encrypted file is truncated')
+
+    # The last block tells us how much padding to exclude
+    fileobj.seek(total - 32)
+    tail = fileobj.read(32)
+    padding_length = AES.new(key, AES.MODE_CBC, tail[:16]).decrypt(tail[16:])[-1]
+    stop = min(stop, total - 16 - padding_length)
+    if start >= stop:
+        return
+
+    # Plaintext offset p is stored at file offset 16 + p, and CBC decrypts
+    # each block with the preceding 16 bytes of the file as its IV
+    position = start - start % 16
+    fileobj.seek(position)
+    cipher = AES.new(key, AES.MODE_CBC, fileobj.read(16))
+    read_size = max(16, read_size - read_size % 16)
+    while position < stop:
+        wanted = stop - position
+        block = fileobj.read(min(read_size, wanted + (-wanted % 16)))
+        if not block:
+            raise ValueError('Encrypted file is truncated')
+        plaintext = cipher.decrypt(block)
+        yield plaintext[max(0, start - position):stop - position]
+        position += len(block)
+
+
+def decrypt_range(fileobj, start, stop, read_size=DEFAULT_CHUNK_SIZE):
+    """Yield plaintext bytes [start, stop) of a seekable chunked or legacy encrypted file"""
+    prefix = fileobj.read(HEADER.size)
+    if prefix[:len(FORMAT_MAGIC)] == FORMAT_MAGIC:
+        yield from EncryptedFileReader(fileobj, header=prefix).iter_range(start, stop)
+    else:
+        yield from _iter_legacy_cbc_range(fileobj, start, stop, read_size)
+
+
+def decrypt_stream(fileobj, read_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """Yield decrypted plaintext from a chunked or legacy CBC encrypted stream"""
+    prefix = fileobj.read(HEADER.size)
+    if prefix[:len(FORMAT_MAGIC)] == FORMAT_MAGIC:
+        yield from EncryptedFileReader(fileobj, header=prefix, workers=workers).iter_chunks()
+    else:
+        yield from _iter_legacy_cbc(fileobj, prefix, read_size)
+
+
+def encrypt_stream_to_path(stream, file_path, chunk_size=DEFAULT_CHUNK_SIZE, codec=None,
+                           cipher=DEFAULT_CIPHER):
+    """Encrypt a readable stream into file_path, returning the plaintext size.
+
+    Data is written to a temporary sibling file and moved into place only
+    once encryption has finished, so a failed upload never leaves a partial
+    blob behind.
+    """
+    temp_path = file_path + '.part'
+    try:
+        with open(temp_path, 'wb') as output:
+            with EncryptedFileWriter(output, chunk_size=chunk_size, codec=codec,
+                                     cipher=cipher) as writer:
+                while True:
+                    data = stream.read(chunk_size)
+                    if not data:
+                        break
+                    writer.write(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        delete_file(temp_path)
+        raise
+    return writer.plaintext_size
+
+
+def iter_decrypted_file(file_path, read_size=DEFAULT_CHUNK_SIZE):
+    """Yield the decrypted contents of an encrypted file chunk by chunk"""
+    with open(file_path, 'rb') as encrypted_file:
+        yield from decrypt_stream(encrypted_file, read_size)
+
+
+def iter_decrypted_range(file_path, start, stop, read_size=DEFAULT_CHUNK_SIZE):
+    """Yield decrypted bytes [start, stop) of an encrypted file"""
+    with open(file_path, 'rb') as encrypted_file:
+        yield from decrypt_range(encrypted_file, start, stop, read_size)
+
+
 # Wrapper functions to maintain compatibility with existing code
-def encrypt_file(file_data):
-    """Encrypt file data using AES encryption"""
-    return encrypt_file_aes(file_data)
+def encrypt_file(file_data, cipher=DEFAULT_CIPHER, workers=None):
+    """Encrypt file data into the chunked AEAD format (in parallel when large)"""
+    output = io.BytesIO()
+    with EncryptedFileWriter(output, cipher=cipher, workers=workers) as writer:
+        writer.write(file_data)
+    return output.getvalue()
 
 
-def decrypt_file(encrypted_data):
-    """Decrypt file data using AES encryption"""
-    return decrypt_file_aes(encrypted_data)
+def decrypt_file(encrypted_data, workers=None):
+    """Decrypt file data in either the chunked or the legacy CBC format"""
+    return b''.join(decrypt_stream(io.BytesIO(encrypted_data), workers=workers))
 
 
 def allowed_file(filename, allowed_extensions):
@@ -94,9 +725,19 @@ def generate_unique_filename(original_filename):
     return f"{name}_{timestamp}_{unique_id}{ext}"
 
 
+def sharded_path(directory, name, key=None):
+    """directory/ab/cd/name, where abcd are the first hex digits of key.
+
+    Two levels of 256 subdirectories keep every directory small however
+    many files there are. key defaults to a hash of name.
+    """
+    key = key or hashlib.sha256(name.encode()).hexdigest()
+    return os.path.join(directory, key[:2], key[2:4], name)
+
+
 def get_file_path(upload_folder, filename):
     """Get the full file path"""
-    return os.path.join(upload_folder, filename)
+    return sharded_path(upload_folder, filename)
 
 
 def ensure_upload_directory(upload_folder):
@@ -111,14 +752,19 @@ def get_file_size(file_path):
 
 
 def delete_file(file_path):
-    """Safely delete a file"""
+    """Delete a file, returning True if it was removed.
+
+    A file that is already gone is not an error; anything else is logged,
+    since a file left behind here is storage nothing will reclaim.
+    """
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
-    except Exception:
-        pass
-    return False
+        os.remove(file_path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.error(f'Could not delete {file_path}: {e}')
+        return False
 
 
 def get_mime_type(filename):
@@ -128,22 +774,39 @@ def get_mime_type(filename):
     return mime_type or 'application/octet-stream'
 
 
+def select_codec(filename, sample, codec, min_ratio=0.9):
+    """Pick the compression codec for an upload: codec, or None to store it as is.
+
+    Uses the file's mime type to skip formats that are compressed already
+    and a sample of its first bytes to skip data that does not shrink.
+    """
+    if not codec or codec == 'none':
+        return None
+    if not is_worth_compressing(get_mime_type(filename), sample, min_ratio):
+        return None
+    return codec
+
+
+# Extension sets per file category (also used to build the SQL category expression)
+AUDIO_EXTENSIONS = {'mp3', 'wav', 'flac', 'ogg', 'aac', 'm4a', 'wma', 'aiff', 'au'}
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'svg'}
+DOCUMENT_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
+ARCHIVE_EXTENSIONS = {'zip', 'rar', '7z', 'tar', 'gz'}
+
+
 def is_audio_file(filename):
     """Check if the file is an audio file based on extension"""
-    audio_extensions = {'mp3', 'wav', 'flac', 'ogg', 'aac', 'm4a', 'wma', 'aiff', 'au'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in audio_extensions
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in AUDIO_EXTENSIONS
 
 
 def is_image_file(filename):
     """Check if the file is an image file based on extension"""
-    image_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'svg'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in image_extensions
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
 
 
 def is_document_file(filename):
     """Check if the file is a document file based on extension"""
-    document_extensions = {'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in document_extensions
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in DOCUMENT_EXTENSIONS
 
 
 def get_file_category(filename):
@@ -168,7 +831,7 @@ def get_file_icon_class(filename):
         return 'fas fa-image'
     elif category == 'document':
         return 'fas fa-file-alt'
-    elif filename.rsplit('.', 1)[1].lower() in {'zip', 'rar', '7z', 'tar', 'gz'}:
+    elif filename.rsplit('.', 1)[1].lower() in ARCHIVE_EXTENSIONS:
         return 'fas fa-file-archive'
     else:
         return 'fas fa-file'
@@ -0,0 +1,305 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+
+
+JobHandler = namedtuple('JobHandler', 'kind function concurrency every')
+
+_handlers = {}
+
+
+def register_job(kind, concurrency=None, every=None):
+    """Decorator registering function(**payload) as the handler for kind.
+
+    concurrency caps how many jobs of this kind one process runs at once
+    (None: only the worker count limits it). every makes the kind
+    recurring: it names the config key holding the seconds between runs,
+    and the runner keeps one job of the kind queued (none if the value is
+    not positive).
+    """
+    def decorator(function):
+        existing = _handlers.get(kind)
+        if existing is not None and existing.function is not function:
+            raise ValueError(f'job kind {kind} is already handled by {existing.function.__name__}')
+        _handlers[kind] = JobHandler(kind, function, concurrency, every)
+        return function
+    return decorator
+
+
+def enqueue(kind, delay=0, max_attempts=None, dedupe_key=None, **payload):
+    """Add a job to the current transaction; it runs once the caller commits.
+
+    Enqueueing in the same transaction as the change that makes the work
+    necessary means the job exists exactly when that change does.
+    dedupe_key names what the job works on (a file id, a path), so callers
+    can find or cancel pending jobs for it through an index instead of by
+    payload.
+    """
+    from app.models import db, Job
+
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, payload=json.dumps(payload), dedupe_key=dedupe_key,
+              run_after=datetime.utcnow() + timedelta(seconds=delay),
+              max_attempts=max_attempts or job_runner.max_attempts)
+    db.session.add(job)
+    job_runner.wake()
+    return job
+
+
+class JobRunner:
+    """Runs queued Job rows on a pool of worker threads inside this process.
+
+    Jobs live in the database, so they survive restarts and several
+    processes can share the queue: a job is claimed with a conditional
+    UPDATE, and only the process whose update matched runs it. Failed jobs
+    are retried with exponential backoff (JOB_RETRY_BACKOFF seconds,
+    doubled per attempt) up to their max_attempts. While a job runs, a
+    heartbeat thread refreshes its heartbeat_at every JOB_HEARTBEAT_INTERVAL
+    seconds; a running job whose heartbeat is JOB_TIMEOUT seconds old lost
+    its worker, and is requeued as a failed attempt. Recurring kinds get
+    their next job queued when a run finishes, and whenever none is
+    pending at the stale job sweep. With
+    JOB_WORKERS = 0 nothing runs in the background and run_pending() (or
+    scripts/admin/run_jobs.py) drains the queue instead.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 0
+        self.max_attempts = 5
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self._running = Counter()
+        self._active = {}  # job id -> worker id, for the heartbeat
+        self._heartbeat_thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # Workers started for a previous app stop at their next poll
+        self.wake()
+        self.workers = app.config.get('JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 2.0)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.retry_backoff = app.config.get('JOB_RETRY_BACKOFF', 30)
+        self.timeout = app.config.get('JOB_TIMEOUT', 600)
+        self.heartbeat_interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 60)
+        app.extensions['job_runner'] = self
+        # Workers start with the first request, so scripts and migrations
+        # that only build the app do not poll a table that may not exist yet
+        app.before_request(self.start)
+
+    @property
+    def running(self):
+        with self._lock:
+            return dict(+self._running)
+
+    def start(self, workers=None):
+        """Make sure the worker threads are running"""
+        workers = self.workers if workers is None else workers
+        if len([thread for thread in self._threads if thread.is_alive()]) >= workers:
+            return
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < workers:
+                thread = threading.Thread(target=self._run, args=(self.app,),
+                                          name=f'job-worker-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def run_pending(self, max_jobs=None):
+        """Run due jobs in the calling thread until none are left; returns how many ran"""
+        self.requeue_stale()
+        self.schedule_recurring()
+        worker_id = self._worker_id()
+        ran = 0
+        while max_jobs is None or ran < max_jobs:
+            job = self._claim(worker_id)
+            if job is None:
+                break
+            self._execute(job)
+            ran += 1
+        return ran
+
+    def requeue_stale(self):
+        """Requeue jobs whose worker died mid-run; returns how many were requeued.
+
+        The lost run already counted as an attempt when it was claimed, so
+        a job that keeps killing its worker is failed at max_attempts.
+        """
+        from app.models import db, Job
+        from sqlalchemy import func
+
+        now = datetime.utcnow()
+        stale = db.session.query(Job).filter(
+            Job.status == 'running',
+            func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=self.timeout)
+        )
+        lost = {Job.locked_by: None, Job.last_error: 'Worker stopped responding'}
+        stale.filter(Job.attempts >= Job.max_attempts).update(
+            {**lost, Job.status: 'failed', Job.finished_at: now}, synchronize_session=False)
+        requeued = stale.update({**lost, Job.status: 'queued', Job.run_after: now}, synchronize_session=False)
+        db.session.commit()
+        return requeued
+
+    def schedule_recurring(self):
+        """Queue the next run of each recurring kind that has none pending; returns how many were queued"""
+        from app.models import db, Job
+
+        recurring = {kind: self.app.config.get(handler.every) for kind, handler in _handlers.items()
+                     if handler.every is not None}
+        recurring = {kind: interval for kind, interval in recurring.items() if interval and interval > 0}
+        if not recurring:
+            return 0
+        pending = {kind for (kind,) in db.session.query(Job.kind).filter(
+            Job.kind.in_(recurring), Job.status.in_(('queued', 'running'))).distinct()}
+        missing = [kind for kind in recurring if kind not in pending]
+        for kind in missing:
+            enqueue(kind, delay=recurring[kind], dedupe_key=kind)
+        db.session.commit()
+        return len(missing)
+
+    def heartbeat(self):
+        """Refresh heartbeat_at on the jobs this process is running; returns how many"""
+        from app.models import db, Job
+
+        with self._lock:
+            active = dict(self._active)
+        now = datetime.utcnow()
+        for job_id, worker_id in active.items():
+            db.session.query(Job).filter(Job.id == job_id, Job.locked_by == worker_id).update(
+                {Job.heartbeat_at: now}, synchronize_session=False)
+        db.session.commit()
+        return len(active)
+
+    def _beat(self, app):
+        while self.app is app:
+            time.sleep(self.heartbeat_interval)
+            with app.app_context():
+                from app.models import db
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f'Job heartbeat error: {e}')
+                finally:
+                    db.session.remove()
+
+    def _start_heartbeat(self):
+        # Called with self._lock held
+        if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+            self._heartbeat_thread = threading.Thread(target=self._beat, args=(self.app,),
+                                                      name='job-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+
+    def _worker_id(self):
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'[:64]
+
+    def _run(self, app):
+        worker_id = self._worker_id()
+        polls = 0
+        while self.app is app:
+            with app.app_context():
+                from app.models import db
+                try:
+                    if polls % 100 == 0:
+                        self.requeue_stale()
+                        self.schedule_recurring()
+                    polls += 1
+                    job = self._claim(worker_id)
+                    if job is not None:
+                        self._execute(job)
+                        continue
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f'Job worker error: {e}')
+                finally:
+                    db.session.remove()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        with self._lock:
+            self._threads = [thread for thread in self._threads
+                             if thread is not threading.current_thread()]
+
+    def _claim(self, worker_id):
+        """Claim the oldest due job this process has capacity for, or None"""
+        from app.models import db, Job
+
+        now = datetime.utcnow()
+        with self._lock:
+            saturated = [kind for kind, handler in _handlers.items()
+                         if handler.concurrency is not None and self._running[kind] >= handler.concurrency]
+            query = db.session.query(Job.id, Job.kind).filter(Job.status == 'queued', Job.run_after <= now)
+            if saturated:
+                query = query.filter(Job.kind.notin_(saturated))
+            for job_id, kind in query.order_by(Job.run_after, Job.id).limit(10).all():
+                claimed = db.session.query(Job).filter(Job.id == job_id, Job.status == 'queued').update(
+                    {Job.status: 'running', Job.started_at: now, Job.heartbeat_at: now,
+                     Job.locked_by: worker_id, Job.attempts: Job.attempts + 1}, synchronize_session=False
+                )
+                db.session.commit()
+                if claimed:
+                    self._running[kind] += 1
+                    self._active[job_id] = worker_id
+                    if self.heartbeat_interval:
+                        self._start_heartbeat()
+                    return db.session.get(Job, job_id)
+        return None
+
+    def _execute(self, job):
+        from app.models import db, Job
+
+        job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+        worker_id = job.locked_by
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise LookupError(f'No handler registered for job kind {kind}')
+            handler.function(**json.loads(job.payload or '{}'))
+            db.session.commit()
+            values = {Job.status: 'succeeded', Job.finished_at: datetime.utcnow(), Job.last_error: None}
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f'Job {job_id} ({kind}) failed on attempt {attempts}: {e}')
+            values = {Job.last_error: f'{type(e).__name__}: {e}'[:2000], Job.locked_by: None}
+            if attempts < max_attempts:
+                delay = self.retry_backoff * 2 ** (attempts - 1)
+                values.update({Job.status: 'queued',
+                               Job.run_after: datetime.utcnow() + timedelta(seconds=delay)})
+            else:
+                values.update({Job.status: 'failed', Job.finished_at: datetime.utcnow()})
+        finally:
+            with self._lock:
+                self._running[kind] -= 1
+                self._active.pop(job_id, None)
+        # Unless the job was reclaimed from under us, in which case its new run reports
+        db.session.query(Job).filter(Job.id == job_id, Job.locked_by == worker_id).update(
+            values, synchronize_session=False)
+        db.session.commit()
+        if handler is not None and handler.every is not None:
+            self.schedule_recurring()
+
+
+def job_stats():
+    """Job counts per kind and status, for the admin view"""
+    from app.models import db, Job
+    from sqlalchemy import func
+
+    counts = {}
+    for kind, status, count in db.session.query(Job.kind, Job.status, func.count(Job.id)).group_by(
+            Job.kind, Job.status):
+        counts.setdefault(kind, Counter())[status] = count
+    return counts
+
+
+job_runner = JobRunner()
@@ -0,0 +1,212 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import or_
+
+from app.utils.file_utils import delete_file
+from app.utils.jobs import register_job
+from app.utils.storage_layout import storage_roots
+
+
+# Plaintext left by uploads from before streaming encryption, and partial
+# ciphertext from interrupted writes
+TEMP_PREFIXES = ('temp_',)
+TEMP_SUFFIXES = ('.part',)
+MISSING_SAMPLE_SIZE = 20
+
+ReconcileReport = namedtuple('ReconcileReport', [
+    'scanned', 'scanned_bytes', 'orphans', 'temp_files', 'purged', 'reclaimed_bytes',
+    'missing', 'missing_sample',
+])
+
+
+class _Throttle:
+    """Spaces calls to wait() at most rate per second, across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _walk_sorted(directory):
+    """Regular files under directory, in the string order of their full paths.
+
+    A directory sorts as its name plus a separator, which is where its
+    contents fall among its siblings when whole paths are compared.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name + os.sep
+                             if entry.is_dir(follow_symlinks=False) else entry.name)
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_sorted(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+def _iter_stored_paths(column, prefix, batch_size, *criteria):
+    """Values of column under prefix (in rows matching criteria) in ascending order, read in keyset pages"""
+    from app.models import db
+
+    if db.engine.dialect.name == 'postgresql':
+        # Byte order, as Python compares the walked paths
+        column = column.collate('C')
+    # Every path under the prefix sorts between it and the next separator value
+    last, upper = prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    while True:
+        page = [path for (path,) in db.session.query(column).filter(column > last, column < upper, *criteria)
+                .order_by(column).limit(batch_size)]
+        yield from page
+        if len(page) < batch_size:
+            return
+        last = page[-1]
+
+
+def _unique(paths):
+    previous = None
+    for path in paths:
+        if path != previous:
+            yield path
+        previous = path
+
+
+def _check_roots(prefixes):
+    """Refuse to purge if the database stores its local files somewhere else"""
+    from app.models import db, Blob, File
+
+    for column in (File.encrypted_path, Blob.path):
+        local = db.session.query(column).filter(~column.contains('://', autoescape=True))
+        if local.first() is not None and local.filter(
+                or_(*(column.startswith(prefix, autoescape=True) for prefix in prefixes))).first() is None:
+            raise ValueError(f'No stored path is under {", ".join(prefixes)}; '
+                             'are UPLOAD_FOLDER and UPLOAD_ROOTS set correctly?')
+
+
+def reconcile_storage(upload_folder=None, min_age=None, workers=None, max_deletes_per_second=None,
+                      batch_size=None, dry_run=False, now=None):
+    """Diff the upload folder against the database and purge what only the disk has.
+
+    Both sides are read as sorted streams: the folder is walked in path
+    order while File, Blob and UploadSession paths (and previous tier
+    copies awaiting their drop_tier_copy job) are paged in with keyset
+    queries, and the two are merged like a sorted join, so memory stays
+    flat however many files there are. Files only on disk (orphans, and
+    temp_* / *.part leftovers) neither modified nor linked within min_age
+    seconds are unlinked on a thread pool, batch by batch, at most max_deletes_per_second. Paths
+    only in the database are counted and sampled for the report but left
+    alone. Every storage root (the upload folder and UPLOAD_ROOTS) is
+    reconciled in turn. Settings default to the RECONCILE_* config values.
+    """
+    from app.models import Blob, File, Job, UploadSession
+
+    config = current_app.config
+    # Compared as strings with the stored paths, which use the roots as configured
+    roots = storage_roots(upload_folder)
+    min_age = config.get('RECONCILE_MIN_AGE', 3600) if min_age is None else min_age
+    workers = workers or config.get('RECONCILE_WORKERS', 4)
+    if max_deletes_per_second is None:
+        max_deletes_per_second = config.get('RECONCILE_MAX_DELETES_PER_SECOND', 200)
+    batch_size = batch_size or config.get('RECONCILE_BATCH_SIZE', 500)
+
+    _check_roots([root + os.sep for root in roots])
+    cutoff = (now or time.time()) - min_age
+    throttle = _Throttle(max_deletes_per_second)
+
+    def purge(candidate):
+        throttle.wait()
+        path, size = candidate
+        return size if delete_file(path) else None
+
+    counts = dict.fromkeys(['scanned', 'scanned_bytes', 'orphans', 'temp_files', 'purged',
+                            'reclaimed_bytes', 'missing'], 0)
+    missing_sample = []
+
+    def note_missing(path):
+        counts['missing'] += 1
+        if len(missing_sample) < MISSING_SAMPLE_SIZE:
+            missing_sample.append(path)
+
+    def flush(batch):
+        if dry_run:
+            return
+        for size in pool.map(purge, batch):
+            if size is not None:
+                counts['purged'] += 1
+                counts['reclaimed_bytes'] += size
+
+    def reconcile_root(root):
+        prefix = root + os.sep
+        stored = [_iter_stored_paths(column, prefix, batch_size) for column in (
+            File.encrypted_path, Blob.path, UploadSession.staging_path)]
+        # A tier's previous copy stays until its drop_tier_copy job runs
+        stored.append(_iter_stored_paths(Job.dedupe_key, prefix, batch_size, Job.kind == 'drop_tier_copy',
+                                         Job.status.in_(('queued', 'running'))))
+        stored = _unique(heapq.merge(*stored))
+        batch = []
+        current = next(stored, None)
+        for entry in _walk_sorted(root):
+            path = entry.path
+            while current is not None and current < path:
+                note_missing(current)
+                current = next(stored, None)
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            counts['scanned'] += 1
+            counts['scanned_bytes'] += stat.st_size
+            if current == path:
+                current = next(stored, None)
+                continue
+            # A hard link keeps the old mtime but updates ctime: a path that
+            # relayout_storage linked and has not committed yet is fresh too
+            if max(stat.st_mtime, stat.st_ctime) >= cutoff:
+                continue
+            if entry.name.startswith(TEMP_PREFIXES) or entry.name.endswith(TEMP_SUFFIXES):
+                counts['temp_files'] += 1
+            else:
+                counts['orphans'] += 1
+            batch.append((path, stat.st_size))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+        while current is not None:
+            note_missing(current)
+            current = next(stored, None)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reconcile') as pool:
+        for root in roots:
+            reconcile_root(root)
+
+    return ReconcileReport(missing_sample=missing_sample, **counts)
+
+
+@register_job('reconcile_storage', concurrency=1)
+def reconcile_storage_job(dry_run=False):
+    """Job: reconcile the upload folder with the database and log the outcome"""
+    report = reconcile_storage(dry_run=dry_run)
+    current_app.logger.info(
+        f'Storage reconciled: {report.scanned} files scanned, {report.orphans} orphans and '
+        f'{report.temp_files} temp files found, {report.purged} purged '
+        f'({report.reclaimed_bytes} bytes), {report.missing} stored paths missing from disk'
+    )
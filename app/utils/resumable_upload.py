@@ -0,0 +1,174 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.utils.blob_store import (
+    DIGEST_BLOCK_SIZE, adopt_staged_blob, digest_from_leaves, incoming_directory, leaf_digests
+)
+from app.utils.file_utils import (
+    HEADER, TAG_SIZE, delete_file, encrypted_file_size, new_file_header, seal_chunks
+)
+from app.utils.jobs import register_job
+from app.utils.storage_layout import choose_root
+
+
+class UploadError(Exception):
+    """A resumable upload request that cannot be applied; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _part_size(config):
+    """UPLOAD_PART_SIZE rounded down to whole encryption chunks and digest blocks"""
+    unit = config['ENCRYPTION_CHUNK_SIZE']
+    while unit % DIGEST_BLOCK_SIZE:
+        unit += config['ENCRYPTION_CHUNK_SIZE']
+    return max(unit, config['UPLOAD_PART_SIZE'] - config['UPLOAD_PART_SIZE'] % unit)
+
+
+def create_session(owner_id, filename, total_size):
+    """Start a resumable upload: preallocate the encrypted staging file and return the session"""
+    from app.models import db, UploadSession
+
+    config = current_app.config
+    if total_size < 0:
+        raise UploadError('File size must not be negative.')
+    if total_size > config['UPLOAD_MAX_FILE_SIZE']:
+        raise UploadError('File is larger than the upload limit.', 413)
+    open_sessions = db.session.query(UploadSession).filter(
+        UploadSession.owner_id == owner_id, UploadSession.expires_at >= datetime.utcnow()).count()
+    if open_sessions >= config['UPLOAD_MAX_OPEN_SESSIONS']:
+        # Each one holds a preallocated staging file until it expires
+        raise UploadError('Too many unfinished uploads; finish or abort one first.', 429)
+
+    session_id = uuid.uuid4().hex
+    incoming = incoming_directory(choose_root(session_id))
+    os.makedirs(incoming, exist_ok=True)
+    staging_path = os.path.join(incoming, f'session_{session_id}')
+
+    chunk_size = config['ENCRYPTION_CHUNK_SIZE']
+    with open(staging_path, 'wb') as staging:
+        staging.write(new_file_header(chunk_size, config.get('ENCRYPTION_CIPHER')))
+        # Sparse on most filesystems; parts fill it in at their own offsets
+        staging.truncate(encrypted_file_size(total_size, chunk_size))
+
+    upload = UploadSession(
+        id=session_id, owner_id=owner_id, original_filename=filename,
+        total_size=total_size, part_size=_part_size(config), staging_path=staging_path,
+        expires_at=datetime.utcnow() + timedelta(seconds=config['UPLOAD_SESSION_TTL'])
+    )
+    db.session.add(upload)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        delete_file(staging_path)
+        raise
+    return upload
+
+
+def received_parts(upload):
+    """Part numbers already stored for a session, in order"""
+    from app.models import UploadPart
+
+    return [number for (number,) in upload.parts.with_entities(UploadPart.part_number)
+            .filter(UploadPart.written.is_(True)).order_by(UploadPart.part_number)]
+
+
+def store_part(upload, part_number, data):
+    """Encrypt one part into the staging file at its own offset.
+
+    The part's digest leaves are committed before anything is written. A
+    retry of a part must carry the same bytes: its chunks are sealed under
+    the same nonces, so different data is refused with 409 instead.
+    """
+    from app.models import db, UploadPart
+
+    if not 0 <= part_number < upload.part_count:
+        raise UploadError('Part number out of range.', 404)
+    if len(data) != upload.part_length(part_number):
+        raise UploadError(f'Part {part_number} must be {upload.part_length(part_number)} bytes.')
+
+    leaves = leaf_digests(data)
+    part = upload.parts.filter_by(part_number=part_number).first()
+    if part is None:
+        part = UploadPart(session_id=upload.id, part_number=part_number, size=len(data),
+                          leaf_digests=leaves)
+        db.session.add(part)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request registered the same part first
+            db.session.rollback()
+            part = upload.parts.filter_by(part_number=part_number).one()
+    if part.leaf_digests != leaves:
+        raise UploadError(f'Part {part_number} was already received with different content.', 409)
+    if part.written:
+        return part
+
+    config = current_app.config
+    chunk_size = config['ENCRYPTION_CHUNK_SIZE']
+    with open(upload.staging_path, 'r+b') as staging:
+        header = staging.read(HEADER.size)
+        first_chunk = part_number * upload.part_size // chunk_size
+        records = seal_chunks(header, data, first_chunk, upload.total_size)
+        staging.seek(HEADER.size + first_chunk * (chunk_size + TAG_SIZE))
+        staging.write(records)
+
+    part.written = True
+    db.session.commit()
+    return part
+
+
+def complete_session(upload):
+    """Turn a fully received session into a blob reference; returns (blob, size).
+
+    The session row is deleted in the caller's transaction, so the caller
+    commits it together with the File record that takes the reference.
+    """
+    from app.models import db, UploadPart
+
+    parts = upload.parts.filter(UploadPart.written.is_(True)).order_by(UploadPart.part_number).all()
+    missing = sorted(set(range(upload.part_count)) - {part.part_number for part in parts})
+    if missing:
+        raise UploadError(f'Missing parts: {missing[:20]}', 409)
+
+    digest = digest_from_leaves(b''.join(part.leaf_digests for part in parts))
+    blob = adopt_staged_blob(upload.staging_path, digest, upload.total_size)
+    size = upload.total_size
+    db.session.delete(upload)
+    return blob, size
+
+
+def abort_session(upload):
+    """Drop a session and its staging file"""
+    from app.models import db
+
+    staging_path = upload.staging_path
+    db.session.delete(upload)
+    db.session.commit()
+    delete_file(staging_path)
+
+
+def expire_sessions(now=None):
+    """Abort every session past its expiry time; returns how many were removed"""
+    from app.models import db, UploadSession
+
+    expired = db.session.query(UploadSession).filter(
+        UploadSession.expires_at < (now or datetime.utcnow())).all()
+    for upload in expired:
+        abort_session(upload)
+    return len(expired)
+
+
+@register_job('expire_upload_sessions', concurrency=1, every='UPLOAD_SESSION_EXPIRE_INTERVAL')
+def expire_upload_sessions():
+    """Recurring job: discard abandoned uploads and their staging files"""
+    expired = expire_sessions()
+    current_app.logger.info(f'Upload sessions: {expired} expired sessions removed')
@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+# Just the File columns a shared download needs, detached from any session
+SharedFile = namedtuple('SharedFile', [
+    'id', 'filename', 'original_filename', 'encrypted_path',
+    'file_size', 'mime_type', 'upload_time', 'storage_tier'
+], defaults=['hot'])
+
+
+def shared_file_from_record(file_record):
+    return SharedFile(file_record.id, file_record.filename, file_record.original_filename,
+                      file_record.encrypted_path, file_record.file_size,
+                      file_record.mime_type, file_record.upload_time, file_record.storage_tier)
+
+
+class ShareTokenCache:
+    """Bounded LRU cache of share token -> SharedFile, with negative caching.
+
+    Valid tokens are kept for SHARE_CACHE_TTL seconds and unknown tokens for
+    SHARE_CACHE_NEGATIVE_TTL seconds, so both hot links and token guessing
+    stop reaching the database. Entries are dropped explicitly when a share
+    is revoked or its file deleted; across worker processes the TTL bounds
+    how long another process can keep serving a stale entry.
+    """
+
+    def __init__(self, app=None, max_size=10000, ttl=300, negative_ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()   # token -> (expires_at, SharedFile or None)
+        self._tokens_by_file = {}        # file id -> token, for invalidate_file()
+        self._lock = threading.Lock()
+        self._generation = 0             # bumped by every invalidation
+        self.hits = self.negative_hits = self.misses = self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get('SHARE_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('SHARE_CACHE_TTL', self.ttl)
+        self.negative_ttl = app.config.get('SHARE_CACHE_NEGATIVE_TTL', self.negative_ttl)
+        self.clear()
+        app.extensions['share_cache'] = self
+
+    def lookup(self, token, loader):
+        """Return the cached SharedFile (or None) for token, calling loader(token) on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(token)
+                if entry[1] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        shared_file = loader(token)
+        self.put(token, shared_file, generation)
+        return shared_file
+
+    def put(self, token, shared_file, generation=None):
+        """Cache a lookup result; skipped if an invalidation ran since `generation`"""
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if shared_file is not None else self.negative_ttl
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # The loader may have read a row that was changed meanwhile
+                return
+            self._remove(token)
+            self._entries[token] = (time.monotonic() + ttl, shared_file)
+            if shared_file is not None:
+                self._tokens_by_file[shared_file.id] = token
+            while len(self._entries) > self.max_size:
+                oldest, (_, evicted) = self._entries.popitem(last=False)
+                self._forget_file(oldest, evicted)
+                self.evictions += 1
+
+    def invalidate(self, token):
+        if token is None:
+            return
+        with self._lock:
+            self._generation += 1
+            self._remove(token)
+
+    def invalidate_file(self, file_id):
+        with self._lock:
+            self._generation += 1
+            token = self._tokens_by_file.get(file_id)
+            if token is not None:
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tokens_by_file.clear()
+            self.hits = self.negative_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._forget_file(token, entry[1])
+
+    def _forget_file(self, token, shared_file):
+        if shared_file is not None and self._tokens_by_file.get(shared_file.id) == token:
+            del self._tokens_by_file[shared_file.id]
+
+
+share_cache = ShareTokenCache()
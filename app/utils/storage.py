@@ -0,0 +1,429 @@
+import hashlib
+import hmac
+import http.client
+import io
+import os
+import queue
+import shutil
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+from app.utils.file_utils import DEFAULT_CHUNK_SIZE, decrypt_range, decrypt_stream
+
+
+ObjectStat = namedtuple('ObjectStat', 'size modified')  # modified: POSIX timestamp
+
+
+class StorageBackend:
+    """Where encrypted files are kept.
+
+    Files are addressed by the location stored in Blob.path and
+    File.encrypted_path; each backend recognises its own locations.
+    get_stream and get_range raise FileNotFoundError for a missing file,
+    stat returns None for one and delete returns False.
+    """
+
+    def owns(self, location):
+        raise NotImplementedError
+
+    def put_stream(self, location, stream):
+        """Store everything read from stream at location; returns the bytes written"""
+        raise NotImplementedError
+
+    def move_in(self, location, path):
+        """Store the local file at path under location; path is consumed"""
+        with open(path, 'rb') as source:
+            self.put_stream(location, source)
+        os.remove(path)
+
+    def get_stream(self, location):
+        """A readable, seekable binary file object over the stored bytes"""
+        raise NotImplementedError
+
+    def get_range(self, location, start, stop):
+        """Stored bytes [start, stop)"""
+        with self.get_stream(location) as stream:
+            stream.seek(start)
+            return stream.read(max(0, stop - start))
+
+    def delete(self, location):
+        raise NotImplementedError
+
+    def stat(self, location):
+        raise NotImplementedError
+
+
+class LocalBackend(StorageBackend):
+    """Files on local disks; locations are filesystem paths"""
+
+    def owns(self, location):
+        return '://' not in location
+
+    def put_stream(self, location, stream):
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        temp_path = location + '.part'
+        try:
+            with open(temp_path, 'wb') as output:
+                shutil.copyfileobj(stream, output, DEFAULT_CHUNK_SIZE)
+                written = output.tell()
+            os.replace(temp_path, location)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return written
+
+    def move_in(self, location, path):
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        os.replace(path, location)
+
+    def get_stream(self, location):
+        return open(location, 'rb')
+
+    def delete(self, location):
+        try:
+            os.remove(location)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def stat(self, location):
+        try:
+            stat = os.stat(location)
+        except FileNotFoundError:
+            return None
+        return ObjectStat(stat.st_size, stat.st_mtime)
+
+
+class S3Error(OSError):
+    """An S3 request that failed; status is the HTTP status"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _hmac(key, message):
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def sign_v4(method, host, path, query, headers, payload_hash, access_key, secret_key, region, now=None):
+    """Add AWS Signature Version 4 headers for an S3 request to headers.
+
+    headers use lower-case names; query is a dict of already-decoded
+    parameters. Returns the canonical query string to send.
+    """
+    now = now or datetime.utcnow()
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    scope = f'{now:%Y%m%d}/{region}/s3/aws4_request'
+    headers.update({'host': host, 'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+
+    canonical_query = '&'.join(f'{quote(name, safe="-_.~")}={quote(value, safe="-_.~")}'
+                               for name, value in sorted(query.items()))
+    signed_headers = ';'.join(sorted(headers))
+    canonical_headers = ''.join(f'{name}:{str(headers[name]).strip()}\n' for name in sorted(headers))
+    canonical_request = '\n'.join([method, quote(path, safe='/-_.~'), canonical_query,
+                                   canonical_headers, signed_headers, payload_hash])
+    string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                hashlib.sha256(canonical_request.encode()).hexdigest()])
+
+    key = _hmac(f'AWS4{secret_key}'.encode(), f'{now:%Y%m%d}')
+    for part in (region, 's3', 'aws4_request'):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers['authorization'] = (f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, '
+                                f'SignedHeaders={signed_headers}, Signature={signature}')
+    return canonical_query
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP connections to one host, at most size in use at once"""
+
+    def __init__(self, scheme, netloc, size, timeout):
+        self._connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        self._netloc = netloc
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get(self):
+        """(connection, reused) -- the connection must go back through put() or discard()"""
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connection_class(self._netloc, timeout=self._timeout), False
+
+    def put(self, connection):
+        self._idle.put(connection)
+        self._slots.release()
+
+    def discard(self, connection):
+        connection.close()
+        self._slots.release()
+
+
+class _ObjectReader(io.RawIOBase):
+    """Seekable reader over an object, fetching what is read with Range GETs"""
+
+    def __init__(self, backend, key, size):
+        self._backend = backend
+        self._key = key
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer):
+        stop = min(self._position + len(buffer), self._size)
+        if stop <= self._position:
+            return 0
+        data = self._backend._get_range(self._key, self._position, stop)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def _read_part(stream, size):
+    """Read up to size bytes, looping over short reads from network streams"""
+    pieces, remaining = [], size
+    while remaining:
+        piece = stream.read(remaining)
+        if not piece:
+            break
+        pieces.append(piece)
+        remaining -= len(piece)
+    return b''.join(pieces)
+
+
+class S3Backend(StorageBackend):
+    """Objects in an S3-compatible store, addressed as s3://<bucket>/<key>.
+
+    Requests are signed with SigV4 and sent path-style over a pool of
+    keep-alive connections, so any S3-compatible server works. Objects of
+    part_size or more are uploaded as multipart uploads with up to
+    upload_workers parts in flight (and in memory) at once; reads are
+    ranged GETs of read_size bytes, which lets range downloads fetch only
+    the chunks they decrypt.
+    """
+
+    def __init__(self, endpoint, bucket, access_key, secret_key, region='us-east-1', prefix='',
+                 pool_size=16, part_size=8 * 1024 * 1024, upload_workers=4, read_size=1024 * 1024,
+                 timeout=60):
+        parsed = urlsplit(endpoint)
+        self.bucket = bucket
+        self.root = f's3://{bucket}/{prefix.strip("/")}'.rstrip('/')
+        self.part_size = part_size
+        self.upload_workers = upload_workers
+        self.read_size = read_size
+        self._host = parsed.netloc
+        self._base_path = parsed.path.rstrip('/')
+        self._credentials = (access_key, secret_key, region)
+        self._pool = _ConnectionPool(parsed.scheme, parsed.netloc, pool_size, timeout)
+
+    def owns(self, location):
+        return location.startswith(f's3://{self.bucket}/')
+
+    def _key(self, location):
+        return location[len(f's3://{self.bucket}/'):]
+
+    def _request(self, method, key, query=None, body=b'', headers=None, expect=(200,)):
+        """Send one signed request; returns (status, headers, body)"""
+        path = f'{self._base_path}/{self.bucket}/{key}'
+        payload_hash = hashlib.sha256(body).hexdigest()
+        for attempt in range(2):
+            request_headers = {name.lower(): value for name, value in (headers or {}).items()}
+            canonical_query = sign_v4(method, self._host, path, query or {}, request_headers, payload_hash,
+                                      *self._credentials)
+            url = quote(path, safe='/-_.~') + (f'?{canonical_query}' if canonical_query else '')
+            connection, reused = self._pool.get()
+            try:
+                connection.request(method, url, body=body or None, headers=request_headers)
+                response = connection.getresponse()
+                data = response.read()
+            except BaseException as e:
+                # Timeouts, DNS and TLS errors too: the slot must go back either way
+                self._pool.discard(connection)
+                if reused and attempt == 0 and isinstance(e, (http.client.HTTPException, ConnectionError)):
+                    continue  # The server closed an idle keep-alive connection
+                raise
+            if response.will_close:
+                self._pool.discard(connection)
+            else:
+                self._pool.put(connection)
+            break
+        if response.status == 404 and 404 not in expect:
+            raise FileNotFoundError(f's3://{self.bucket}/{key}')
+        if response.status not in expect or (method == 'POST' and b'<Error>' in data):
+            raise S3Error(f'S3 {method} {key} failed with {response.status}: {data[:200]!r}', response.status)
+        return response.status, response.headers, data
+
+    def _get_range(self, key, start, stop):
+        _, _, data = self._request('GET', key, headers={'Range': f'bytes={start}-{stop - 1}'},
+                                   expect=(200, 206))
+        return data
+
+    def put_stream(self, location, stream):
+        key = self._key(location)
+        first = _read_part(stream, self.part_size)
+        if len(first) < self.part_size:
+            self._request('PUT', key, body=first)
+            return len(first)
+        return self._put_multipart(key, first, stream)
+
+    def _put_multipart(self, key, first, stream):
+        _, _, data = self._request('POST', key, query={'uploads': ''})
+        upload_id = _xml_text(data, 'UploadId')
+        etags, written = [], 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix='s3-part') as pool:
+                in_flight = deque()
+                part, number = first, 1
+                while part:
+                    in_flight.append(pool.submit(self._put_part, key, upload_id, number, part))
+                    written += len(part)
+                    if len(in_flight) >= self.upload_workers:
+                        etags.append(in_flight.popleft().result())
+                    part, number = _read_part(stream, self.part_size), number + 1
+                etags.extend(future.result() for future in in_flight)
+            manifest = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                               for number, etag in enumerate(etags, 1))
+            self._request('POST', key, query={'uploadId': upload_id},
+                          body=f'<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>'.encode())
+        except BaseException:
+            try:
+                self._request('DELETE', key, query={'uploadId': upload_id}, expect=(200, 204, 404))
+            except Exception:
+                pass  # The bucket's lifecycle rules clean up abandoned uploads
+            raise
+        return written
+
+    def _put_part(self, key, upload_id, number, part):
+        _, headers, _ = self._request('PUT', key, query={'partNumber': str(number), 'uploadId': upload_id},
+                                      body=part)
+        return headers['ETag']
+
+    def get_stream(self, location):
+        stat = self.stat(location)
+        if stat is None:
+            raise FileNotFoundError(location)
+        return io.BufferedReader(_ObjectReader(self, self._key(location), stat.size), self.read_size)
+
+    def get_range(self, location, start, stop):
+        if stop <= start:
+            return b''
+        return self._get_range(self._key(location), start, stop)
+
+    def delete(self, location):
+        # S3 answers 204 whether or not the object existed
+        status, _, _ = self._request('DELETE', self._key(location), expect=(200, 204, 404))
+        return status != 404
+
+    def stat(self, location):
+        status, headers, _ = self._request('HEAD', self._key(location), expect=(200, 404))
+        if status == 404:
+            return None
+        modified = headers.get('Last-Modified')
+        return ObjectStat(int(headers['Content-Length']),
+                          parsedate_to_datetime(modified).timestamp() if modified else None)
+
+
+def _xml_text(document, tag):
+    for element in ElementTree.fromstring(document).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    raise S3Error(f'No {tag} in S3 response')
+
+
+class Storage:
+    """The app's storage backends: files are read from whichever backend owns
+    their location, and new blobs are written to STORAGE_BACKEND.
+    """
+
+    def __init__(self, app=None):
+        self.local = LocalBackend()
+        self.remote = []
+        self.write_root = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.remote = []
+        self.write_root = None
+        if config.get('S3_BUCKET'):
+            s3 = S3Backend(config['S3_ENDPOINT'], config['S3_BUCKET'], config.get('S3_ACCESS_KEY'),
+                           config.get('S3_SECRET_KEY'), region=config.get('S3_REGION', 'us-east-1'),
+                           prefix=config.get('S3_PREFIX', ''), pool_size=config.get('S3_POOL_SIZE', 16),
+                           part_size=config.get('S3_PART_SIZE', 8 * 1024 * 1024),
+                           upload_workers=config.get('S3_UPLOAD_WORKERS', 4), timeout=config.get('S3_TIMEOUT', 60))
+            self.remote.append(s3)
+            if config.get('STORAGE_BACKEND', 'local') == 's3':
+                self.write_root = s3.root
+        app.extensions['storage'] = self
+
+    def backend_for(self, location):
+        for backend in self.remote:
+            if backend.owns(location):
+                return backend
+        return self.local
+
+    def is_local(self, location):
+        return self.backend_for(location) is self.local
+
+    def blob_root(self, staging_root):
+        """Root new blobs go under, for one staged on the local staging_root"""
+        return self.write_root or staging_root
+
+    def put_stream(self, location, stream):
+        return self.backend_for(location).put_stream(location, stream)
+
+    def move_in(self, location, path):
+        return self.backend_for(location).move_in(location, path)
+
+    def get_stream(self, location):
+        return self.backend_for(location).get_stream(location)
+
+    def get_range(self, location, start, stop):
+        return self.backend_for(location).get_range(location, start, stop)
+
+    def delete(self, location):
+        return self.backend_for(location).delete(location)
+
+    def stat(self, location):
+        return self.backend_for(location).stat(location)
+
+    def exists(self, location):
+        return self.stat(location) is not None
+
+
+storage = Storage()
+
+
+def iter_decrypted_file(location, read_size=DEFAULT_CHUNK_SIZE):
+    """Yield the decrypted contents of a stored file chunk by chunk"""
+    with storage.get_stream(location) as encrypted_file:
+        yield from decrypt_stream(encrypted_file, read_size)
+
+
+def iter_decrypted_range(location, start, stop, read_size=DEFAULT_CHUNK_SIZE):
+    """Yield decrypted bytes [start, stop) of a stored file"""
+    with storage.get_stream(location) as encrypted_file:
+        yield from decrypt_range(encrypted_file, start, stop, read_size)
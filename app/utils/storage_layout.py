@@ -0,0 +1,206 @@
+import hashlib
+import math
+import os
+import shutil
+import time
+
+from flask import current_app
+
+from app.utils.storage import storage
+
+
+HOT_TIER, COLD_TIER = 'hot', 'cold'
+
+
+def storage_roots(upload_folder=None):
+    """Directories files may be stored under: the upload folder, then UPLOAD_ROOTS.
+
+    Roots must not be nested inside one another.
+    """
+    roots = [upload_folder or current_app.config['UPLOAD_FOLDER']]
+    roots.extend(current_app.config.get('UPLOAD_ROOTS') or ())
+    return list(dict.fromkeys(os.path.normpath(str(root)) for root in roots))
+
+
+def _free_space(root):
+    try:
+        os.makedirs(root, exist_ok=True)
+        return shutil.disk_usage(root).free
+    except OSError as e:
+        current_app.logger.error(f'Storage root {root} is unavailable: {e}')
+        return None
+
+
+def _rendezvous_score(key, root, weight):
+    # Weighted rendezvous hashing: each root draws a uniform number from the
+    # key, and the highest -weight / ln(draw) wins. A root is picked with
+    # probability proportional to its weight, and adding or removing a root
+    # only moves the keys that root wins or loses.
+    draw = int.from_bytes(hashlib.sha256(f'{root}\0{key}'.encode()).digest()[:8], 'big')
+    return -weight / math.log((draw + 1) / (2 ** 64 + 1))
+
+
+def choose_root(key, roots=None):
+    """The storage root for key, weighted by each root's free space.
+
+    Roots with less than UPLOAD_ROOT_MIN_FREE bytes free are passed over
+    while any other has room; if none does, the emptiest one is used and
+    the write will fail there if the disk is really full.
+    """
+    roots = roots or storage_roots()
+    if len(roots) == 1:
+        return roots[0]
+    free = {root: space for root in roots
+            if (space := _free_space(root)) is not None}
+    if not free:
+        return roots[0]
+    min_free = current_app.config.get('UPLOAD_ROOT_MIN_FREE', 0)
+    roomy = {root: space for root, space in free.items() if space >= min_free}
+    if not roomy:
+        return max(free, key=free.get)
+    return max(roomy, key=lambda root: _rendezvous_score(key, root, roomy[root]))
+
+
+def root_of(path, roots=None):
+    """The storage root path lies under, or None"""
+    path = os.path.normpath(path)
+    for root in roots or storage_roots():
+        if path.startswith(root + os.sep):
+            return root
+    return None
+
+
+def cold_root():
+    """Where cold blobs are kept (TIER_COLD_ROOT), or None if tiering is off"""
+    root = current_app.config.get('TIER_COLD_ROOT')
+    if not root:
+        return None
+    return root.rstrip('/') if '://' in root else os.path.normpath(str(root))
+
+
+def tier_of(location):
+    """The storage tier a stored location is on: COLD_TIER under the cold root, else HOT_TIER"""
+    root = cold_root()
+    if root is None:
+        return HOT_TIER
+    if '://' in root:
+        return COLD_TIER if location.startswith(root + '/') else HOT_TIER
+    return COLD_TIER if os.path.normpath(location).startswith(root + os.sep) else HOT_TIER
+
+
+def _link_or_copy(source, target):
+    """Make target a second name for source's contents.
+
+    A hard link when both are on one filesystem; otherwise a copy that only
+    appears under target once it is complete.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.exists(target):
+        if os.path.samefile(source, target):
+            return  # Left by an interrupted run
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target + '.part')
+        os.replace(target + '.part', target)
+
+
+def _layout_batches(rows_after, target_for, batch_size, roots):
+    """Batches of (id, old path, new path) for rows not yet where target_for puts them"""
+    last_id = 0
+    while True:
+        rows = rows_after(last_id, batch_size)
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        moves = []
+        for row in rows:
+            if not storage.is_local(row[1]) or tier_of(row[1]) == COLD_TIER:
+                continue  # The object store has no directories to fan out; cold blobs stay put
+            root = root_of(row[1], roots)
+            if root is None:
+                current_app.logger.warning(f'Not moving {row[1]}: it is outside every storage root')
+                continue
+            target = target_for(row, root)
+            if target != row[1]:
+                moves.append((row[0], row[1], target))
+        yield moves
+
+
+def relayout_storage(batch_size=200, limit=None, pause=0):
+    """Move blobs and legacy files into the sharded layout, online.
+
+    Blobs go to blobs/ab/cd/<digest> and legacy files to ab/cd/<name> on
+    the root they are already on, so every move is a hard link. Each batch
+    links its files under their new names, repoints Blob.path and
+    File.encrypted_path in one transaction, and only then removes the old
+    names; a download already reading the old name keeps its open file.
+    The path updates only apply if the old path is still current, so a blob
+    collected while it was being moved is not resurrected. pause seconds
+    are slept between batches to spread the I/O. Returns (files moved,
+    bytes moved).
+    """
+    from app.models import db, Blob, File
+    from app.utils.blob_store import blob_path
+    from app.utils.file_utils import delete_file, get_file_path
+
+    roots = storage_roots()
+
+    def blobs_after(last_id, size):
+        return (db.session.query(Blob.id, Blob.path, Blob.digest).filter(Blob.id > last_id)
+                .order_by(Blob.id).limit(size).all())
+
+    def legacy_files_after(last_id, size):
+        return (db.session.query(File.id, File.encrypted_path)
+                .filter(File.id > last_id, File.blob_id.is_(None)).order_by(File.id).limit(size).all())
+
+    def repoint_blob(blob_id, old, new):
+        updated = db.session.query(Blob).filter(Blob.id == blob_id, Blob.path == old).update(
+            {Blob.path: new}, synchronize_session=False)
+        if updated:
+            db.session.query(File).filter(File.blob_id == blob_id).update(
+                {File.encrypted_path: new}, synchronize_session=False)
+        return updated
+
+    def repoint_file(file_id, old, new):
+        return db.session.query(File).filter(File.id == file_id, File.encrypted_path == old).update(
+            {File.encrypted_path: new}, synchronize_session=False)
+
+    moved = moved_bytes = 0
+    passes = [
+        (blobs_after, lambda row, root: blob_path(root, row.digest), repoint_blob),
+        (legacy_files_after, lambda row, root: get_file_path(root, os.path.basename(row[1])), repoint_file),
+    ]
+    for rows_after, target_for, repoint in passes:
+        for moves in _layout_batches(rows_after, target_for, batch_size, roots):
+            if limit is not None:
+                moves = moves[:max(limit - moved, 0)]
+            linked = []
+            for row_id, old, new in moves:
+                try:
+                    _link_or_copy(old, new)
+                    linked.append((row_id, old, new))
+                except OSError as e:
+                    current_app.logger.error(f'Could not move {old}: {e}')
+            try:
+                applied = {move for move in linked if repoint(*move)}
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for _, _, new in linked:
+                    delete_file(new)
+                raise
+            for move in linked:
+                _, old, new = move
+                if move in applied:
+                    moved += 1
+                    moved_bytes += os.path.getsize(new)
+                    delete_file(old)
+                else:
+                    delete_file(new)
+            if limit is not None and moved >= limit:
+                return moved, moved_bytes
+            if pause and moves:
+                time.sleep(pause)
+    return moved, moved_bytes
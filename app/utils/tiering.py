@@ -0,0 +1,293 @@
+import math
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.utils.blob_store import _ChunkReader, blob_path, stage_blob
+from app.utils.file_utils import delete_file
+from app.utils.jobs import enqueue, register_job
+from app.utils.storage import iter_decrypted_file, storage
+from app.utils.storage_layout import COLD_TIER, HOT_TIER, choose_root, cold_root, tier_of
+
+
+class TierStats:
+    """Downloads served from each tier by this process, for the hit rate"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.downloads = Counter()
+            self.promotions_queued = 0
+
+    def record(self, tier, promoted=False):
+        with self._lock:
+            self.downloads[tier] += 1
+            self.promotions_queued += promoted
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.downloads.values())
+            return {
+                'hot_downloads': self.downloads[HOT_TIER],
+                'cold_downloads': self.downloads[COLD_TIER],
+                'promotions_queued': self.promotions_queued,
+                'hit_rate': self.downloads[HOT_TIER] / total if total else 0.0,
+            }
+
+
+tier_stats = TierStats()
+
+
+def note_download(file_record):
+    """Count a download against the tier its file is on; cold files are queued for promotion.
+
+    file_record is a File or a SharedFile. Runs in the caller's
+    transaction, so the promotion is queued when the download is logged.
+    """
+    from app.models import db, Job
+
+    tier = file_record.storage_tier or HOT_TIER
+    promoted = False
+    if tier == COLD_TIER:
+        # A popular cold link should queue one promotion, not one per
+        # download; a duplicate that slips through is a no-op in promote_file
+        pending = db.session.query(Job.id).filter(
+            Job.kind == 'promote_file', Job.dedupe_key == str(file_record.id),
+            Job.status.in_(('queued', 'running'))
+        ).first()
+        if pending is None:
+            enqueue('promote_file', dedupe_key=str(file_record.id), file_id=file_record.id)
+            promoted = True
+    tier_stats.record(tier, promoted)
+
+
+def _cold_enough(last_used, downloads, now, cold_after):
+    # Popular files stay hot longer: every doubling of the download count
+    # adds another cold_after of idle time before a blob is demoted
+    return now - last_used >= timedelta(seconds=cold_after * (1 + math.log2(1 + downloads)))
+
+
+def _cold_candidates(cutoff, batch_size):
+    """Hot blobs unused since cutoff, as batches of (blob id, last used, downloads, a filename).
+
+    A blob's last use is its files' latest download, or upload if they
+    were never downloaded; downloads are summed over the files sharing it.
+    """
+    from app.models import db, AccessLog, File
+
+    last_download = (db.session.query(func.max(AccessLog.timestamp))
+                     .filter(AccessLog.file_id == File.id, AccessLog.action == 'download')
+                     .correlate(File).scalar_subquery())
+    last_used = func.max(func.coalesce(last_download, File.upload_time), type_=db.DateTime)
+    last_id = 0
+    while True:
+        rows = (db.session.query(File.blob_id, last_used, func.sum(func.coalesce(File.download_count, 0)),
+                                 func.min(File.original_filename))
+                .filter(File.blob_id > last_id, File.storage_tier == HOT_TIER)
+                .group_by(File.blob_id).having(last_used < cutoff)
+                .order_by(File.blob_id).limit(batch_size).all())
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+
+def _cancel_drops(location):
+    """Stop any pending drop_tier_copy job from removing location, before it is written again.
+
+    Returns False while such a job is running; the caller should try later.
+    """
+    from app.models import db, Job
+
+    drops = db.session.query(Job).filter(Job.kind == 'drop_tier_copy', Job.dedupe_key == location)
+    drops.filter(Job.status.in_(('queued', 'failed'))).delete(synchronize_session=False)
+    running = drops.filter(Job.status == 'running').first() is not None
+    db.session.commit()
+    return not running
+
+
+def _migrate_blob(blob, tier, target, staging_root, codec=None, filename=None):
+    """Copy blob to target on another tier and repoint it and its files there.
+
+    With a codec (or 'none'), the blob is decrypted and re-encrypted with
+    that compression, staged on the local staging_root; otherwise its
+    ciphertext is copied as is. The path update only applies if the blob
+    has not moved meanwhile. The previous copy is left for TIER_DROP_DELAY
+    seconds, so downloads still reading it and share links cached by other
+    processes keep working, then removed by a drop_tier_copy job. Returns
+    the bytes written, or 0 if the blob moved or went away.
+    """
+    from app.models import db, Blob, File
+
+    config = current_app.config
+    old = blob.path
+    if not _cancel_drops(target):
+        raise RuntimeError(f'a previous copy at {target} is being removed')
+    if codec is None:
+        with storage.get_stream(old) as stream:
+            stored_size = storage.put_stream(target, stream)
+        codec = blob.codec
+    else:
+        chunk_size = config['ENCRYPTION_CHUNK_SIZE']
+        staged = stage_blob(_ChunkReader(iter_decrypted_file(old, chunk_size)), staging_root, chunk_size,
+                            filename, codec=codec, min_ratio=config.get('COMPRESSION_MIN_RATIO', 0.9),
+                            cipher=config.get('ENCRYPTION_CIPHER'))
+        try:
+            if staged.digest != blob.digest:
+                raise ValueError(f'blob {blob.id} did not decrypt to its digest')
+            stored_size = os.path.getsize(staged.path)
+            storage.move_in(target, staged.path)
+        finally:
+            delete_file(staged.path)
+        codec = staged.codec or 'none'
+
+    try:
+        updated = db.session.query(Blob).filter(Blob.id == blob.id, Blob.path == old).update(
+            {Blob.path: target, Blob.stored_size: stored_size, Blob.codec: codec}, synchronize_session=False)
+        if updated:
+            db.session.query(File).filter(File.blob_id == blob.id).update(
+                {File.encrypted_path: target, File.storage_tier: tier}, synchronize_session=False)
+            enqueue('drop_tier_copy', delay=config.get('TIER_DROP_DELAY', 600), dedupe_key=old, path=old)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        storage.delete(target)
+        raise
+    if not updated:
+        storage.delete(target)
+        return 0
+    return stored_size
+
+
+def _local_staging_root(target_root):
+    # Re-encoded copies are staged where a rename puts them in place, or on
+    # a hot root when they are headed for the object store
+    if storage.is_local(target_root):
+        return target_root
+    return choose_root(uuid.uuid4().hex)
+
+
+def demote_cold_blobs(cold_after=None, batch_size=None, limit=None, max_bytes_per_second=None, now=None):
+    """Move blobs nobody has used lately to the cold tier.
+
+    Candidates are hot blobs whose files have not been downloaded (or
+    uploaded) for cold_after seconds, scaled up for often-downloaded files
+    (see _cold_enough). Each is copied to TIER_COLD_ROOT, re-compressed
+    with TIER_COLD_CODEC if that is set, and repointed in its own
+    transaction. Copies are throttled to max_bytes_per_second so a pass
+    does not starve downloads of I/O. Settings default to the TIER_* config
+    values. Returns (blobs moved, bytes written).
+    """
+    from app.models import db, Blob
+
+    config = current_app.config
+    root = cold_root()
+    if root is None:
+        return 0, 0
+    cold_after = config.get('TIER_COLD_AFTER', 30 * 24 * 3600) if cold_after is None else cold_after
+    batch_size = batch_size or config.get('TIER_BATCH_SIZE', 100)
+    if max_bytes_per_second is None:
+        max_bytes_per_second = config.get('TIER_MAX_BYTES_PER_SECOND', 0)
+    cold_codec = config.get('TIER_COLD_CODEC')
+    now = now or datetime.utcnow()
+    staging_root = _local_staging_root(root)
+
+    moved = moved_bytes = 0
+    started = time.monotonic()
+    for rows in _cold_candidates(now - timedelta(seconds=cold_after), batch_size):
+        for blob_id, last_used, downloads, filename in rows:
+            if not _cold_enough(last_used, downloads, now, cold_after):
+                continue
+            blob = db.session.get(Blob, blob_id)
+            if blob is None or blob.refcount <= 0 or tier_of(blob.path) == COLD_TIER:
+                continue
+            codec = cold_codec if cold_codec and cold_codec != blob.codec else None
+            try:
+                written = _migrate_blob(blob, COLD_TIER, blob_path(root, blob.digest), staging_root,
+                                        codec, filename)
+            except Exception as e:
+                current_app.logger.error(f'Could not demote blob {blob_id}: {e}')
+                continue
+            if written:
+                moved += 1
+                moved_bytes += written
+            if limit is not None and moved >= limit:
+                return moved, moved_bytes
+            if max_bytes_per_second:
+                ahead = moved_bytes / max_bytes_per_second - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+    return moved, moved_bytes
+
+
+def tier_report():
+    """Files and blobs on each tier, with their sizes, plus this process's hit rate"""
+    from app.models import db, Blob, File
+
+    tiers = {tier: {'files': 0, 'file_bytes': 0, 'blobs': 0, 'stored_bytes': 0}
+             for tier in (HOT_TIER, COLD_TIER)}
+    for tier, files, file_bytes in (db.session.query(File.storage_tier, func.count(File.id),
+                                                     func.sum(File.file_size))
+                                    .group_by(File.storage_tier)):
+        tiers.setdefault(tier, {'blobs': 0, 'stored_bytes': 0}).update(files=files, file_bytes=file_bytes or 0)
+    placed = (db.session.query(File.blob_id, File.storage_tier).filter(File.blob_id.isnot(None))
+              .distinct().subquery())
+    for tier, blobs, stored_bytes in (db.session.query(placed.c.storage_tier, func.count(Blob.id),
+                                                       func.sum(Blob.stored_size))
+                                      .join(Blob, Blob.id == placed.c.blob_id)
+                                      .group_by(placed.c.storage_tier)):
+        tiers[tier].update(blobs=blobs, stored_bytes=stored_bytes or 0)
+    return {'tiers': tiers, 'cold_root': cold_root(), **tier_stats.stats()}
+
+
+@register_job('tier_storage', concurrency=1)
+def tier_storage_job():
+    """Job: demote one batch of cold blobs, and queue the next batch if there may be more"""
+    from app.models import db
+
+    config = current_app.config
+    batch_size = config.get('TIER_BATCH_SIZE', 100)
+    moved, moved_bytes = demote_cold_blobs(limit=batch_size)
+    current_app.logger.info(f'Storage tiering: {moved} blobs ({moved_bytes} bytes) moved to the cold tier')
+    if moved >= batch_size:
+        enqueue('tier_storage', delay=config.get('TIER_BATCH_PAUSE', 60))
+        db.session.commit()
+
+
+@register_job('promote_file', concurrency=2)
+def promote_file(file_id):
+    """Job: bring a cold file's blob back to the hot tier after it was downloaded.
+
+    A blob re-compressed for the cold tier is re-encoded with the hot
+    COMPRESSION_CODEC, so range requests stay cheap. A blob that is no
+    longer cold is left alone, which makes duplicate promotions harmless.
+    """
+    from app.models import db, File
+
+    file_record = db.session.get(File, file_id)
+    if file_record is None or file_record.blob is None or tier_of(file_record.blob.path) != COLD_TIER:
+        return
+    blob = file_record.blob
+    hot_codec = current_app.config.get('COMPRESSION_CODEC') or 'none'
+    codec = hot_codec if blob.codec not in ('none', hot_codec) else None
+    root = choose_root(blob.digest)
+    _migrate_blob(blob, HOT_TIER, blob_path(storage.blob_root(root), blob.digest), root,
+                  codec, file_record.original_filename)
+
+
+@register_job('drop_tier_copy')
+def drop_tier_copy(path):
+    """Job: remove a blob's copy on the tier it moved away from"""
+    from app.models import db, Blob
+
+    if db.session.query(Blob.id).filter(Blob.path == path).first() is None:
+        storage.delete(path)
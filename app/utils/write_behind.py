@@ -0,0 +1,85 @@
+import atexit
+import threading
+
+
+class WriteBehindBuffer:
+    """Base class for in-process buffers that are written to the database later.
+
+    Subclasses implement _take_pending() and _write(items); this class owns
+    the lock, the background flusher thread and the flush-at-exit hook. The
+    flusher wakes every flush_interval seconds (never, if <= 0) or when
+    _wake_flusher() is called, and flush() can always be called directly.
+    """
+
+    thread_name = 'write-behind-flusher'
+
+    def __init__(self, app=None):
+        self.app = None
+        self.flush_interval = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+        self._atexit_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Anything queued for a previous app must go to that app's database
+        self.flush()
+        self.app = app
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def _take_pending(self):
+        """Detach and return everything queued so far (called with the lock held)"""
+        raise NotImplementedError
+
+    def _write(self, items):
+        """Persist items inside an app context; returns the number written"""
+        raise NotImplementedError
+
+    def _restore_pending(self, items):
+        """Put items back after a failed write (called with the lock held)"""
+
+    def flush(self):
+        """Write everything queued so far, synchronously"""
+        with self._lock:
+            items = self._take_pending()
+        if not items or self.app is None:
+            return 0
+
+        from app.models import db
+
+        with self.app.app_context():
+            try:
+                written = self._write(items)
+                db.session.commit()
+                return written
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'{type(self).__name__} flush failed: {e}')
+                with self._lock:
+                    self._restore_pending(items)
+                return 0
+            finally:
+                db.session.remove()
+
+    def _wake_flusher(self):
+        self._wake.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            # A non-positive interval means flush only when explicitly woken
+            self._wake.wait(self.flush_interval if self.flush_interval > 0 else None)
+            self._wake.clear()
+            self.flush()
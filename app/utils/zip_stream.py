@@ -0,0 +1,70 @@
+import io
+import os
+import zipfile
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable target for ZipFile that hands its output back in pieces.
+
+    ZipFile notices seek() is unsupported and switches to data descriptors,
+    so nothing already written ever has to be revisited.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pieces = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        """Everything written since the last call"""
+        data = b''.join(self._pieces)
+        self._pieces.clear()
+        return data
+
+
+def unique_member_name(name, used):
+    """name, or "name (n).ext" if an earlier member already took it"""
+    stem, extension = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        candidate = f'{stem} ({n}){extension}'
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def iter_zip(members):
+    """Stream a ZIP archive built from (name, size, modified, chunks) members.
+
+    Each member's chunks are written into the archive as they are produced
+    and the archive bytes are yielded straight away, so memory use does not
+    depend on the size or number of members. Members are stored without
+    compression: the data is usually compressed already, and storing keeps
+    the archive cheap to build. size is the member's uncompressed size, used
+    to decide whether it needs ZIP64 records.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for name, size, modified, chunks in members:
+            info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = size
+            with archive.open(info, 'w') as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    data = sink.take()
+                    if data:
+                        yield data
+            yield sink.take()
+    yield sink.take()
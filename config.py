@@ -30,5 +30,114 @@ class Config:
         'zip', 'rar', '7z', 'tar', 'gz'
     }
     
+    # Access log write-behind buffer
+    ACCESS_LOG_BUFFERED = True          # Queue AccessLog rows and bulk insert them
+    ACCESS_LOG_BATCH_SIZE = 100         # Flush as soon as this many rows are queued
+    ACCESS_LOG_FLUSH_INTERVAL = 2.0     # ...or after this many seconds (<= 0: size only)
+    
+    # Download counters: 'atomic' (UPDATE ... + 1 per download) or 'coalesced'
+    # (summed in memory and written in one batch per interval)
+    DOWNLOAD_COUNTER_MODE = os.environ.get('DOWNLOAD_COUNTER_MODE') or 'atomic'
+    DOWNLOAD_COUNTER_FLUSH_INTERVAL = 5.0
+    
+    # Share-link lookup cache (per process)
+    SHARE_CACHE_SIZE = 10000            # Max cached tokens (0 disables the cache)
+    SHARE_CACHE_TTL = 300               # Seconds a valid token stays cached
+    SHARE_CACHE_NEGATIVE_TTL = 30       # Seconds an unknown token stays cached
+    
+    # Bloom filter of active share tokens (per process). Off by default: a
+    # link shared in one worker process is rejected by the others until
+    # their next refresh, so only enable it for a single process or where
+    # that delay is acceptable
+    SHARE_FILTER_ENABLED = os.environ.get('SHARE_FILTER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    SHARE_FILTER_ERROR_RATE = 0.001       # False-positive rate at capacity
+    SHARE_FILTER_REFRESH_INTERVAL = 10    # Seconds between rebuilds (0 = only on demand)
+    
     # Encryption settings
-    ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or 'your-encryption-key-here-change-this'
\ No newline at end of file
+    ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or 'your-encryption-key-here-change-this'
+    ENCRYPTION_CHUNK_SIZE = 64 * 1024  # Plaintext bytes per independently authenticated chunk
+    # AEAD cipher for new uploads: 'aes-256-gcm' or 'chacha20-poly1305'
+    # (see scripts/benchmarks/cipher_throughput_benchmark.py). Existing files
+    # keep the cipher recorded in their header; legacy CBC files stay readable.
+    ENCRYPTION_CIPHER = os.environ.get('ENCRYPTION_CIPHER') or 'aes-256-gcm'
+    # Threads that encrypt/decrypt the chunks of large files in parallel
+    ENCRYPTION_WORKERS = int(os.environ.get('ENCRYPTION_WORKERS') or min(4, os.cpu_count() or 1))
+    ENCRYPTION_PARALLEL_THRESHOLD = 8 * 1024 * 1024  # Bytes before a file uses the worker threads
+    
+    # Compression before encryption: 'zlib', 'lzma' or None to disable
+    COMPRESSION_CODEC = 'zlib'
+    COMPRESSION_MIN_RATIO = 0.9          # Skip uploads whose sample shrinks less than 10%
+    
+    # Resumable uploads: MAX_CONTENT_LENGTH limits each request (one part),
+    # UPLOAD_MAX_FILE_SIZE limits the assembled file
+    UPLOAD_PART_SIZE = 8 * 1024 * 1024    # Rounded to whole encryption chunks
+    UPLOAD_MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
+    UPLOAD_SESSION_TTL = 24 * 3600        # Seconds before an unfinished upload is discarded
+    UPLOAD_SESSION_EXPIRE_INTERVAL = 3600 # Seconds between sweeps for expired uploads
+    UPLOAD_MAX_OPEN_SESSIONS = 10         # Unfinished uploads one user may have at once
+    
+    # Batch uploads: files in one request are encrypted on this many threads
+    UPLOAD_BATCH_WORKERS = int(os.environ.get('UPLOAD_BATCH_WORKERS') or ENCRYPTION_WORKERS)
+    UPLOAD_BATCH_MAX_FILES = 100
+    
+    # Bulk downloads are streamed as a ZIP built on the fly
+    DOWNLOAD_ZIP_MAX_FILES = 500
+    
+    # Bulk file operations
+    BULK_MAX_FILES = 1000
+    
+    # Background jobs, persisted in the job table and run by worker threads
+    # in each app process (0: run them with scripts/admin/run_jobs.py)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_POLL_INTERVAL = 1.0               # Seconds between polls for due jobs
+    JOB_MAX_ATTEMPTS = 5
+    JOB_RETRY_BACKOFF = 30                # Seconds before the first retry, doubled per attempt
+    JOB_TIMEOUT = 600                     # Seconds without a heartbeat before a running job is requeued
+    JOB_HEARTBEAT_INTERVAL = 60           # Seconds between heartbeats of running jobs
+    
+    # Storage reconciliation (scripts/admin/reconcile_storage.py, admin jobs page)
+    RECONCILE_MIN_AGE = 3600              # Files younger than this are never purged (in-flight uploads)
+    RECONCILE_WORKERS = 4                 # Threads unlinking orphaned files
+    RECONCILE_MAX_DELETES_PER_SECOND = 200  # Throttle so a big purge does not starve uploads of I/O
+    RECONCILE_BATCH_SIZE = 500
+    
+    # Extra storage roots (e.g. one per disk), separated by os.pathsep. New blobs
+    # are spread over UPLOAD_FOLDER and these by free space; see storage_layout.py
+    UPLOAD_ROOTS = [root for root in os.environ.get('UPLOAD_ROOTS', '').split(os.pathsep) if root]
+    UPLOAD_ROOT_MIN_FREE = 1024 * 1024 * 1024  # Roots with less free space get no new blobs
+    
+    # Where new blobs are written: 'local' (UPLOAD_FOLDER / UPLOAD_ROOTS) or 's3'.
+    # Files are always read from whichever backend their stored location names.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    # Any S3-compatible object store, addressed path-style
+    S3_ENDPOINT = os.environ.get('S3_ENDPOINT') or 'https://s3.amazonaws.com'
+    S3_REGION = os.environ.get('S3_REGION') or 'us-east-1'
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX') or ''
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_POOL_SIZE = 16                      # Keep-alive connections per process
+    S3_PART_SIZE = 8 * 1024 * 1024         # Multipart part size (S3 needs at least 5 MB)
+    S3_UPLOAD_WORKERS = 4                  # Parts uploaded in parallel per object
+    S3_TIMEOUT = 60
+    
+    # Hot/cold tiering: blobs whose files go unused for TIER_COLD_AFTER seconds
+    # (longer for often-downloaded ones) move to TIER_COLD_ROOT, a local
+    # directory or an s3:// location in S3_BUCKET, and come back when
+    # downloaded. Unset to keep everything hot
+    TIER_COLD_ROOT = os.environ.get('TIER_COLD_ROOT')
+    TIER_COLD_AFTER = 30 * 24 * 3600
+    TIER_COLD_CODEC = 'lzma'               # Re-compress cold blobs with this (None: copy them as is)
+    TIER_BATCH_SIZE = 100                  # Blobs demoted per background job
+    TIER_BATCH_PAUSE = 60                  # Seconds between batches
+    TIER_MAX_BYTES_PER_SECOND = 50 * 1024 * 1024
+    TIER_DROP_DELAY = 600                  # Seconds a moved blob's old copy is kept (>= SHARE_CACHE_TTL)
+    
+    # Decrypted content cache for files downloaded over and over (e.g. a viral
+    # share link), opt-in. Entries are kept in memory, or under
+    # CONTENT_CACHE_PATH in a private 0700 directory per process; it holds
+    # plaintext, so point it at a tmpfs
+    CONTENT_CACHE_SIZE = int(os.environ.get('CONTENT_CACHE_SIZE', 0))  # Bytes (0 disables the cache)
+    CONTENT_CACHE_MAX_ENTRY = 64 * 1024 * 1024  # Larger files are always decrypted from storage
+    CONTENT_CACHE_TTL = 300                     # Seconds an entry is served
+    CONTENT_CACHE_PATH = os.environ.get('CONTENT_CACHE_PATH')
\ No newline at end of file
@@ -10,6 +10,19 @@ sys.path.append('.')
 
 from app import create_app
 from app.models import db, User
+from app.utils.blob_store import release_user_storage
+from app.utils.jobs import job_runner
+
+def delete_users(users):
+    """Delete users with their files, then remove the files from disk"""
+    for user in users:
+        # Releases blob references and queues the purge of the user's files;
+        # deleting through the session cascades to their File rows
+        release_user_storage(user)
+        db.session.delete(user)
+    db.session.commit()
+    purged = job_runner.run_pending()
+    print(f"🧹 Ran {purged} storage purge job(s).")
 
 def view_all_users():
     """Display all current users before deletion"""
@@ -40,8 +53,7 @@ def clear_all_users():
                 return
             
             # Delete all users
-            User.query.delete()
-            db.session.commit()
+            delete_users(User.query.all())
             
             print(f"✅ Successfully deleted {user_count} user(s) from the database.")
             print("🔄 Database is now empty of users.")
@@ -64,8 +76,7 @@ def clear_non_admin_users():
                 return
             
             # Delete only regular users
-            User.query.filter_by(role='user').delete()
-            db.session.commit()
+            delete_users(regular_users)
             
             print(f"✅ Successfully deleted {count} regular user(s).")
             
@@ -101,8 +112,7 @@ def clear_specific_user():
                 print("❌ Deletion cancelled.")
                 return
             
-            db.session.delete(user)
-            db.session.commit()
+            delete_users([user])
             
             print(f"✅ Successfully deleted user '{username}'.")
             
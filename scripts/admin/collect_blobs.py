@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Garbage-collect the blob store: delete blobs no file references any more,
+discard resumable uploads past UPLOAD_SESSION_TTL, then remove files under
+uploads/blobs that have no Blob row (left by interrupted uploads). Deletes normally collect their own blobs, so this
+only mops up after crashes and failed requests.
+
+Usage:
+    python scripts/admin/collect_blobs.py [--min-age SECONDS]
+"""
+
+import argparse
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.utils.blob_store import collect_garbage, sweep_orphan_files
+from app.utils.resumable_upload import expire_sessions
+
+
+def collect(min_age):
+    """Remove unreferenced blobs, expired upload sessions and orphaned blob files"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            blobs, blob_bytes = collect_garbage()
+            sessions = expire_sessions()
+            print(f"⏳ Discarded {sessions} expired upload session(s)")
+            print(f"🗑️  Removed {blobs} unreferenced blob(s), {blob_bytes / 1024 / 1024:.1f} MB")
+            files, file_bytes = sweep_orphan_files(app.config['UPLOAD_FOLDER'], min_age=min_age)
+            print(f"🧹 Removed {files} orphaned file(s), {file_bytes / 1024 / 1024:.1f} MB")
+            print("✅ Blob store collection finished")
+            return True
+        except Exception as e:
+            print(f"❌ Collection failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Garbage-collect the blob store')
+    parser.add_argument('--min-age', type=int, default=3600,
+                        help='only sweep files older than this many seconds')
+    args = parser.parse_args()
+    if not collect(args.min_age):
+        sys.exit(1)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Report how much disk space and download I/O compression saves, per file
+category. Original size is the plaintext size of each file; stored size is
+the size of its encrypted blob on disk (files uploaded before the blob
+store count as uncompressed). Download I/O saved is the difference times
+the file's download count.
+
+Usage:
+    python scripts/admin/compression_report.py
+"""
+
+import os
+import sys
+from sqlalchemy import func
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, File, Blob
+
+
+def _mb(size):
+    return f"{(size or 0) / 1024 / 1024:,.1f} MB"
+
+
+def compression_report():
+    """Print original vs stored bytes and download I/O saved per category"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            stored = func.coalesce(Blob.stored_size, File.file_size)
+            downloads = func.coalesce(File.download_count, 0)
+            rows = db.session.query(
+                File.category,
+                func.coalesce(Blob.codec, 'none'),
+                func.count(File.id),
+                func.sum(File.file_size),
+                func.sum(stored),
+                func.sum((File.file_size - stored) * downloads),
+            ).outerjoin(Blob, File.blob_id == Blob.id).group_by(
+                File.category, func.coalesce(Blob.codec, 'none')
+            ).order_by(File.category).all()
+
+            print("📦 SecureShare compression report")
+            print("=" * 86)
+            print(f"{'Category':<10} {'Codec':<6} {'Files':>7} {'Original':>14} {'Stored':>14} {'Saved':>7} {'Download I/O saved':>20}")
+            totals = [0, 0, 0, 0]
+            for category, codec, count, original, stored_bytes, io_saved in rows:
+                original, stored_bytes, io_saved = original or 0, stored_bytes or 0, io_saved or 0
+                saved = 1 - stored_bytes / original if original else 0
+                print(f"{category:<10} {codec:<6} {count:>7} {_mb(original):>14} {_mb(stored_bytes):>14} "
+                      f"{saved:>6.0%} {_mb(io_saved):>20}")
+                for i, value in enumerate((count, original, stored_bytes, io_saved)):
+                    totals[i] += value
+
+            count, original, stored_bytes, io_saved = totals
+            saved = 1 - stored_bytes / original if original else 0
+            print("-" * 86)
+            print(f"{'Total':<17} {count:>7} {_mb(original):>14} {_mb(stored_bytes):>14} "
+                  f"{saved:>6.0%} {_mb(io_saved):>20}")
+            return True
+        except Exception as e:
+            print(f"❌ Report failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    if not compression_report():
+        sys.exit(1)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Reconcile the upload folder with the database: remove files no File, Blob
+or upload session refers to (including temp_* plaintext and *.part files
+left by interrupted uploads) and report stored paths whose file is gone.
+Both sides are streamed in sorted batches, so this is safe to run on large
+stores; deletes are spread over a few threads and rate-limited.
+
+Usage:
+    python scripts/admin/reconcile_storage.py [--dry-run] [--min-age SECONDS]
+                                              [--workers N] [--rate DELETES_PER_SECOND]
+"""
+
+import argparse
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.utils.reconciler import reconcile_storage
+
+
+def reconcile(dry_run, min_age, workers, rate):
+    """Diff the upload folder against the database and purge orphaned files"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            report = reconcile_storage(min_age=min_age, workers=workers,
+                                       max_deletes_per_second=rate, dry_run=dry_run)
+            print(f"🔍 Scanned {report.scanned} file(s), {report.scanned_bytes / 1024 / 1024:.1f} MB")
+            print(f"👻 Found {report.orphans} orphaned file(s) and {report.temp_files} stale temp file(s)")
+            if dry_run:
+                print("ℹ️  Dry run, nothing was deleted")
+            else:
+                print(f"🧹 Removed {report.purged} file(s), {report.reclaimed_bytes / 1024 / 1024:.1f} MB reclaimed")
+            if report.missing:
+                print(f"⚠️  {report.missing} stored path(s) have no file on disk, e.g.:")
+                for path in report.missing_sample:
+                    print(f"     {path}")
+            print("✅ Reconciliation finished")
+            return True
+        except Exception as e:
+            print(f"❌ Reconciliation failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile the upload folder with the database')
+    parser.add_argument('--dry-run', action='store_true', help='report only, delete nothing')
+    parser.add_argument('--min-age', type=int, default=None,
+                        help='only purge files older than this many seconds')
+    parser.add_argument('--workers', type=int, default=None, help='threads deleting files')
+    parser.add_argument('--rate', type=float, default=None, help='at most this many deletes per second')
+    args = parser.parse_args()
+    if not reconcile(args.dry_run, args.min_age, args.workers, args.rate):
+        sys.exit(1)
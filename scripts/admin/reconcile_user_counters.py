@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Recompute every user's storage, file, download and share counters from the
+File and AccessLog tables. Safe to run at any time, e.g. after bulk database
+maintenance or if the counters are suspected to have drifted.
+
+Usage:
+    python scripts/admin/reconcile_user_counters.py [user_id ...]
+"""
+
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, User
+
+
+def reconcile(user_ids=None):
+    """Rebuild the usage counters in one bulk UPDATE"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            updated = User.reconcile_counters(user_ids)
+            db.session.commit()
+            print(f"✅ Reconciled counters for {updated} user(s)")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Reconciliation failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    if not reconcile(ids):
+        sys.exit(1)
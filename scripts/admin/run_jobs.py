@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Run queued background jobs (blob purges, legacy re-encryption).
+The web app runs jobs on JOB_WORKERS threads of its own; this script is for
+deployments that set JOB_WORKERS = 0 and run jobs in a separate process, or
+to drain the queue by hand.
+
+Usage:
+    python scripts/admin/run_jobs.py [--forever] [--max-jobs N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.utils.jobs import job_runner, job_stats
+
+
+def run_jobs(forever=False, max_jobs=None):
+    """Run due jobs once, or keep polling for new ones"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            while True:
+                ran = job_runner.run_pending(max_jobs)
+                if ran:
+                    print(f"⚙️  Ran {ran} job(s)")
+                if not forever:
+                    break
+                time.sleep(app.config.get('JOB_POLL_INTERVAL', 1.0))
+
+            for kind, counts in sorted(job_stats().items()):
+                print(f"📋 {kind}: " + ', '.join(f"{status} {count}" for status, count in sorted(counts.items())))
+            print("✅ Job queue drained")
+            return True
+        except KeyboardInterrupt:
+            print("👋 Stopped")
+            return True
+        except Exception as e:
+            print(f"❌ Running jobs failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run queued background jobs')
+    parser.add_argument('--forever', action='store_true', help='keep polling for new jobs')
+    parser.add_argument('--max-jobs', type=int, default=None, help='stop after this many jobs per pass')
+    args = parser.parse_args()
+    if not run_jobs(args.forever, args.max_jobs):
+        sys.exit(1)
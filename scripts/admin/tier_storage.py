@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Move blobs nobody has downloaded lately to the cold tier (TIER_COLD_ROOT).
+Meant for cron; the admin Storage Tiers page queues the same work as
+background jobs. Copies are throttled, and each blob is repointed in its
+own transaction, so this is safe to run while the app serves downloads.
+
+Usage:
+    python scripts/admin/tier_storage.py [--cold-after SECONDS] [--limit N] [--rate BYTES_PER_SECOND]
+"""
+
+import argparse
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.utils.storage_layout import cold_root
+from app.utils.tiering import demote_cold_blobs, tier_report
+
+
+def tier_storage(cold_after, limit, rate):
+    """Demote cold blobs and print tier occupancy"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            if cold_root() is None:
+                print("ℹ️  TIER_COLD_ROOT is not set, nothing to do")
+                return True
+            print(f"❄️  Moving cold blobs to {cold_root()}...")
+            moved, moved_bytes = demote_cold_blobs(cold_after=cold_after, limit=limit, max_bytes_per_second=rate)
+            print(f"✅ Moved {moved} blob(s), {moved_bytes / 1024 / 1024:.1f} MB written")
+            for tier, counts in sorted(tier_report()['tiers'].items(), reverse=True):
+                print(f"📊 {tier}: {counts['files']} file(s) in {counts['blobs']} blob(s), "
+                      f"{counts['stored_bytes'] / 1024 / 1024:.1f} MB stored")
+            return True
+        except Exception as e:
+            print(f"❌ Tiering failed: {e}")
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move blobs nobody has used lately to the cold tier')
+    parser.add_argument('--cold-after', type=int, default=None,
+                        help='seconds without downloads before a file is cold')
+    parser.add_argument('--limit', type=int, default=None, help='stop after moving this many blobs')
+    parser.add_argument('--rate', type=int, default=None, help='copy at most this many bytes per second')
+    args = parser.parse_args()
+    if not tier_storage(args.cold_after, args.limit, args.rate):
+        sys.exit(1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark encryption and decryption throughput of each cipher.
+
+Runs every registered AEAD cipher through the chunked writer and streaming
+reader, plus the legacy AES-CBC functions for reference, on payloads of
+realistic upload sizes, and reports MB/s. Use it to pick ENCRYPTION_CIPHER
+for the hardware the app runs on (AES-GCM wins with AES-NI, ChaCha20-Poly1305
+usually wins without it).
+
+Usage:
+    python scripts/benchmarks/cipher_throughput_benchmark.py [--sizes-mb 1 16 64] [--repeat 3]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import Config
+from app.utils.file_utils import (
+    EncryptedFileWriter, decrypt_stream, encrypt_file_aes, decrypt_file_aes,
+    available_ciphers, get_encryption_key
+)
+
+
+def best_time(function, repeat):
+    """Return the fastest of `repeat` runs of function(), in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def chunked_round_trip(payload, cipher, chunk_size):
+    """Return (encrypt seconds, decrypt seconds) functions for a chunked cipher"""
+    encrypted = {}
+
+    def encrypt():
+        output = io.BytesIO()
+        with EncryptedFileWriter(output, chunk_size=chunk_size, cipher=cipher) as writer:
+            view = memoryview(payload)
+            for offset in range(0, len(payload), chunk_size):
+                writer.write(view[offset:offset + chunk_size])
+        encrypted['data'] = output.getvalue()
+
+    def decrypt():
+        for _ in decrypt_stream(io.BytesIO(encrypted['data'])):
+            pass
+
+    return encrypt, decrypt
+
+
+def legacy_round_trip(payload):
+    encrypted = {}
+
+    def encrypt():
+        encrypted['data'] = encrypt_file_aes(payload)
+
+    def decrypt():
+        decrypt_file_aes(encrypted['data'])
+
+    return encrypt, decrypt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cipher throughput')
+    parser.add_argument('--sizes-mb', type=float, nargs='+', default=[1, 16, 64],
+                        help='payload sizes in MB')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (best is kept)')
+    parser.add_argument('--chunk-kb', type=int, default=Config.ENCRYPTION_CHUNK_SIZE // 1024,
+                        help='chunk size in KB for the chunked format')
+    args = parser.parse_args()
+
+    get_encryption_key()  # keep PBKDF2 out of the measurements
+    chunk_size = args.chunk_kb * 1024
+
+    print("🔐 SecureShare cipher throughput benchmark")
+    print("=" * 64)
+    print(f"{'Cipher':<22} {'Size':>8} {'Encrypt MB/s':>14} {'Decrypt MB/s':>14}")
+    for size_mb in args.sizes_mb:
+        payload = os.urandom(int(size_mb * 1024 * 1024))
+        modes = [(name, chunked_round_trip(payload, name, chunk_size)) for name in available_ciphers()]
+        modes.append(('aes-256-cbc (legacy)', legacy_round_trip(payload)))
+        for name, (encrypt, decrypt) in modes:
+            encrypt_seconds = best_time(encrypt, args.repeat)
+            decrypt_seconds = best_time(decrypt, args.repeat)
+            print(f"{name:<22} {size_mb:>6g}MB {size_mb / encrypt_seconds:>14.1f} "
+                  f"{size_mb / decrypt_seconds:>14.1f}")
+    print(f"\nConfigured cipher: {getattr(Config, 'ENCRYPTION_CIPHER', 'aes-256-gcm')}")
+
+
+if __name__ == '__main__':
+    main()
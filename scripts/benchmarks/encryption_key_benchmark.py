@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request crypto overhead of key derivation.
+
+Compares encrypting/decrypting a typical payload when the AES key is derived
+with PBKDF2 on every call (the old behaviour) against the cached key used by
+get_encryption_key().
+
+Usage:
+    python scripts/benchmarks/encryption_key_benchmark.py [--size-kb 64] [--requests 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import Config
+from app.utils.file_utils import (
+    derive_encryption_key, get_encryption_key, clear_encryption_key_cache,
+    encrypt_file, decrypt_file
+)
+
+
+def time_requests(payload, requests, derive_every_call):
+    """Return the mean seconds spent per encrypt+decrypt round trip"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        if derive_every_call:
+            # Simulate the old behaviour: one PBKDF2 run per encrypt and decrypt
+            derive_encryption_key(Config.ENCRYPTION_KEY)
+            derive_encryption_key(Config.ENCRYPTION_KEY)
+        decrypt_file(encrypt_file(payload))
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AES key derivation overhead')
+    parser.add_argument('--size-kb', type=int, default=64, help='payload size per request in KB')
+    parser.add_argument('--requests', type=int, default=20, help='number of simulated requests')
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+
+    clear_encryption_key_cache()
+    start = time.perf_counter()
+    get_encryption_key()
+    warmup = time.perf_counter() - start
+
+    uncached = time_requests(payload, args.requests, derive_every_call=True)
+    cached = time_requests(payload, args.requests, derive_every_call=False)
+
+    print("🔐 SecureShare key derivation benchmark")
+    print("=" * 40)
+    print(f"Payload size:            {args.size_kb} KB")
+    print(f"Requests:                {args.requests}")
+    print(f"One-time key derivation: {warmup * 1000:.2f} ms")
+    print(f"Per request (before):    {uncached * 1000:.2f} ms")
+    print(f"Per request (after):     {cached * 1000:.2f} ms")
+    if cached:
+        print(f"Speedup:                 {uncached / cached:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark chunked encryption and decryption throughput against worker count.
+
+Encrypts a payload with EncryptedFileWriter and streams it back with
+decrypt_stream for each worker count, with the parallel threshold at 0 so
+every chunk goes through the thread pool, and reports MB/s and speedup
+over a single thread. Use it to set ENCRYPTION_WORKERS.
+
+Usage:
+    python scripts/benchmarks/parallel_encryption_benchmark.py [--size-mb 64] [--workers 1 2 4 8]
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from config import Config
+from app.utils.file_utils import EncryptedFileWriter, EncryptedFileReader, get_encryption_key
+
+
+def encrypt(payload, workers, chunk_size, cipher):
+    output = io.BytesIO()
+    with EncryptedFileWriter(output, chunk_size=chunk_size, cipher=cipher,
+                             workers=workers, parallel_threshold=0) as writer:
+        view = memoryview(payload)
+        for offset in range(0, len(payload), 1024 * 1024):
+            writer.write(view[offset:offset + 1024 * 1024])
+    return output.getvalue()
+
+
+def decrypt(encrypted, workers):
+    reader = EncryptedFileReader(io.BytesIO(encrypted), workers=workers, parallel_threshold=0)
+    for _ in reader.iter_chunks():
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel chunk encryption')
+    parser.add_argument('--size-mb', type=int, default=64, help='payload size in MB')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='worker counts to try')
+    parser.add_argument('--chunk-kb', type=int, default=Config.ENCRYPTION_CHUNK_SIZE // 1024,
+                        help='chunk size in KB')
+    parser.add_argument('--cipher', default=getattr(Config, 'ENCRYPTION_CIPHER', 'aes-256-gcm'))
+    args = parser.parse_args()
+
+    get_encryption_key()  # keep PBKDF2 out of the measurements
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    chunk_size = args.chunk_kb * 1024
+
+    print("⚙️ SecureShare parallel encryption benchmark")
+    print("=" * 56)
+    print(f"Payload: {args.size_mb} MB, chunks: {args.chunk_kb} KB, cipher: {args.cipher}, "
+          f"CPUs: {os.cpu_count()}")
+    print(f"{'Workers':>7} {'Encrypt MB/s':>14} {'Decrypt MB/s':>14} {'Speedup':>9}")
+    baseline = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        encrypted = encrypt(payload, workers, chunk_size, args.cipher)
+        encrypt_rate = args.size_mb / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decrypt(encrypted, workers)
+        decrypt_rate = args.size_mb / (time.perf_counter() - start)
+
+        baseline = baseline or encrypt_rate
+        print(f"{workers:>7} {encrypt_rate:>14.1f} {decrypt_rate:>14.1f} {encrypt_rate / baseline:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark /shared/<token> under a flood of random (invalid) tokens.
+
+Seeds an in-memory database with shared files, then requests random tokens
+through the test client with the share token filter off and on, reporting
+requests per second and the number of SQL statements executed.
+
+Usage:
+    python scripts/benchmarks/share_token_flood_benchmark.py [--shares 10000] [--requests 2000]
+"""
+
+import argparse
+import os
+import secrets
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import event
+
+from config import Config
+from app import create_app
+from app.models import db, User, File
+from app.utils.bloom_filter import share_token_filter
+from app.utils.share_cache import share_cache
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    WTF_CSRF_ENABLED = False
+
+
+def seed(shares):
+    user = User(username='bench', email='bench@example.com')
+    user.password = 'benchpass123'
+    db.session.add(user)
+    db.session.flush()
+    for i in range(shares):
+        db.session.add(File(filename=f'f{i}', original_filename=f'f{i}.txt',
+                            encrypted_path=f'/tmp/f{i}', file_size=1, mime_type='text/plain',
+                            owner_id=user.id, is_shared=True, share_token=secrets.token_urlsafe(32)))
+    db.session.commit()
+
+
+def flood(client, requests):
+    """Return (requests per second, SQL statements) for random-token requests"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    tokens = [secrets.token_urlsafe(32) for _ in range(requests)]
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        start = time.perf_counter()
+        for token in tokens:
+            client.get(f'/shared/{token}')
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return requests / elapsed, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark invalid share token floods')
+    parser.add_argument('--shares', type=int, default=10000, help='number of active share links')
+    parser.add_argument('--requests', type=int, default=2000, help='random-token requests per run')
+    args = parser.parse_args()
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        seed(args.shares)
+        # No cookie jar: flashed messages would pile up in one session
+        client = app.test_client(use_cookies=False)
+
+        share_token_filter.enabled = False
+        before_rps, before_queries = flood(client, args.requests)
+
+        share_token_filter.enabled = True
+        share_cache.clear()
+        start = time.perf_counter()
+        share_token_filter.rebuild()
+        build_ms = (time.perf_counter() - start) * 1000
+        after_rps, after_queries = flood(client, args.requests)
+        stats = share_token_filter.stats()
+
+    print("🛡️ SecureShare share token flood benchmark")
+    print("=" * 40)
+    print(f"Active shares:           {args.shares}")
+    print(f"Random-token requests:   {args.requests}")
+    print(f"Filter build:            {build_ms:.1f} ms, {stats['size_bytes'] / 1024:.1f} KB")
+    print(f"Without filter:          {before_rps:.0f} req/s, {before_queries} queries")
+    print(f"With filter:             {after_rps:.0f} req/s, {after_queries} queries")
+    print(f"Rejected by filter:      {stats['rejected']}")
+    if before_rps:
+        print(f"Speedup:                 {after_rps / before_rps:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Migration script for the content-addressed blob store.
+Creates the Blob table (or adds Blob.codec to an existing one) and adds
+File.blob_id. Files uploaded before the migration keep blob_id = NULL and
+are still read from their own path.
+"""
+
+import os
+import sys
+from sqlalchemy import inspect, text
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, Blob
+
+
+def migrate_blob_store():
+    """Create the blob table and the file.blob_id column"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+
+            if 'blob' not in inspector.get_table_names():
+                print("➕ Creating blob table...")
+                Blob.__table__.create(db.engine)
+            elif 'codec' not in {column['name'] for column in inspector.get_columns('blob')}:
+                print("➕ Adding column codec...")
+                db.session.execute(text("ALTER TABLE blob ADD COLUMN codec VARCHAR(16) NOT NULL DEFAULT 'none'"))
+            else:
+                print("ℹ️  Table blob already exists, skipping...")
+
+            columns = {column['name'] for column in inspector.get_columns('file')}
+            if 'blob_id' not in columns:
+                print("➕ Adding column blob_id...")
+                db.session.execute(text('ALTER TABLE file ADD COLUMN blob_id INTEGER REFERENCES blob (id)'))
+                db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_file_blob_id ON file (blob_id)'))
+            else:
+                print("ℹ️  Column blob_id already exists, skipping...")
+
+            db.session.commit()
+            print("🎉 Migration completed successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_blob_store():
+        sys.exit(1)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration script to build the indexes declared on the File, AccessLog and
+Blob models (hot dashboard, files, view_file and profile queries, and the
+path-ordered scans of the storage reconciler).
+
+Indexes that already exist are skipped. On PostgreSQL they are built with
+CREATE INDEX CONCURRENTLY so reads and writes continue while they build;
+other databases use a plain CREATE INDEX.
+"""
+
+import os
+import sys
+from sqlalchemy import inspect, text
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, File, AccessLog, Blob
+
+
+def build_index(connection, index):
+    """Create a single index, online where the database supports it"""
+    if connection.dialect.name == 'postgresql':
+        columns = ', '.join(column.name for column in index.columns)
+        connection.execute(text(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} '
+            f'ON "{index.table.name}" ({columns})'
+        ))
+    else:
+        index.create(connection)
+
+
+def migrate_indexes():
+    """Create any missing File/AccessLog/Blob indexes"""
+    app = create_app()
+
+    with app.app_context():
+        # CONCURRENTLY cannot run inside a transaction block
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            inspector = inspect(connection)
+            for model in (File, AccessLog, Blob):
+                table = model.__table__
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in sorted(table.indexes, key=lambda ix: ix.name):
+                    if index.name in existing:
+                        print(f"ℹ️  {index.name} already exists, skipping...")
+                        continue
+                    print(f"➕ Building {index.name} on {table.name}...")
+                    try:
+                        build_index(connection, index)
+                    except Exception as e:
+                        print(f"❌ Failed to build {index.name}: {e}")
+                        return False
+                    print(f"✅ Built {index.name}")
+
+    print("🎉 Index migration completed successfully!")
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_indexes():
+        sys.exit(1)
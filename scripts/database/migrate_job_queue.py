@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration script for the background job queue.
+Creates the Job table, or adds the heartbeat_at and dedupe_key columns to
+an existing one. Pending tiering jobs get their dedupe_key from their payload.
+"""
+
+import json
+import os
+import sys
+from sqlalchemy import inspect, text
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, Job
+
+
+def migrate_job_queue():
+    """Create the job table, or add the columns it gained since"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            if Job.__table__.name in inspect(db.engine).get_table_names():
+                print(f"ℹ️  Table {Job.__table__.name} already exists")
+                columns = [column['name'] for column in inspect(db.engine).get_columns(Job.__table__.name)]
+                if 'heartbeat_at' not in columns:
+                    print("➕ Adding column heartbeat_at...")
+                    db.session.execute(text("ALTER TABLE job ADD COLUMN heartbeat_at DATETIME"))
+                    db.session.commit()
+                else:
+                    print("ℹ️  Column heartbeat_at already exists, skipping...")
+                if 'dedupe_key' not in columns:
+                    print("➕ Adding column dedupe_key...")
+                    db.session.execute(text("ALTER TABLE job ADD COLUMN dedupe_key VARCHAR(255)"))
+                    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_job_kind_dedupe_key "
+                                            "ON job (kind, dedupe_key)"))
+                    keys = {'promote_file': lambda payload: str(payload['file_id']),
+                            'drop_tier_copy': lambda payload: payload['path']}
+                    pending = Job.query.filter(Job.kind.in_(keys), Job.status != 'succeeded').all()
+                    for job in pending:
+                        job.dedupe_key = keys[job.kind](json.loads(job.payload))
+                    db.session.commit()
+                    print(f"✅ Keyed {len(pending)} pending tiering jobs")
+                else:
+                    print("ℹ️  Column dedupe_key already exists, skipping...")
+            else:
+                print(f"➕ Creating {Job.__table__.name} table...")
+                Job.__table__.create(db.engine)
+
+            print("🎉 Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_job_queue():
+        sys.exit(1)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Migration script for the sharded storage layout.
+Moves blobs from blobs/<ab>/<digest> to blobs/<ab>/<cd>/<digest> and legacy
+files from the flat upload folder to <ab>/<cd>/<name>, rewriting Blob.path
+and File.encrypted_path. Runs online: files are linked under their new
+name before the database is repointed and the old name removed, so the app
+can keep serving while this runs. Safe to interrupt and run again.
+
+Usage:
+    python scripts/database/migrate_storage_layout.py [--batch-size N] [--limit N] [--pause SECONDS]
+"""
+
+import argparse
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.utils.storage_layout import relayout_storage
+
+
+def migrate_storage_layout(batch_size, limit, pause):
+    """Move stored files into the sharded layout in batches"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("📦 Moving files into the sharded layout...")
+            moved, moved_bytes = relayout_storage(batch_size=batch_size, limit=limit, pause=pause)
+            print(f"✅ Moved {moved} file(s), {moved_bytes / 1024 / 1024:.1f} MB")
+            print("🎉 Migration completed successfully!")
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move stored files into the sharded layout')
+    parser.add_argument('--batch-size', type=int, default=200, help='files moved per transaction')
+    parser.add_argument('--limit', type=int, default=None, help='stop after moving this many files')
+    parser.add_argument('--pause', type=float, default=0, help='seconds to sleep between batches')
+    args = parser.parse_args()
+    if not migrate_storage_layout(args.batch_size, args.limit, args.pause):
+        sys.exit(1)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration script for hot/cold storage tiering.
+Adds File.storage_tier; every existing file starts on the hot tier.
+"""
+
+import os
+import sys
+from sqlalchemy import inspect, text
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db
+
+
+def migrate_storage_tiers():
+    """Add the file.storage_tier column"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('file')}
+            if 'storage_tier' not in columns:
+                print("➕ Adding column storage_tier...")
+                db.session.execute(text("ALTER TABLE file ADD COLUMN storage_tier VARCHAR(8) NOT NULL DEFAULT 'hot'"))
+            else:
+                print("ℹ️  Column storage_tier already exists, skipping...")
+
+            db.session.commit()
+            print("🎉 Migration completed successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_storage_tiers():
+        sys.exit(1)
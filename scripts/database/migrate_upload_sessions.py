@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration script for resumable uploads.
+Creates the UploadSession and UploadPart tables. Requires the blob store
+migration (migrate_blob_store.py) to have been run first.
+"""
+
+import os
+import sys
+from sqlalchemy import inspect
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, UploadSession, UploadPart
+
+
+def migrate_upload_sessions():
+    """Create the upload session tables"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            tables = set(inspect(db.engine).get_table_names())
+            for model in (UploadSession, UploadPart):
+                if model.__table__.name in tables:
+                    print(f"ℹ️  Table {model.__table__.name} already exists, skipping...")
+                else:
+                    print(f"➕ Creating {model.__table__.name} table...")
+                    model.__table__.create(db.engine)
+
+            print("🎉 Migration completed successfully!")
+
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_upload_sessions():
+        sys.exit(1)
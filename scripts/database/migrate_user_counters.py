@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the denormalized usage counters to the User table.
+Adds storage_bytes, file_count, total_downloads and active_shares, then
+fills them in from the existing File and AccessLog rows.
+"""
+
+import os
+import sys
+from sqlalchemy import inspect, text
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app import create_app
+from app.models import db, User
+
+
+def migrate_user_counters():
+    """Add the counter columns to the User table and populate them"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            columns = {column['name'] for column in inspect(db.engine).get_columns('user')}
+
+            fields_to_add = [
+                ('storage_bytes', 'BIGINT'),
+                ('file_count', 'INTEGER'),
+                ('total_downloads', 'INTEGER'),
+                ('active_shares', 'INTEGER'),
+            ]
+
+            for field_name, field_type in fields_to_add:
+                if field_name not in columns:
+                    print(f"➕ Adding column {field_name}...")
+                    db.session.execute(text(
+                        f'ALTER TABLE "user" ADD COLUMN {field_name} {field_type} NOT NULL DEFAULT 0'
+                    ))
+                else:
+                    print(f"ℹ️  Column {field_name} already exists, skipping...")
+
+            updated = User.reconcile_counters()
+            db.session.commit()
+            print(f"✅ Counters populated for {updated} user(s)")
+            print("🎉 Migration completed successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Migration failed: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_user_counters():
+        sys.exit(1)
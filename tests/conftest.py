@@ -1,23 +1,43 @@
+import io
 import pytest
 import sys
 import os
 
+from flask import g
+
 # Add the parent directory to Python path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from config import Config
 from app import create_app, db
-from app.models import User
+from app.models import User, File
+from app.utils.audit_log import access_log_buffer
+from app.utils.counters import download_counter
+
+
+class TestConfig(Config):
+    """Configuration used by the test suite."""
+    TESTING = True
+    # Must be set before create_app(): the engine is built in db.init_app()
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    # Access logs are flushed explicitly with access_log_buffer.flush()
+    ACCESS_LOG_FLUSH_INTERVAL = 0
+    # Background jobs are run explicitly with job_runner.run_pending()
+    JOB_WORKERS = 0
+    JOB_HEARTBEAT_INTERVAL = 0
+
 
 @pytest.fixture
 def app():
     """Create and configure a new app instance for each test."""
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app = create_app(TestConfig)
     
     with app.app_context():
         db.create_all()
         yield app
+        # Write queued rows now rather than at exit, after the tables are gone
+        access_log_buffer.flush()
+        download_counter.flush()
         db.drop_all()
 
 @pytest.fixture
@@ -49,3 +69,42 @@ def admin_user(app):
         db.session.add(admin)
         db.session.commit()
         return admin
+
+@pytest.fixture
+def upload_folder(app, tmp_path):
+    """Store uploaded files in a temporary directory."""
+    folder = tmp_path / 'uploads'
+    app.config['UPLOAD_FOLDER'] = str(folder)
+    return folder
+
+@pytest.fixture
+def auth_client(client, test_user):
+    """A test client logged in as the test user."""
+    user = User.query.filter_by(username='testuser').first()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+@pytest.fixture
+def login(client):
+    """Log the test client in as the named user; returns the user."""
+    def login(username):
+        user = User.query.filter_by(username=username).first()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        # The fixture's app context (and so g) outlives each request, and
+        # Flask-Login caches the loaded user there
+        g.pop('_login_user', None)
+        return user
+    return login
+
+@pytest.fixture
+def upload(client):
+    """Upload bytes as the logged-in user; returns the newest File."""
+    def upload(payload, filename='report.txt'):
+        client.post('/upload', data={'file': (io.BytesIO(payload), filename)},
+                    content_type='multipart/form-data')
+        return File.query.order_by(File.id.desc()).first()
+    return upload
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Multi-file batch upload tests
+"""
+
+import io
+import os
+import sys
+
+from sqlalchemy import event
+
+sys.path.append('.')
+
+from app.models import db, User, File, Blob, AccessLog
+from app.utils.audit_log import access_log_buffer
+
+
+def _batch(client, files, field='files'):
+    data = {field: [(io.BytesIO(payload), name) for name, payload in files]}
+    return client.post('/upload/batch', data=data, content_type='multipart/form-data')
+
+
+def test_batch_reports_each_file(app, client, test_user, upload_folder, login):
+    """Valid files are stored in one transaction; rejected ones are reported alongside"""
+    app.config['UPLOAD_BATCH_WORKERS'] = 4
+    user = login('testuser')
+    files = [(f'photo{i}.jpg', os.urandom(20 * 1024 + i)) for i in range(5)]
+
+    commits = []
+    on_commit = commits.append
+    event.listen(db.engine, 'commit', on_commit)
+    try:
+        response = _batch(client, files + [('script.exe', b'MZ')])
+    finally:
+        event.remove(db.engine, 'commit', on_commit)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['uploaded'], body['failed']) == (5, 1)
+    assert body['results'][-1] == {'filename': 'script.exe', 'ok': False, 'error': 'File type not allowed.'}
+    assert len(commits) == 1
+
+    for (name, payload), result in zip(files, body['results']):
+        assert result['ok'] and result['size'] == len(payload)
+        assert client.get(f"/download/{result['file_id']}").get_data() == payload
+
+    user = db.session.get(User, user.id)
+    db.session.refresh(user)
+    assert user.file_count == 5
+    assert user.storage_bytes == sum(len(payload) for _, payload in files)
+    access_log_buffer.flush()
+    assert AccessLog.query.filter_by(action='upload').count() == 5
+
+
+def test_duplicates_within_a_batch_share_a_blob(app, client, test_user, upload_folder, login):
+    """Files staged concurrently still deduplicate against each other"""
+    app.config['UPLOAD_BATCH_WORKERS'] = 4
+    login('testuser')
+    payload = os.urandom(50 * 1024)
+    body = _batch(client, [('a.zip', payload), ('b.zip', payload), ('c.txt', b'notes ' * 500)]).get_json()
+    assert body['uploaded'] == 3
+    assert Blob.query.filter_by(size=len(payload)).one().refcount == 2
+    assert Blob.query.count() == 2
+    # No staging files are left behind
+    assert os.listdir(upload_folder / 'blobs' / 'incoming') == []
+
+
+def test_form_post_with_several_files(app, client, test_user, upload_folder, login):
+    """The upload form stores every selected file, not just the first"""
+    login('testuser')
+    response = _batch(client, [('one.txt', b'first'), ('two.txt', b'second')], field='file')
+    assert response.status_code == 200  # the batch endpoint also accepts the form's field name
+
+    data = {'file': [(io.BytesIO(b'third'), 'three.txt'), (io.BytesIO(b'fourth'), 'four.txt')]}
+    response = client.post('/upload', data=data, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert File.query.count() == 4
+
+
+def test_batch_limits(app, client, test_user, upload_folder, login):
+    """Empty and oversized batches are refused"""
+    app.config['UPLOAD_BATCH_MAX_FILES'] = 2
+    login('testuser')
+    assert client.post('/upload/batch').status_code == 400
+    response = _batch(client, [(f'{i}.txt', b'x') for i in range(3)])
+    assert response.status_code == 413
+    assert _batch(client, [('bad.exe', b'x')]).status_code == 400
+    assert File.query.count() == 0
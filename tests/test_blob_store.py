@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Content-addressed blob store tests
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.append('.')
+
+from app.models import db, File, Blob
+from app.utils.blob_store import collect_garbage, sweep_orphan_files
+from app.utils.jobs import job_runner
+
+
+def _stored_blobs(upload_folder):
+    return [name for _, _, names in os.walk(upload_folder / 'blobs') for name in names]
+
+
+def test_identical_uploads_share_one_blob(app, client, test_user, admin_user, upload_folder, login, upload):
+    """The same content uploaded by several users is stored once"""
+    payload = os.urandom(100 * 1024)
+    login('testuser')
+    upload(payload)
+    upload(payload, 'copy.zip')
+    admin = login('admin')
+    upload(payload)
+    upload(b'something else')
+
+    blob = Blob.query.filter_by(size=len(payload)).one()
+    assert blob.refcount == 3
+    assert Blob.query.count() == 2
+    assert len(_stored_blobs(upload_folder)) == 2
+    assert {f.encrypted_path for f in blob.files} == {blob.path}
+    # Keyed digest: a plain hash of a known file does not reveal it is stored
+    assert blob.digest != hashlib.sha256(payload).hexdigest()
+
+    response = client.get(f'/download/{File.query.filter_by(owner_id=admin.id, blob_id=blob.id).one().id}')
+    assert response.get_data() == payload
+
+
+def test_deleting_files_releases_references(app, client, test_user, upload_folder, login, upload):
+    """The blob is removed from disk only when its last file is deleted"""
+    login('testuser')
+    upload(b'shared payload')
+    upload(b'shared payload', 'again.zip')
+    first, second = File.query.order_by(File.id).all()
+    blob_path = first.encrypted_path
+
+    client.post(f'/delete/{first.id}')
+    job_runner.run_pending()
+    assert Blob.query.one().refcount == 1
+    assert os.path.exists(blob_path)
+
+    client.post(f'/delete/{second.id}')
+    # Removing the blob is deferred to a background job
+    assert os.path.exists(blob_path)
+    job_runner.run_pending()
+    assert Blob.query.count() == 0
+    assert not os.path.exists(blob_path)
+
+
+def test_admin_user_deletion_releases_references(app, client, test_user, admin_user, upload_folder, login, upload):
+    """Deleting a user drops their references and collects blobs nobody else uses"""
+    user = login('testuser')
+    upload(b'only mine')
+    upload(b'ours')
+    login('admin')
+    upload(b'ours')
+
+    client.post(f'/admin/users/{user.id}/delete')
+    job_runner.run_pending()
+    assert File.query.count() == 1
+    assert Blob.query.one().refcount == 1
+    assert len(_stored_blobs(upload_folder)) == 1
+
+
+def test_garbage_collection_and_orphan_sweep(app, client, test_user, upload_folder, login, upload):
+    """A full collection removes unreferenced rows; the sweep removes stray files"""
+    login('testuser')
+    upload(b'data')
+    blob = Blob.query.one()
+    blob.refcount = 0
+    stored_size = blob.stored_size
+    db.session.commit()
+    stray = upload_folder / 'blobs' / 'ff' / 'stray'
+    stray.parent.mkdir(parents=True, exist_ok=True)
+    stray.write_bytes(b'x' * 10)
+
+    assert collect_garbage() == (1, stored_size)
+    assert sweep_orphan_files(str(upload_folder), min_age=0) == (1, 10)
+    assert _stored_blobs(upload_folder) == []
+
+
+def test_compressible_uploads_are_compressed(app, client, test_user, upload_folder, login, upload):
+    """Text is stored compressed and served back unchanged; a zip is stored as is"""
+    login('testuser')
+    text = b'SecureShare quarterly report line\n' * 5000
+    upload(text, 'report.txt')
+    upload(os.urandom(2048), 'archive.zip')
+
+    text_file = File.query.filter_by(original_filename='report.txt').one()
+    assert text_file.blob.codec == 'zlib'
+    assert text_file.blob.stored_size < len(text) / 10
+    assert File.query.filter_by(original_filename='archive.zip').one().blob.codec == 'none'
+
+    assert client.get(f'/download/{text_file.id}').get_data() == text
+    response = client.get(f'/download/{text_file.id}', headers={'Range': 'bytes=70000-70099'})
+    assert response.status_code == 206
+    assert response.get_data() == text[70000:70100]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Share token Bloom filter tests
+"""
+
+import secrets
+import sys
+import threading
+
+sys.path.append('.')
+
+from app.models import db, User, File
+from app.utils.bloom_filter import BloomFilter, share_token_filter
+from tests.test_dashboard import count_queries
+
+
+def _share_file(name='shared.txt'):
+    user = User.query.filter_by(username='testuser').first()
+    file_record = File(filename=name, original_filename=name, encrypted_path=f'/tmp/{name}',
+                       file_size=1, mime_type='text/plain', owner_id=user.id)
+    db.session.add(file_record)
+    token = file_record.generate_share_token()
+    db.session.commit()
+    return token
+
+
+def _enable_filter(app):
+    app.config['SHARE_FILTER_ENABLED'] = True
+    share_token_filter.init_app(app)
+
+
+def test_no_false_negatives_and_low_false_positive_rate():
+    """Every added token is found; random tokens rarely are"""
+    bloom = BloomFilter(5000, error_rate=0.01)
+    tokens = [secrets.token_urlsafe(32) for _ in range(5000)]
+    for token in tokens:
+        bloom.add(token)
+
+    assert all(token in bloom for token in tokens)
+    false_positives = sum(secrets.token_urlsafe(32) in bloom for _ in range(5000))
+    assert false_positives < 5000 * 0.03
+
+
+def test_unknown_token_is_rejected_without_a_query(app, client, test_user):
+    """Random tokens get the invalid-link response without touching the database"""
+    _enable_filter(app)
+    _share_file()
+    share_token_filter.rebuild()
+
+    with count_queries() as statements:
+        response = client.get(f'/shared/{secrets.token_urlsafe(32)}')
+    assert response.status_code == 302
+    assert statements == []
+    assert share_token_filter.stats()['rejected'] == 1
+
+
+def test_new_shares_are_added_to_the_built_filter(app, test_user):
+    """Tokens created after a rebuild pass the filter straight away"""
+    _enable_filter(app)
+    existing = _share_file('old.txt')
+    assert share_token_filter.rebuild() == 1
+    new = _share_file('new.txt')
+
+    assert share_token_filter.might_contain(existing)
+    assert share_token_filter.might_contain(new)
+    assert share_token_filter.stats()['rebuilds'] == 1
+
+
+def test_filter_is_built_outside_the_request(app, test_user, monkeypatch):
+    """Requests never wait for a build; every token passes until the first one is ready"""
+    token = _share_file()
+    _enable_filter(app)
+    release = threading.Event()
+    rebuild = share_token_filter.rebuild
+    monkeypatch.setattr(share_token_filter, 'rebuild', lambda: release.wait(5) and rebuild())
+
+    assert share_token_filter.might_contain(secrets.token_urlsafe(32))
+    assert share_token_filter.stats()['rebuilds'] == 0
+    release.set()
+    with share_token_filter._rebuild_lock:  # Held until the build thread is done
+        pass
+    assert share_token_filter.stats()['rebuilds'] == 1
+    assert share_token_filter.might_contain(token)
+    assert not share_token_filter.might_contain(secrets.token_urlsafe(32))
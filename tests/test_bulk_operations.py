@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Bulk delete / share / unshare tests
+"""
+
+import os
+import sys
+
+sys.path.append('.')
+
+from app.models import db, User, File, Blob
+from app.utils.jobs import job_runner
+from tests.test_dashboard import count_queries
+
+
+def _counters(user_id):
+    user = db.session.get(User, user_id)
+    db.session.refresh(user)
+    return user.file_count, user.storage_bytes, user.active_shares
+
+
+def test_bulk_delete_defers_disk_removal(app, client, test_user, admin_user, upload_folder, login, upload):
+    """Rows go in one transaction; blobs leave the disk when the purge job runs"""
+    login('admin')
+    foreign_id = upload(b'admin data').id
+
+    user = login('testuser')
+    ids = [upload(b'payload one').id, upload(b'payload two').id, upload(b'keep me').id]
+    doomed_paths = [db.session.get(File, file_id).encrypted_path for file_id in ids[:2]]
+    for file_id in (ids[0], ids[0], ids[2]):
+        client.get(f'/download/{file_id}')
+
+    with count_queries() as statements:
+        response = client.post('/files/bulk/delete', json={'file_ids': ids[:2] + [foreign_id, 999]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['processed'] == 2
+    assert body['not_found'] == [foreign_id, 999]
+    # One ownership query, no per-file loads
+    assert sum(1 for statement in statements if statement.startswith('SELECT file.id')) == 1
+
+    assert {f.id for f in File.query} == {foreign_id, ids[2]}
+    assert _counters(user.id)[:2] == (1, len(b'keep me'))
+    assert db.session.get(User, user.id).total_downloads == 1  # Those of the file kept
+    assert all(os.path.exists(path) for path in doomed_paths)
+
+    assert job_runner.run_pending() == 1
+    assert not any(os.path.exists(path) for path in doomed_paths)
+    assert Blob.query.count() == 2
+
+
+def test_bulk_share_and_unshare(app, client, test_user, upload_folder, login, upload):
+    """Every selected file gets its own working link, and loses it again"""
+    user = login('testuser')
+    ids = [upload(b'alpha').id, upload(b'beta').id]
+
+    body = client.post('/files/bulk/share', json={'file_ids': ids}).get_json()
+    assert body['processed'] == 2
+    links = body['links']
+    assert len(set(links.values())) == 2
+    assert _counters(user.id)[2] == 2
+    token = db.session.get(File, ids[1]).share_token
+    assert links[str(ids[1])].endswith(token)
+    assert client.get(f'/shared/{token}').get_data() == b'beta'
+
+    # Sharing again keeps the existing links
+    again = client.post('/files/bulk/share', json={'file_ids': ids}).get_json()
+    assert again['links'] == links
+    assert _counters(user.id)[2] == 2
+
+    body = client.post('/files/bulk/unshare', json={'file_ids': ids}).get_json()
+    assert body['processed'] == 2
+    assert _counters(user.id)[2] == 0
+    assert client.get(f'/shared/{token}').status_code == 302
+
+
+def test_bulk_form_posts_redirect(app, client, test_user, upload_folder, login, upload):
+    """The file list's checkboxes post a form and get a flash message back"""
+    login('testuser')
+    ids = [upload(b'one').id, upload(b'two').id]
+
+    response = client.post('/files/bulk/delete', data={'file_ids': ids}, follow_redirects=True)
+    assert b'2 file(s) deleted successfully!' in response.data
+    assert File.query.count() == 0
+
+    assert client.post('/files/bulk/delete', json={'file_ids': []}).status_code == 400
+    assert client.post('/files/bulk/rename', json={'file_ids': ids}).status_code == 404
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Decrypted content cache tests
+"""
+
+import os
+import stat
+import sys
+import time
+
+sys.path.append('.')
+
+from app.models import db
+from app.utils.content_cache import DecryptedContentCache, content_cache
+
+
+def _loader(data, loads):
+    def load():
+        loads.append(data)
+        return iter([data[:4], data[4:]])
+    return load
+
+
+def _read(cache, file_id, data, loads, location='/stored'):
+    return b''.join(cache.iter_file(file_id, location, len(data), _loader(data, loads), read_size=3))
+
+
+def test_lru_eviction_by_bytes_and_metrics():
+    """The least recently used file goes once the cached bytes pass the limit"""
+    cache = DecryptedContentCache(max_bytes=20)
+    loads = []
+
+    assert _read(cache, 1, b'a' * 8, loads) == b'a' * 8
+    assert _read(cache, 2, b'b' * 8, loads) == b'b' * 8
+    assert _read(cache, 1, b'a' * 8, loads) == b'a' * 8   # hit, 1 becomes most recent
+    _read(cache, 3, b'c' * 8, loads)                        # evicts 2
+    _read(cache, 1, b'a' * 8, loads)
+    _read(cache, 2, b'b' * 8, loads)
+
+    assert loads == [b'a' * 8, b'b' * 8, b'c' * 8, b'b' * 8]
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == (2, 16)
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 4, 2)
+    assert stats['hit_rate'] == 2 / 6
+
+
+def test_ttl_ranges_and_partial_reads():
+    cache = DecryptedContentCache(max_bytes=100, ttl=0.05)
+    loads = []
+    data = b'0123456789'
+
+    # A download abandoned halfway caches nothing
+    chunks = cache.iter_file(1, '/stored', len(data), _loader(data, loads))
+    next(chunks)
+    chunks.close()
+    assert cache.stats()['entries'] == 0
+
+    _read(cache, 1, data, loads)
+    assert b''.join(cache.iter_range(1, '/stored', 2, 9, _loader(data, loads), read_size=4)) == b'2345678'
+    assert len(loads) == 2
+    # A new stored location is a new version of the content
+    _read(cache, 1, data, loads, location='/moved')
+    assert len(loads) == 3
+
+    time.sleep(0.06)
+    _read(cache, 1, data, loads)
+    assert len(loads) == 4
+    assert cache.stats()['expirations'] == 1
+
+
+def test_disk_entries_are_private(tmp_path):
+    """Plaintext on disk sits in a 0700 directory as 0600 files, removed on invalidation"""
+    cache = DecryptedContentCache()
+
+    class App:
+        config = {'CONTENT_CACHE_SIZE': 1024, 'CONTENT_CACHE_PATH': str(tmp_path / 'tmpfs')}
+        extensions = {}
+
+    cache.init_app(App)
+    loads = []
+    data = b'secret plaintext'
+    _read(cache, 7, data, loads)
+    assert _read(cache, 7, data, loads) == data and len(loads) == 1
+
+    names = os.listdir(cache.directory)
+    assert len(names) == 1
+    assert stat.S_IMODE(os.stat(cache.directory).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(os.path.join(cache.directory, names[0])).st_mode) == 0o600
+
+    cache.invalidate_file(7)
+    assert os.listdir(cache.directory) == []
+    assert cache.stats()['bytes'] == 0
+
+
+def test_shared_downloads_hit_the_cache_until_revoked(app, client, test_user, upload_folder, login, upload):
+    app.config['CONTENT_CACHE_SIZE'] = 1024 * 1024
+    content_cache.init_app(app)
+    login('testuser')
+
+    payload = b'viral content ' * 1000
+    file_record = upload(payload, 'viral.txt')
+    token = file_record.generate_share_token()
+    db.session.commit()
+    file_id = file_record.id
+
+    assert client.get(f'/shared/{token}').get_data() == payload
+    assert client.get(f'/shared/{token}').get_data() == payload
+    partial = client.get(f'/shared/{token}', headers={'Range': 'bytes=100-199'})
+    assert partial.status_code == 206 and partial.get_data() == payload[100:200]
+    stats = content_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+
+    client.post(f'/share/{file_id}')   # revoke
+    assert content_cache.stats()['entries'] == 0
+
+    assert client.get(f'/download/{file_id}').get_data() == payload
+    assert content_cache.stats()['entries'] == 1
+    client.post(f'/delete/{file_id}')
+    assert content_cache.stats()['entries'] == 0
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Dashboard statistics tests for SecureShare application
+"""
+
+import sys
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+sys.path.append('.')
+
+from app.models import db, User, File, AccessLog
+from app.utils.audit_log import access_log_buffer
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _add_files(user, names, shared=(), size=1024):
+    files = []
+    for name in names:
+        file_record = File(filename=f'stored_{name}', original_filename=name,
+                           encrypted_path=f'/tmp/{name}', file_size=size,
+                           mime_type='application/octet-stream', owner_id=user.id,
+                           is_shared=name in shared)
+        db.session.add(file_record)
+        files.append(file_record)
+    db.session.flush()
+    for file_record in files:
+        db.session.add(AccessLog(action='upload', user_id=user.id, file_id=file_record.id))
+        db.session.add(AccessLog(action='download', user_id=user.id, file_id=file_record.id))
+    User.reconcile_counters([user.id])
+    db.session.commit()
+    return files
+
+
+def test_dashboard_stats_are_aggregated(auth_client):
+    """Storage, category and activity stats are computed correctly in SQL"""
+    user = User.query.filter_by(username='testuser').first()
+    _add_files(user, ['a.mp3', 'b.WAV', 'c.png', 'd.pdf', 'e.zip', 'noext'],
+               shared=('c.png', 'd.pdf'), size=512 * 1024)
+
+    for name, category in db.session.query(File.original_filename, File.category):
+        assert category == File(original_filename=name).category
+
+    response = auth_client.get('/dashboard')
+    assert response.status_code == 200
+    context = response.data.decode()
+    assert 'data-target="6"' in context   # total files and downloads
+    assert 'data-target="2"' in context   # active shares
+    assert '3.0' in context               # storage used in MB
+
+
+def test_dashboard_query_count_is_constant(app, auth_client):
+    """The number of queries does not grow with the number of files"""
+    user = User.query.filter_by(username='testuser').first()
+    _add_files(user, ['first.txt'])
+
+    db.session.expire_all()
+    with count_queries() as small:
+        assert auth_client.get('/dashboard').status_code == 200
+
+    _add_files(user, [f'bulk_{i}.{ext}' for i in range(40) for ext in ('mp3', 'jpg', 'doc')])
+
+    db.session.expire_all()
+    with count_queries() as large:
+        assert auth_client.get('/dashboard').status_code == 200
+
+    # user loader, recent files, category counts, recent activity, plus the
+    # access log count in the shared footer
+    assert len(small) == 5
+    assert len(large) == 5
+
+
+def test_counters_follow_file_operations(auth_client, upload_folder):
+    """Upload, share, download and delete keep the counters equal to a full recount"""
+    import io
+    for name, size in (('a.txt', 1000), ('b.txt', 2500)):
+        auth_client.post('/upload', data={'file': (io.BytesIO(b'x' * size), name)},
+                         content_type='multipart/form-data')
+    first, second = File.query.order_by(File.id).all()
+    auth_client.post(f'/share/{first.id}')
+    auth_client.post(f'/share/{second.id}')
+    auth_client.post(f'/share/{second.id}')
+    auth_client.get(f'/download/{first.id}')
+    for _ in range(3):
+        auth_client.get(f'/download/{second.id}')
+    access_log_buffer.flush()
+    auth_client.get(f'/download/{second.id}')   # Still buffered when the file goes
+    auth_client.post(f'/delete/{second.id}')
+
+    user = User.query.filter_by(username='testuser').first()
+    db.session.refresh(user)
+    live = (user.file_count, user.storage_bytes, user.total_downloads, user.active_shares)
+    assert live == (1, 1000, 1, 1)
+
+    user.file_count = user.storage_bytes = user.total_downloads = user.active_shares = 0
+    db.session.commit()
+    User.reconcile_counters()
+    db.session.commit()
+    db.session.refresh(user)
+    assert (user.file_count, user.storage_bytes, user.total_downloads, user.active_shares) == live
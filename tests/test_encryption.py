@@ -21,7 +21,14 @@ sys.modules['config'] = Mock()
 sys.modules['config'].Config = MockConfig
 
 # --- Actual imports from the application ---
-from app.utils.file_utils import encrypt_file, decrypt_file
+import io
+import os
+import pytest
+from app.utils.file_utils import (
+    encrypt_file, decrypt_file, get_encryption_key, encrypt_file_aes,
+    EncryptedFileReader, EncryptedFileWriter, decrypt_stream, decrypt_range, select_codec, get_cipher,
+    HEADER, TAG_SIZE
+)
 
 def run_aes_encryption_tests():
     """Execute all tests for the AES encryption/decryption utilities"""
@@ -97,6 +104,185 @@ def run_aes_encryption_tests():
 
     print("\n🎉 All AES encryption tests passed!")
 
+def test_encryption_key_cached_until_config_changes():
+    """The derived key is reused and only re-derived when the configured secret changes"""
+    import config
+    first_key = get_encryption_key()
+    assert get_encryption_key() is first_key, "Key should be served from the cache"
+
+    original_secret = config.Config.ENCRYPTION_KEY
+    try:
+        config.Config.ENCRYPTION_KEY = original_secret + '-rotated'
+        rotated_key = get_encryption_key()
+        assert rotated_key != first_key, "Key should be re-derived after the secret changes"
+        assert get_encryption_key() is rotated_key
+    finally:
+        config.Config.ENCRYPTION_KEY = original_secret
+
+    assert get_encryption_key() == first_key
+
+
+def _encrypt_in_chunks(data, chunk_size, write_size, codec=None, cipher='aes-256-gcm'):
+    output = io.BytesIO()
+    with EncryptedFileWriter(output, chunk_size=chunk_size, codec=codec, cipher=cipher) as writer:
+        for offset in range(0, len(data), write_size):
+            writer.write(data[offset:offset + write_size])
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('size', [0, 1, 63, 64, 65, 128, 1000])
+def test_chunked_format_round_trip(size):
+    """Data of any size survives the chunked writer and streaming reader"""
+    data = bytes(range(256)) * 4
+    data = data[:size]
+    encrypted = _encrypt_in_chunks(data, chunk_size=64, write_size=37)
+
+    chunks = -(-size // 64) or 1
+    assert len(encrypted) == HEADER.size + size + chunks * TAG_SIZE
+    streamed = list(decrypt_stream(io.BytesIO(encrypted)))
+    assert all(len(chunk) <= 64 for chunk in streamed)
+    assert b''.join(streamed) == data
+
+
+def test_chunked_format_rejects_tampering_and_truncation():
+    """Modified, truncated or extended ciphertext fails authentication"""
+    data = b'B' * 200
+    encrypted = _encrypt_in_chunks(data, chunk_size=64, write_size=200)
+
+    tampered = bytearray(encrypted)
+    tampered[HEADER.size + 70] ^= 0x01
+    truncated = encrypted[:HEADER.size + 2 * (64 + TAG_SIZE)]
+    extended = encrypted + encrypted[HEADER.size:HEADER.size + 64 + TAG_SIZE]
+
+    for bad in (bytes(tampered), truncated, extended):
+        with pytest.raises(ValueError):
+            decrypt_file(bad)
+
+
+def test_legacy_cbc_files_still_decrypt():
+    """Single-blob CBC files written by older versions remain readable"""
+    for size in (0, 15, 16, 17, 100000):
+        data = b'L' * size
+        legacy = encrypt_file_aes(data)
+        assert decrypt_file(legacy) == data
+        streamed = list(decrypt_stream(io.BytesIO(legacy), read_size=4096))
+        assert b''.join(streamed) == data
+
+
+def test_decrypt_range_matches_slices_for_both_formats():
+    """Range decryption returns exactly the requested bytes for chunked and legacy files"""
+    data = bytes(range(256)) * 3 + b'tail'
+    formats = {
+        'chunked': _encrypt_in_chunks(data, chunk_size=64, write_size=100),
+        'legacy': encrypt_file_aes(data),
+    }
+    ranges = [(0, 1), (0, len(data)), (5, 70), (64, 128), (63, 65), (700, len(data)), (770, 10000)]
+    for name, encrypted in formats.items():
+        for start, stop in ranges:
+            result = b''.join(decrypt_range(io.BytesIO(encrypted), start, stop, read_size=32))
+            assert result == data[start:stop], f"{name} range {start}-{stop} mismatch"
+
+
+@pytest.mark.parametrize('cipher', ['aes-256-gcm', 'chacha20-poly1305'])
+def test_each_registered_cipher_round_trips_and_authenticates(cipher):
+    """Every AEAD cipher round-trips, records its id and rejects tampering"""
+    data = bytes(range(256)) * 5
+    encrypted = _encrypt_in_chunks(data, chunk_size=64, write_size=100, cipher=cipher)
+
+    assert encrypted[5] == get_cipher(cipher).cipher_id
+    assert decrypt_file(encrypted) == data
+    assert b''.join(decrypt_range(io.BytesIO(encrypted), 60, 200)) == data[60:200]
+    tampered = bytearray(encrypted)
+    tampered[-1] ^= 0x01
+    with pytest.raises(ValueError):
+        decrypt_file(bytes(tampered))
+
+
+def test_unknown_cipher_is_rejected():
+    """Writing with an unregistered cipher, or reading an unknown id, fails cleanly"""
+    with pytest.raises(ValueError):
+        encrypt_file(b'data', cipher='aes-128-cbc')
+    encrypted = bytearray(encrypt_file(b'data'))
+    encrypted[5] = 0xEE
+    with pytest.raises(ValueError):
+        decrypt_file(bytes(encrypted))
+
+
+def test_parallel_encryption_matches_serial_format():
+    """Chunks encrypted and decrypted on worker threads come back in order"""
+    data = os.urandom(64 * 50 + 17)
+    output = io.BytesIO()
+    with EncryptedFileWriter(output, chunk_size=64, workers=3, parallel_threshold=640) as writer:
+        for offset in range(0, len(data), 100):
+            writer.write(data[offset:offset + 100])
+        # Never more than two chunks per worker waiting to be written
+        assert len(writer._in_flight) <= 6
+    encrypted = output.getvalue()
+
+    assert b''.join(decrypt_stream(io.BytesIO(encrypted), workers=1)) == data
+    assert b''.join(decrypt_stream(io.BytesIO(encrypted), workers=4)) == data
+
+    tampered = bytearray(encrypted)
+    tampered[len(tampered) // 2] ^= 0x01
+    with pytest.raises(ValueError):
+        b''.join(decrypt_stream(io.BytesIO(bytes(tampered)), workers=4))
+
+
+def test_parallel_settings_follow_the_app_config(app):
+    """Workers and threshold come from the running app, not the Config class"""
+    app.config.update(ENCRYPTION_WORKERS=3, ENCRYPTION_PARALLEL_THRESHOLD=1024)
+    writer = EncryptedFileWriter(io.BytesIO(), chunk_size=64)
+    assert (writer.workers, writer._parallel_threshold) == (3, 1024)
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_compressed_files_round_trip(codec):
+    """Compressed files are smaller on disk and stream back in bounded pieces"""
+    data = b'compressible line of text\n' * 20000
+    encrypted = _encrypt_in_chunks(data, chunk_size=4096, write_size=10000, codec=codec)
+
+    assert len(encrypted) < len(data) / 10
+    streamed = list(decrypt_stream(io.BytesIO(encrypted)))
+    assert all(len(chunk) <= 4096 for chunk in streamed)
+    assert b''.join(streamed) == data
+    assert b''.join(decrypt_range(io.BytesIO(encrypted), 100000, 100050)) == data[100000:100050]
+    assert decrypt_file(_encrypt_in_chunks(b'', chunk_size=64, write_size=1, codec=codec)) == b''
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'lzma'])
+def test_range_on_compressed_file_opens_only_covering_chunks(codec, monkeypatch):
+    """Each chunk is compressed on its own, so a range seeks to it instead of inflating from byte 0"""
+    data = os.urandom(2048) + b'seekable audio frames ' * 2000
+    encrypted = _encrypt_in_chunks(data, chunk_size=1024, write_size=3000, codec=codec)
+    opened = []
+    decrypt_record = EncryptedFileReader._decrypt_record
+    monkeypatch.setattr(EncryptedFileReader, '_decrypt_record',
+                        lambda self, record, index, final: opened.append(index) or decrypt_record(self, record, index, final))
+
+    assert b''.join(decrypt_range(io.BytesIO(encrypted), 30000, 31500)) == data[30000:31500]
+    assert opened == [29, 30]
+    opened.clear()
+    assert b''.join(decrypt_range(io.BytesIO(encrypted), len(data) - 10, len(data) + 50)) == data[-10:]
+    assert opened == [(len(data) - 1) // 1024]
+
+    # The record index cannot be used to splice records around
+    damaged = bytearray(encrypted)
+    table = len(damaged) - 8 - 4 * int.from_bytes(damaged[-8:-4], 'big')
+    damaged[table:table + 4] = (int.from_bytes(damaged[table:table + 4], 'big') + 4).to_bytes(4, 'big')
+    with pytest.raises(ValueError):
+        b''.join(decrypt_range(io.BytesIO(bytes(damaged)), 2000, 2100))
+
+
+def test_compression_is_skipped_for_compressed_formats():
+    """Known compressed types and incompressible samples are stored as is"""
+    text = b'plain text ' * 1000
+    assert select_codec('notes.txt', text, 'zlib') == 'zlib'
+    assert select_codec('photo.jpg', text, 'zlib') is None
+    assert select_codec('report.docx', text, 'zlib') is None
+    assert select_codec('noise.txt', os.urandom(4096), 'zlib') is None
+    assert select_codec('notes.txt', text, None) is None
+
+
 if __name__ == '__main__':
     print("SecureShare AES Encryption Tests")
     print("=" * 40)
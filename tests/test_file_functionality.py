@@ -6,7 +6,6 @@ Test script for file upload and download functionality
 import sys
 import os
 import tempfile
-import io
 
 sys.path.append('.')
 
@@ -149,6 +148,60 @@ def test_web_routes():
         
         print("✅ Route protection working correctly")
 
+def test_downloads_stream_without_temp_files(app, auth_client, upload_folder, upload):
+    """Owner and shared downloads decrypt into the response without touching disk"""
+    payload = os.urandom(200 * 1024 + 7)
+    file_record = upload(payload)
+    assert file_record.file_size == len(payload)
+    stored = sorted(os.listdir(upload_folder))
+
+    response = auth_client.get(f'/download/{file_record.id}')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.content_length == len(payload)
+    assert response.data == payload
+
+    file_record.generate_share_token()
+    db.session.commit()
+    response = app.test_client().get(f'/shared/{file_record.share_token}')
+    assert response.status_code == 200
+    assert response.data == payload
+
+    assert sorted(os.listdir(upload_folder)) == stored
+    assert File.query.one().download_count == 2
+
+
+def test_download_range_requests(auth_client, upload_folder, upload):
+    """Range and If-Range requests return 206/416 and only count full downloads"""
+    payload = os.urandom(150 * 1024)
+    file_record = upload(payload, 'song.mp3')
+    url = f'/download/{file_record.id}'
+
+    full = auth_client.get(url)
+    assert full.headers['Accept-Ranges'] == 'bytes'
+    etag = full.headers['ETag']
+
+    response = auth_client.get(url, headers={'Range': 'bytes=70000-80000'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 70000-80000/{len(payload)}'
+    assert response.data == payload[70000:80001]
+
+    response = auth_client.get(url, headers={'Range': 'bytes=-100', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == payload[-100:]
+
+    response = auth_client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status_code == 200
+    assert response.data == payload
+
+    response = auth_client.get(url, headers={'Range': f'bytes={len(payload)}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(payload)}'
+
+    # Only the two complete downloads are counted, not the resumed ranges
+    assert File.query.one().download_count == 2
+
+
 if __name__ == '__main__':
     print("SecureShare File Functionality Tests")
     print("=" * 40)
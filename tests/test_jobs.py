@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Background job queue tests
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append('.')
+
+from app.models import db, File, Blob, Job
+from app.utils.file_utils import encrypt_file_aes
+from app.utils.jobs import enqueue, job_runner, job_stats, register_job
+
+calls = []
+
+
+@register_job('test_flaky')
+def flaky_job(fail_times=0, label=''):
+    calls.append(label)
+    if len(calls) <= fail_times:
+        raise RuntimeError(f'attempt {len(calls)} failed')
+
+
+def test_jobs_run_after_commit(app):
+    """Jobs are rows; run_pending drains what is due and records the outcome"""
+    calls.clear()
+    enqueue('test_flaky', label='now')
+    enqueue('test_flaky', delay=3600, label='later')
+    db.session.commit()
+
+    assert job_runner.run_pending() == 1
+    assert calls == ['now']
+    assert job_stats()['test_flaky'] == {'succeeded': 1, 'queued': 1}
+
+
+def test_failed_jobs_retry_then_give_up(app):
+    """Failures are retried with backoff until max_attempts, then left failed"""
+    app.config['JOB_RETRY_BACKOFF'] = 0
+    job_runner.init_app(app)
+    calls.clear()
+    job = enqueue('test_flaky', fail_times=1)
+    db.session.commit()
+    recovers = job.id
+    assert job_runner.run_pending() == 2
+    job = db.session.get(Job, recovers)
+    assert (job.status, job.attempts, job.last_error) == ('succeeded', 2, None)
+
+    calls.clear()
+    job = enqueue('test_flaky', max_attempts=3, fail_times=10)
+    db.session.commit()
+    doomed = job.id
+    assert job_runner.run_pending() == 3
+    job = db.session.get(Job, doomed)
+    assert (job.status, job.attempts) == ('failed', 3)
+    assert 'attempt 3 failed' in job.last_error
+
+
+def test_claimed_jobs_are_not_run_twice(app):
+    """A job another worker already claimed is skipped"""
+    calls.clear()
+    job = enqueue('test_flaky')
+    db.session.commit()
+    job.status = 'running'
+    db.session.commit()
+
+    assert job_runner.run_pending() == 0
+    assert calls == []
+
+
+def test_only_jobs_without_a_heartbeat_are_reclaimed(app):
+    """Stale runs count as attempts, and a live worker's long job is left alone"""
+    calls.clear()
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    jobs = [enqueue('test_flaky', max_attempts=2, label=label) for label in ('dead', 'doomed', 'alive')]
+    db.session.commit()
+    for job, attempts in zip(jobs, (1, 2, 1)):
+        job.status, job.attempts, job.started_at, job.heartbeat_at = 'running', attempts, long_ago, long_ago
+        job.locked_by = f'worker-{job.id}'
+    db.session.commit()
+    dead, doomed, alive = (job.id for job in jobs)
+
+    job_runner._active[alive] = f'worker-{alive}'
+    try:
+        assert job_runner.heartbeat() == 1
+    finally:
+        job_runner._active.clear()
+    assert job_runner.requeue_stale() == 1
+    assert [db.session.get(Job, job_id).status for job_id in (dead, doomed, alive)] == \
+        ['queued', 'failed', 'running']
+
+    # The reclaimed job runs again as its next attempt
+    assert job_runner.run_pending() == 1
+    assert calls == ['dead']
+    assert db.session.get(Job, dead).attempts == 2
+
+
+def test_admin_can_retry_failed_jobs(app, client, admin_user, login):
+    """The jobs page lists failures and can queue them again"""
+    calls.clear()
+    job = enqueue('test_flaky', max_attempts=1, fail_times=1)
+    db.session.commit()
+    job_id = job.id
+    job_runner.run_pending()
+
+    login('admin')
+    response = client.get('/admin/jobs')
+    assert response.status_code == 200
+    assert b'attempt 1 failed' in response.data
+
+    client.post(f'/admin/jobs/{job_id}/retry')
+    assert db.session.get(Job, job_id).status == 'queued'
+    assert job_runner.run_pending() == 1
+    assert db.session.get(Job, job_id).status == 'succeeded'
+
+
+def test_legacy_files_are_reencrypted_into_blobs(app, client, admin_user, upload_folder, login):
+    """Files from before the blob store move into it and still decrypt"""
+    admin = login('admin')
+    payload = os.urandom(5000)
+    os.makedirs(upload_folder, exist_ok=True)
+    legacy_path = os.path.join(upload_folder, 'legacy.bin')
+    with open(legacy_path, 'wb') as f:
+        f.write(encrypt_file_aes(payload))
+    file_record = File(filename='legacy.bin', original_filename='old.bin', encrypted_path=legacy_path,
+                       file_size=len(payload), mime_type='application/octet-stream', owner_id=admin.id)
+    db.session.add(file_record)
+    db.session.commit()
+
+    client.post('/admin/jobs/reencrypt-legacy')
+    assert job_runner.run_pending() == 1
+
+    file_record = db.session.get(File, file_record.id)
+    assert file_record.blob_id is not None
+    assert Blob.query.count() == 1
+    assert not os.path.exists(legacy_path)
+    assert client.get(f'/download/{file_record.id}').get_data() == payload
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Query plan tests: the hot File/AccessLog queries must keep using their indexes
+"""
+
+import sys
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, text
+
+sys.path.append('.')
+
+from app.models import db, File, AccessLog
+
+
+def query_plan(query):
+    """Return SQLite's EXPLAIN QUERY PLAN details for a query"""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+
+HOT_QUERIES = {
+    'files page': (
+        lambda: File.query.filter_by(owner_id=1).order_by(File.upload_time.desc()).limit(10),
+        'ix_file_owner_upload_time',
+    ),
+    'dashboard category counts': (
+        lambda: db.session.query(File.category, func.count(File.id))
+        .filter(File.owner_id == 1).group_by(File.category),
+        'ix_file_owner_upload_time',
+    ),
+    'dashboard recent activity': (
+        lambda: AccessLog.query.filter_by(user_id=1).order_by(AccessLog.timestamp.desc()).limit(5),
+        'ix_access_log_user_timestamp',
+    ),
+    'user download count': (
+        lambda: db.session.query(func.count(AccessLog.id)).filter_by(user_id=1, action='download'),
+        'ix_access_log_user_action',
+    ),
+    'view_file download history': (
+        lambda: AccessLog.query.filter_by(file_id=1, action='download')
+        .order_by(AccessLog.timestamp.desc()).limit(10),
+        'ix_access_log_file_action_timestamp',
+    ),
+    'access log time window': (
+        lambda: AccessLog.query.filter(AccessLog.timestamp < datetime(2024, 1, 1)),
+        'ix_access_log_timestamp',
+    ),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(app, name):
+    """Each hot query is answered by a search on its index, never a full scan"""
+    build_query, index_name = HOT_QUERIES[name]
+    plan = query_plan(build_query())
+    assert any(index_name in step and step.startswith('SEARCH') for step in plan), plan
+    assert not any(step.startswith('SCAN') for step in plan), plan
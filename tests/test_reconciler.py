@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Storage reconciler tests
+"""
+
+import logging
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append('.')
+
+from app.utils.file_utils import delete_file
+from app.utils.jobs import job_runner
+from app.utils.reconciler import reconcile_storage, _walk_sorted
+
+
+# Reconciles run two hours ahead: planting sets ctime to the real time,
+# which cannot be backdated, so only the clock can make planted files old
+LATER = time.time() + 7200
+
+
+def _plant(path, payload, age=7200):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(payload)
+    stamp = LATER - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+@pytest.fixture
+def store(app, client, test_user, upload_folder, login, upload):
+    """Two uploaded files plus old orphans, an old temp file and a fresh orphan"""
+    login('testuser')
+    kept = upload(b'keep me')
+    lost = upload(b'lost on disk')
+    os.remove(lost.encrypted_path)
+    folder = str(upload_folder)
+    return {
+        'kept': kept.encrypted_path,
+        'missing': lost.encrypted_path,
+        'orphans': [_plant(os.path.join(folder, 'blobs', 'ff', 'f' * 64), b'x' * 100),
+                    _plant(os.path.join(folder, 'old_upload.enc'), b'y' * 50)],
+        'temp': _plant(os.path.join(folder, 'temp_notes.txt'), b'plaintext!'),
+        'fresh': _plant(os.path.join(folder, 'blobs', 'incoming', 'uploading'), b'z', age=0),
+    }
+
+
+def test_reconcile_purges_orphans_and_reports_missing(app, store):
+    """Disk-only files go, stored files stay, DB-only paths are reported"""
+    report = reconcile_storage(min_age=3600, workers=2, batch_size=2, now=LATER)
+
+    assert (report.orphans, report.temp_files, report.purged) == (2, 1, 3)
+    assert report.reclaimed_bytes == 100 + 50 + len(b'plaintext!')
+    assert (report.missing, report.missing_sample) == (1, [store['missing']])
+    assert not any(os.path.exists(path) for path in store['orphans'] + [store['temp']])
+    assert os.path.exists(store['kept']) and os.path.exists(store['fresh'])
+
+
+def test_dry_run_deletes_nothing(app, store):
+    report = reconcile_storage(min_age=3600, dry_run=True, now=LATER)
+
+    assert (report.orphans, report.temp_files, report.purged) == (2, 1, 0)
+    assert all(os.path.exists(path) for path in store['orphans'] + [store['temp']])
+
+
+def test_reconcile_refuses_a_foreign_upload_folder(app, store, tmp_path):
+    """If no stored path is under the folder, everything would look orphaned"""
+    with pytest.raises(ValueError):
+        reconcile_storage(upload_folder=str(tmp_path / 'elsewhere'))
+
+
+def test_reconcile_job_from_admin_page(app, client, admin_user, store, login):
+    app.config['RECONCILE_MIN_AGE'] = 0
+    login('admin')
+    client.post('/admin/jobs/reconcile-storage')
+    assert job_runner.run_pending() >= 1
+    assert not os.path.exists(store['temp'])
+    assert os.path.exists(store['kept'])
+
+
+def test_freshly_linked_paths_are_not_orphans(app, store, upload_folder):
+    """A new hard link to an old file, not yet in the database, survives the purge"""
+    old = str(upload_folder / 'legacy.enc')
+    with open(old, 'wb') as f:
+        f.write(b'moving')
+    stamp = time.time() - 7200
+    os.utime(old, (stamp, stamp))
+    linked = str(upload_folder / 'ab' / 'cd' / 'legacy.enc')
+    os.makedirs(os.path.dirname(linked))
+    os.link(old, linked)
+
+    reconcile_storage(min_age=3600)
+    assert os.stat(linked).st_mtime == stamp
+    assert os.path.exists(old) and os.path.exists(linked)
+
+
+def test_walk_is_in_full_path_order(tmp_path):
+    """Files sort as whole path strings, so the walk merges with ORDER BY path"""
+    for name in ('d.txt', 'd/a', 'd-x/b', 'e'):
+        _plant(str(tmp_path / name), b'')
+    paths = [entry.path for entry in _walk_sorted(str(tmp_path))]
+    assert paths == sorted(paths)
+    assert len(paths) == 4
+
+
+def test_delete_file_logs_failures(tmp_path, caplog):
+    """A file that cannot be removed is logged instead of silently ignored"""
+    assert delete_file(str(tmp_path / 'never-existed')) is False
+    with caplog.at_level(logging.ERROR):
+        assert delete_file(str(tmp_path)) is False
+    assert 'Could not delete' in caplog.text
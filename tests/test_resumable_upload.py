@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Resumable chunked upload API tests
+"""
+
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.append('.')
+
+from app.models import db, File, Blob, Job, UploadSession, UploadPart
+from app.utils.blob_store import ContentDigest, digest_from_leaves, leaf_digests
+from app.utils.jobs import job_runner
+from app.utils.resumable_upload import expire_sessions
+
+PART_SIZE = 128 * 1024
+
+
+@pytest.fixture
+def uploads(app, client, test_user, upload_folder, login):
+    """Small parts and chunks so multi-part uploads stay cheap"""
+    app.config['ENCRYPTION_CHUNK_SIZE'] = 64 * 1024
+    app.config['UPLOAD_PART_SIZE'] = PART_SIZE
+    login('testuser')
+    return client
+
+
+def _start(client, size, filename='archive.zip'):
+    response = client.post('/api/uploads', json={'filename': filename, 'size': size})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def _put(client, upload, number, payload):
+    part = payload[number * upload['part_size']:(number + 1) * upload['part_size']]
+    return client.put(f"/api/uploads/{upload['id']}/parts/{number}", data=part,
+                      content_type='application/octet-stream')
+
+
+def test_out_of_order_parts_round_trip(uploads):
+    """Parts sent in any order assemble into a file that downloads intact"""
+    payload = os.urandom(3 * PART_SIZE + 1234)
+    upload = _start(uploads, len(payload))
+    assert upload['part_count'] == 4
+
+    for number in (2, 0, 3, 1):
+        assert _put(uploads, upload, number, payload).status_code == 200
+
+    response = uploads.post(f"/api/uploads/{upload['id']}/complete")
+    assert response.status_code == 201
+    file_id = response.get_json()['file_id']
+    assert db.session.get(File, file_id).file_size == len(payload)
+    assert UploadSession.query.count() == 0 and UploadPart.query.count() == 0
+    assert uploads.get(f'/download/{file_id}').get_data() == payload
+
+
+def test_status_lists_received_parts_for_resume(uploads):
+    """A client can ask which parts arrived and send only the rest"""
+    payload = os.urandom(2 * PART_SIZE + 10)
+    upload = _start(uploads, len(payload))
+    _put(uploads, upload, 1, payload)
+    # Repeating a stored part is acknowledged without rewriting it
+    assert _put(uploads, upload, 1, payload).status_code == 200
+
+    status = uploads.get(f"/api/uploads/{upload['id']}").get_json()
+    assert status['received'] == [1]
+
+    response = uploads.post(f"/api/uploads/{upload['id']}/complete")
+    assert response.status_code == 409
+
+    for number in set(range(status['part_count'])) - set(status['received']):
+        _put(uploads, upload, number, payload)
+    assert uploads.post(f"/api/uploads/{upload['id']}/complete").status_code == 201
+
+
+def test_part_with_different_content_is_refused(uploads):
+    """Resending a part with other bytes would reuse its nonces"""
+    payload = os.urandom(2 * PART_SIZE)
+    upload = _start(uploads, len(payload))
+    _put(uploads, upload, 0, payload)
+
+    tampered = os.urandom(PART_SIZE) + payload[PART_SIZE:]
+    assert _put(uploads, upload, 0, tampered).status_code == 409
+    # Wrong lengths and out-of-range parts are rejected too
+    assert uploads.put(f"/api/uploads/{upload['id']}/parts/1", data=b'short').status_code == 400
+    assert _put(uploads, upload, 5, payload).status_code == 404
+
+
+def test_resumable_and_form_uploads_share_a_blob(uploads):
+    """Both upload paths compute the same content digest, so they deduplicate"""
+    payload = os.urandom(2 * PART_SIZE + 999)
+    uploads.post('/upload', data={'file': (io.BytesIO(payload), 'first.zip')},
+                 content_type='multipart/form-data')
+
+    upload = _start(uploads, len(payload), 'second.zip')
+    for number in range(upload['part_count']):
+        _put(uploads, upload, number, payload)
+    uploads.post(f"/api/uploads/{upload['id']}/complete")
+
+    blob = Blob.query.one()
+    assert blob.refcount == 2
+    assert File.query.count() == 2
+
+
+def test_sessions_are_private_and_expire(uploads, app, admin_user, login):
+    """Other users cannot see a session; expired ones are removed with their staging file"""
+    upload = _start(uploads, 10)
+    staging_path = db.session.get(UploadSession, upload['id']).staging_path
+    assert os.path.exists(staging_path)
+
+    login('admin')
+    assert uploads.get(f"/api/uploads/{upload['id']}").status_code == 404
+
+    from datetime import datetime, timedelta
+    assert expire_sessions(now=datetime.utcnow() + timedelta(days=2)) == 1
+    assert not os.path.exists(staging_path)
+
+
+def test_expiry_runs_as_a_recurring_job(uploads):
+    """The runner keeps one expiry job queued, and running it removes abandoned sessions"""
+    from datetime import datetime, timedelta
+
+    upload = _start(uploads, 10)
+    staging_path = db.session.get(UploadSession, upload['id']).staging_path
+
+    job_runner.run_pending()
+    job = Job.query.filter_by(kind='expire_upload_sessions', status='queued').one()
+    job_runner.run_pending()
+    assert Job.query.filter_by(kind='expire_upload_sessions').count() == 1
+
+    db.session.get(UploadSession, upload['id']).expires_at = datetime.utcnow() - timedelta(seconds=1)
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert job_runner.run_pending() == 1
+    assert UploadSession.query.count() == 0
+    assert not os.path.exists(staging_path)
+    # The next sweep is queued again
+    assert Job.query.filter_by(kind='expire_upload_sessions', status='queued').count() == 1
+
+
+def test_open_sessions_per_user_are_capped(uploads, app):
+    """A user cannot reserve staging space with unlimited unfinished uploads"""
+    app.config['UPLOAD_MAX_OPEN_SESSIONS'] = 2
+    first = _start(uploads, 10)
+    _start(uploads, 10)
+
+    response = uploads.post('/api/uploads', json={'filename': 'archive.zip', 'size': 10})
+    assert response.status_code == 429
+    assert UploadSession.query.count() == 2
+
+    assert uploads.delete(f"/api/uploads/{first['id']}").status_code in (200, 204)
+    _start(uploads, 10)
+
+
+def test_content_digest_matches_leaf_digests(app):
+    """The streaming digest equals the digest built from per-part leaves"""
+    payload = os.urandom(5 * 64 * 1024 + 17)
+    streaming = ContentDigest()
+    for offset in range(0, len(payload), 10000):
+        streaming.update(payload[offset:offset + 10000])
+    parts = [payload[:PART_SIZE], payload[PART_SIZE:2 * PART_SIZE], payload[2 * PART_SIZE:]]
+    assert streaming.hexdigest() == digest_from_leaves(b''.join(leaf_digests(part) for part in parts))
+    assert ContentDigest().hexdigest() == digest_from_leaves(b'')
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Share token cache tests
+"""
+
+import io
+import os
+import sys
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+sys.path.append('.')
+
+from app.models import db, File
+from app.utils.counters import download_counter
+from app.utils.share_cache import ShareTokenCache, SharedFile, share_cache
+
+
+def _shared_file(file_id):
+    return SharedFile(file_id, f'f{file_id}', f'f{file_id}.txt', f'/tmp/f{file_id}',
+                      1, 'text/plain', None)
+
+
+def test_lru_eviction_and_metrics():
+    """The least recently used token is evicted once the cache is full"""
+    cache = ShareTokenCache(max_size=2)
+    loads = []
+
+    def loader(token):
+        loads.append(token)
+        return _shared_file(len(loads))
+
+    cache.lookup('a', loader)
+    cache.lookup('b', loader)
+    cache.lookup('a', loader)   # hit, 'a' becomes most recent
+    cache.lookup('c', loader)   # evicts 'b'
+    cache.lookup('a', loader)   # still cached
+    cache.lookup('b', loader)   # reloaded
+
+    assert loads == ['a', 'b', 'c', 'b']
+    stats = cache.stats()
+    assert stats['size'] == 2
+    assert stats['hits'] == 2
+    assert stats['misses'] == 4
+    assert stats['evictions'] == 2
+    assert stats['hit_rate'] == 2 / 6
+
+
+def test_negative_entries_and_ttl():
+    """Unknown tokens are cached briefly; every entry expires after its TTL"""
+    cache = ShareTokenCache(ttl=60, negative_ttl=0.05)
+    loads = []
+
+    def loader(token):
+        loads.append(token)
+        return None
+
+    assert cache.lookup('guess', loader) is None
+    assert cache.lookup('guess', loader) is None
+    assert loads == ['guess']
+    assert cache.stats()['negative_hits'] == 1
+
+    time.sleep(0.06)
+    cache.lookup('guess', loader)
+    assert loads == ['guess', 'guess']
+
+
+def test_invalidation_drops_entries():
+    """invalidate() and invalidate_file() remove cached entries"""
+    cache = ShareTokenCache()
+    cache.lookup('a', lambda token: _shared_file(1))
+    cache.lookup('b', lambda token: _shared_file(2))
+
+    cache.invalidate('a')
+    cache.invalidate_file(2)
+    assert cache.stats()['size'] == 0
+
+
+def test_stale_load_is_not_cached():
+    """A lookup racing with an invalidation does not cache what it loaded"""
+    cache = ShareTokenCache()
+
+    def loader(token):
+        cache.invalidate(token)   # e.g. revoked while the query was running
+        return _shared_file(1)
+
+    cache.lookup('a', loader)
+    assert cache.stats()['size'] == 0
+
+
+def test_revoked_link_stops_working(app, auth_client, upload_folder):
+    """Revoking a share drops the cached token, so the link fails immediately"""
+    auth_client.post('/upload', data={'file': (io.BytesIO(b'shared data'), 'notes.txt')},
+                     content_type='multipart/form-data')
+    file_record = File.query.one()
+    token = file_record.generate_share_token()
+    db.session.commit()
+
+    assert auth_client.get(f'/shared/{token}').status_code == 200
+    assert auth_client.get(f'/shared/{token}').status_code == 200
+    assert share_cache.stats()['hits'] == 1
+
+    auth_client.post(f'/share/{file_record.id}')
+    response = auth_client.get(f'/shared/{token}')
+    assert response.status_code == 302
+    assert File.query.one().download_count == 2
+
+
+def test_revocation_invalidates_after_commit(app, auth_client, upload_folder, monkeypatch):
+    """The cached token is only dropped once the revocation is visible to other lookups"""
+    auth_client.post('/upload', data={'file': (io.BytesIO(b'shared data'), 'notes.txt')},
+                     content_type='multipart/form-data')
+    file_record = File.query.one()
+    file_record.generate_share_token()
+    db.session.commit()
+    file_id = file_record.id
+
+    events = []
+    invalidate = share_cache.invalidate
+    monkeypatch.setattr(share_cache, 'invalidate', lambda token: events.append('invalidate') or invalidate(token))
+    record_commit = lambda session: events.append('commit')
+    event.listen(Session, 'after_commit', record_commit)
+    try:
+        auth_client.post(f'/share/{file_id}')
+    finally:
+        event.remove(Session, 'after_commit', record_commit)
+    assert events[-2:] == ['commit', 'invalidate']
+
+
+def test_revocation_elsewhere_is_caught_on_download(app, auth_client, upload_folder):
+    """A cached token revoked by another process fails the guarded counter update"""
+    auth_client.post('/upload', data={'file': (io.BytesIO(b'shared data'), 'notes.txt')},
+                     content_type='multipart/form-data')
+    file_record = File.query.one()
+    token = file_record.generate_share_token()
+    db.session.commit()
+    assert auth_client.get(f'/shared/{token}').status_code == 200
+
+    # Bypass the model so this process's cache is not told
+    File.query.filter_by(id=file_record.id).update({'is_shared': False, 'share_token': None})
+    db.session.commit()
+
+    assert auth_client.get(f'/shared/{token}').status_code == 302
+    assert share_cache.stats()['size'] == 0
+    assert File.query.one().download_count == 1
+
+
+@pytest.mark.parametrize('mode', ['atomic', 'coalesced'])
+def test_revocation_elsewhere_is_caught_on_ranges(app, auth_client, upload_folder, mode):
+    """Range requests that do not count as downloads still re-check the share"""
+    download_counter.mode = mode
+    payload = os.urandom(100000)
+    auth_client.post('/upload', data={'file': (io.BytesIO(payload), 'clip.mp3')},
+                     content_type='multipart/form-data')
+    file_record = File.query.one()
+    token = file_record.generate_share_token()
+    db.session.commit()
+    response = auth_client.get(f'/shared/{token}', headers={'Range': 'bytes=1-'})
+    assert response.status_code == 206 and response.get_data() == payload[1:]
+
+    # Bypass the model so this process's cache is not told
+    File.query.filter_by(id=file_record.id).update({'is_shared': False, 'share_token': None})
+    db.session.commit()
+
+    assert auth_client.get(f'/shared/{token}', headers={'Range': 'bytes=1-'}).status_code == 302
+    assert share_cache.stats()['size'] == 0
+    download_counter.flush()
+    assert File.query.one().download_count == 0
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Sharded layout, multi-root placement and relayout migration tests
+"""
+
+import os
+import sys
+
+sys.path.append('.')
+
+from app.models import db, File, Blob
+from app.utils import storage_layout
+from app.utils.blob_store import blob_path
+from app.utils.file_utils import encrypt_file_aes
+from app.utils.storage_layout import choose_root, relayout_storage, root_of
+
+
+def test_blobs_fan_out_two_levels(app, client, test_user, upload_folder, login, upload):
+    login('testuser')
+    blob = upload(b'sharded').blob
+    digest = blob.digest
+    assert blob.path == os.path.join(str(upload_folder), 'blobs', digest[:2], digest[2:4], digest)
+    assert os.path.exists(blob.path)
+
+
+def test_uploads_spread_over_storage_roots(app, client, test_user, upload_folder, tmp_path, login, upload):
+    """Each blob lands wholly on one root, and every root gets some"""
+    roots = [str(tmp_path / 'disk1'), str(tmp_path / 'disk2')]
+    app.config['UPLOAD_ROOTS'] = roots
+    app.config['UPLOAD_ROOT_MIN_FREE'] = 0
+    login('testuser')
+    files = [upload(f'payload {i}'.encode()) for i in range(24)]
+
+    used = {root_of(file_record.blob.path) for file_record in files}
+    assert used == {str(upload_folder)} | set(roots)
+    for i, file_record in enumerate(files):
+        assert client.get(f'/download/{file_record.id}').get_data() == f'payload {i}'.encode()
+
+
+def test_adding_a_root_only_moves_keys_to_it(app, tmp_path):
+    """Rendezvous placement: keys move to the new root or stay put"""
+    app.config['UPLOAD_ROOT_MIN_FREE'] = 0
+    old_roots = [str(tmp_path / name) for name in ('a', 'b', 'c')]
+    new_roots = old_roots + [str(tmp_path / 'd')]
+    keys = [f'key-{i}' for i in range(300)]
+    before = {key: choose_root(key, old_roots) for key in keys}
+    after = {key: choose_root(key, new_roots) for key in keys}
+
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved and all(after[key] == new_roots[-1] for key in moved)
+    assert len(moved) < len(keys) / 2
+
+
+def test_full_roots_are_passed_over(app, tmp_path, monkeypatch):
+    roots = [str(tmp_path / 'full'), str(tmp_path / 'roomy')]
+    free = {roots[0]: 10, roots[1]: 10 ** 12}
+    monkeypatch.setattr(storage_layout, '_free_space', free.get)
+    app.config['UPLOAD_ROOT_MIN_FREE'] = 1000
+    assert {choose_root(f'key-{i}', roots) for i in range(50)} == {roots[1]}
+
+    # With no root above the minimum, the emptiest still takes writes
+    app.config['UPLOAD_ROOT_MIN_FREE'] = 10 ** 13
+    assert choose_root('key', roots) == roots[1]
+
+
+def test_relayout_moves_old_files_and_repoints_rows(app, client, test_user, upload_folder, login, upload):
+    """Old-layout blobs and flat legacy files move, and still download"""
+    user = login('testuser')
+    file_record = upload(b'old layout blob')
+    blob = file_record.blob
+    old_blob_path = os.path.join(str(upload_folder), 'blobs', blob.digest[:2], blob.digest)
+    os.replace(blob.path, old_blob_path)
+    blob.path = file_record.encrypted_path = old_blob_path
+
+    legacy_path = os.path.join(str(upload_folder), 'legacy_upload.enc')
+    with open(legacy_path, 'wb') as f:
+        f.write(encrypt_file_aes(b'legacy payload'))
+    legacy = File(filename='legacy_upload.enc', original_filename='legacy.txt', encrypted_path=legacy_path,
+                  file_size=len(b'legacy payload'), mime_type='text/plain', owner_id=user.id)
+    db.session.add(legacy)
+    db.session.commit()
+    file_id, legacy_id, blob_id = file_record.id, legacy.id, blob.id
+
+    assert relayout_storage(batch_size=1)[0] == 2
+    assert relayout_storage()[0] == 0
+
+    blob = db.session.get(Blob, blob_id)
+    assert blob.path == blob_path(str(upload_folder), blob.digest)
+    assert db.session.get(File, file_id).encrypted_path == blob.path
+    new_legacy_path = db.session.get(File, legacy_id).encrypted_path
+    assert os.path.dirname(os.path.dirname(os.path.dirname(new_legacy_path))) == str(upload_folder)
+    assert not os.path.exists(old_blob_path) and not os.path.exists(legacy_path)
+    assert client.get(f'/download/{file_id}').get_data() == b'old layout blob'
+    assert client.get(f'/download/{legacy_id}').get_data() == b'legacy payload'
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Hot/cold storage tiering tests
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.append('.')
+
+from app.models import db, File, AccessLog, Job
+from app.utils.audit_log import access_log_buffer
+from app.utils.blob_store import blob_path
+from app.utils.jobs import enqueue, job_runner
+from app.utils.reconciler import reconcile_storage
+from app.utils.tiering import demote_cold_blobs, tier_stats
+
+DAY = 24 * 3600
+
+
+def _aged(file_record, days):
+    """Backdate an upload by days; returns its id"""
+    file_record.upload_time = datetime.utcnow() - timedelta(days=days)
+    db.session.commit()
+    return file_record.id
+
+
+@pytest.fixture
+def cold_root(app, upload_folder, tmp_path):
+    root = tmp_path / 'cold'
+    app.config.update(TIER_COLD_ROOT=str(root), TIER_COLD_AFTER=30 * DAY, TIER_COLD_CODEC='lzma',
+                      TIER_DROP_DELAY=0, COMPRESSION_CODEC='zlib')
+    tier_stats.reset()
+    return root
+
+
+def test_idle_blobs_move_to_the_cold_tier(app, client, test_user, cold_root, login, upload):
+    """Old, unused files are re-compressed onto the cold root and still download"""
+    login('testuser')
+    payload = b'compressible text ' * 2000
+    idle_id = _aged(upload(payload), 60)
+    recent_id = _aged(upload(b'uploaded yesterday'), 1)
+    old_path = db.session.get(File, idle_id).encrypted_path
+
+    assert demote_cold_blobs() == (1, os.path.getsize(db.session.get(File, idle_id).encrypted_path))
+
+    idle = db.session.get(File, idle_id)
+    assert idle.storage_tier == 'cold'
+    assert idle.encrypted_path == blob_path(str(cold_root), idle.blob.digest)
+    assert idle.blob.codec == 'lzma' and idle.blob.path == idle.encrypted_path
+    assert db.session.get(File, recent_id).storage_tier == 'hot'
+    assert os.path.exists(old_path)  # Until its drop job runs
+    job_runner.run_pending()
+    assert not os.path.exists(old_path)
+    assert client.get(f'/download/{idle_id}').get_data() == payload
+
+
+def test_popular_files_stay_hot_longer(app, client, test_user, cold_root, login, upload):
+    """Idle time needed grows with the download count"""
+    login('testuser')
+    popular_id = _aged(upload(b'popular'), 60)
+    db.session.get(File, popular_id).download_count = 3  # needs 30 * (1 + log2(4)) = 90 idle days
+    db.session.commit()
+    assert demote_cold_blobs() == (0, 0)
+
+    last_week = datetime.utcnow() - timedelta(days=7)
+    db.session.add(AccessLog(action='download', file_id=popular_id, timestamp=last_week))
+    db.session.get(File, popular_id).download_count = 0
+    db.session.commit()
+    assert demote_cold_blobs() == (0, 0)  # Downloaded recently, however old the upload
+    assert demote_cold_blobs(now=datetime.utcnow() + timedelta(days=30))[0] == 1
+
+
+def test_download_promotes_a_cold_file_once(app, client, test_user, cold_root, login, upload):
+    """Cold downloads are served from the cold tier and queue a single promotion"""
+    login('testuser')
+    payload = b'bring me back ' * 500
+    file_id = _aged(upload(payload), 90)
+    demote_cold_blobs()
+    job_runner.run_pending()
+
+    assert client.get(f'/download/{file_id}').get_data() == payload
+    assert client.get(f'/download/{file_id}').get_data() == payload
+    access_log_buffer.flush()
+    assert Job.query.filter_by(kind='promote_file').one().dedupe_key == str(file_id)
+    assert job_runner.run_pending() >= 1
+
+    file_record = db.session.get(File, file_id)
+    assert file_record.storage_tier == 'hot'
+    assert file_record.blob.codec == 'zlib'
+    assert file_record.encrypted_path == blob_path(str(app.config['UPLOAD_FOLDER']), file_record.blob.digest)
+    assert not os.listdir(os.path.join(cold_root, 'blobs', file_record.blob.digest[:2],
+                                       file_record.blob.digest[2:4]))
+    assert client.get(f'/download/{file_id}').get_data() == payload
+    # A duplicate queued before the first one ran has nothing left to do
+    enqueue('promote_file', file_id=file_id)
+    db.session.commit()
+    job_runner.run_pending()
+    assert db.session.get(File, file_id).encrypted_path == blob_path(str(app.config['UPLOAD_FOLDER']),
+                                                                     file_record.blob.digest)
+    assert tier_stats.stats() == {'hot_downloads': 1, 'cold_downloads': 2, 'promotions_queued': 1,
+                                  'hit_rate': 1 / 3}
+
+
+def test_promotion_keeps_a_copy_awaiting_removal(app, client, test_user, cold_root, login, upload):
+    """Promoting back onto the old hot path cancels the pending removal of that path"""
+    app.config['TIER_DROP_DELAY'] = 3600
+    login('testuser')
+    file_id = _aged(upload(b'back and forth'), 90)
+    hot_path = db.session.get(File, file_id).encrypted_path
+    demote_cold_blobs()
+    cold_path = db.session.get(File, file_id).encrypted_path
+    assert Job.query.filter_by(kind='drop_tier_copy', status='queued').count() == 1
+
+    client.get(f'/download/{file_id}')
+    job_runner.run_pending()
+    assert db.session.get(File, file_id).encrypted_path == hot_path
+    drops = Job.query.filter_by(kind='drop_tier_copy', status='queued').all()
+    assert [json.loads(drop.payload) for drop in drops] == [{'path': cold_path}]
+    assert os.path.exists(hot_path)
+
+
+def test_reconcile_leaves_a_copy_awaiting_removal(app, client, test_user, cold_root, login, upload):
+    """The previous tier copy is not an orphan before its drop_tier_copy job runs"""
+    app.config['TIER_DROP_DELAY'] = 3600
+    login('testuser')
+    upload(b'stays hot')
+    file_id = _aged(upload(b'still being read'), 90)
+    hot_path = db.session.get(File, file_id).encrypted_path
+    demote_cold_blobs()
+
+    report = reconcile_storage(min_age=0, now=time.time() + 60)
+    assert report.orphans == 0
+    assert os.path.exists(hot_path)
+
+    Job.query.filter_by(kind='drop_tier_copy').delete()
+    db.session.commit()
+    assert reconcile_storage(min_age=0, now=time.time() + 60).orphans == 1
+    assert not os.path.exists(hot_path)
+
+
+def test_tier_report_page(app, client, admin_user, test_user, cold_root, login, upload):
+    login('testuser')
+    _aged(upload(b'cold one'), 90)
+    upload(b'hot one')
+    login('admin')
+
+    client.post('/admin/jobs/tier-storage')
+    job_runner.run_pending()
+    page = client.get('/admin/storage-tiers').get_data(as_text=True)
+    assert 'Storage Tiers' in page and str(cold_root) in page
+    assert File.query.filter_by(storage_tier='cold').count() == 1
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Write-behind access log buffer and download counter tests
+"""
+
+import sys
+
+sys.path.append('.')
+
+from app.models import db, User, File, AccessLog
+from app.utils.audit_log import access_log_buffer
+from app.utils.counters import download_counter
+
+
+def _make_file(name='log.txt'):
+    user = User.query.filter_by(username='testuser').first()
+    file_record = File(filename=name, original_filename=name, encrypted_path=f'/tmp/{name}',
+                       file_size=1, mime_type='text/plain', owner_id=user.id)
+    db.session.add(file_record)
+    db.session.commit()
+    return user, file_record
+
+
+def test_rows_are_written_on_flush(app, test_user):
+    """Queued rows stay in memory until flushed, then land in one batch"""
+    user, file_record = _make_file()
+    for _ in range(3):
+        access_log_buffer.record('download', user.id, file_record.id)
+    access_log_buffer.record('download', None, file_record.id)
+
+    assert AccessLog.query.count() == 0
+    assert access_log_buffer.pending_count == 4
+
+    assert access_log_buffer.flush() == 4
+    assert access_log_buffer.pending_count == 0
+    assert AccessLog.query.filter_by(file_id=file_record.id, action='download').count() == 4
+    assert AccessLog.query.filter_by(user_id=None).count() == 1
+
+
+def test_rows_for_deleted_files_are_dropped(app, test_user):
+    """A file deleted before the flush does not break the batch insert"""
+    user, kept = _make_file('kept.txt')
+    _, removed = _make_file('removed.txt')
+    access_log_buffer.record('download', user.id, kept.id)
+    access_log_buffer.record('delete', user.id, removed.id)
+    db.session.delete(removed)
+    db.session.commit()
+
+    assert access_log_buffer.flush() == 1
+    assert [log.file_id for log in AccessLog.query.all()] == [kept.id]
+
+
+def test_unbuffered_mode_joins_the_transaction(app, test_user):
+    """With buffering off, the row is part of the caller's transaction"""
+    user, file_record = _make_file()
+    access_log_buffer.enabled = False
+    try:
+        access_log_buffer.record('upload', user.id, file_record.id)
+        db.session.rollback()
+        assert AccessLog.query.count() == 0
+
+        access_log_buffer.record('upload', user.id, file_record.id)
+        db.session.commit()
+        assert AccessLog.query.count() == 1
+    finally:
+        access_log_buffer.enabled = True
+
+
+def test_atomic_download_counter_does_not_lose_increments(app, test_user):
+    """Increments are applied in SQL, so stale in-memory values cannot overwrite them"""
+    _, file_record = _make_file()
+    stale = File.query.get(file_record.id)
+    for _ in range(3):
+        download_counter.increment(stale.id)
+        db.session.commit()
+    db.session.expire_all()
+    assert File.query.get(file_record.id).download_count == 3
+
+
+def test_coalesced_download_counter(app, test_user):
+    """Coalesced increments are visible immediately and written in one batch"""
+    _, first = _make_file('first.txt')
+    _, second = _make_file('second.txt')
+    download_counter.mode = 'coalesced'
+    try:
+        for _ in range(5):
+            download_counter.increment(first.id)
+        download_counter.increment([first.id, second.id])
+
+        db.session.expire_all()
+        assert File.query.get(first.id).download_count == 0
+        assert File.query.get(first.id).downloads == 6
+
+        assert download_counter.flush() == 2
+        db.session.expire_all()
+        assert File.query.get(first.id).download_count == 6
+        assert File.query.get(second.id).download_count == 1
+        assert File.query.get(first.id).downloads == 6
+    finally:
+        download_counter.mode = 'atomic'
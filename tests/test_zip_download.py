@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Streaming ZIP bulk download tests
+"""
+
+import io
+import os
+import sys
+import zipfile
+from datetime import datetime
+
+sys.path.append('.')
+
+from app.models import db, User, File
+from app.utils.counters import download_counter
+from app.utils.zip_stream import iter_zip, unique_member_name
+
+
+def test_zip_contains_decrypted_selection(app, client, test_user, admin_user, upload_folder, login, upload):
+    """Only the user's selected files are archived, decrypted, under unique names"""
+    login('admin')
+    foreign_id = upload(b'not yours', 'secret.txt').id
+
+    user = login('testuser')
+    payloads = {'notes.txt': b'first notes', 'photo.zip': os.urandom(300 * 1024)}
+    ids = [upload(payload, name).id for name, payload in payloads.items()]
+    ids.append(upload(b'second notes', 'notes.txt').id)
+
+    response = client.post('/download/zip', data={'file_ids': ids + [foreign_id]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert 'attachment' in response.headers['Content-Disposition']
+
+    archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+    assert archive.testzip() is None
+    assert archive.namelist() == ['notes.txt', 'photo.zip', 'notes (1).txt']
+    assert archive.read('photo.zip') == payloads['photo.zip']
+    assert archive.read('notes (1).txt') == b'second notes'
+
+    download_counter.flush()
+    assert all(db.session.get(File, file_id).download_count == 1 for file_id in ids)
+    assert db.session.get(File, foreign_id).download_count == 0
+    user = db.session.get(User, user.id)
+    db.session.refresh(user)
+    assert user.total_downloads == 3
+
+
+def test_zip_requires_a_selection(app, client, test_user, upload_folder, login):
+    """Nothing selected, or nothing of the user's, redirects back to the file list"""
+    login('testuser')
+    assert client.post('/download/zip').status_code == 302
+    assert client.post('/download/zip', data={'file_ids': [12345]}).status_code == 302
+
+
+def test_iter_zip_streams_in_small_pieces():
+    """Output is produced as members are read, never as one archive-sized buffer"""
+    chunk = os.urandom(64 * 1024)
+    members = [(f'part{i}.bin', 40 * len(chunk), datetime(2024, 1, 1), (chunk for _ in range(40)))
+               for i in range(3)]
+    pieces = list(iter_zip(members))
+
+    assert max(len(piece) for piece in pieces) < 2 * len(chunk)
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(pieces)))
+    assert [info.file_size for info in archive.infolist()] == [40 * len(chunk)] * 3
+    assert archive.read('part2.bin') == chunk * 40
+
+
+def test_unique_member_name():
+    used = set()
+    assert [unique_member_name(name, used) for name in ('a.txt', 'a.txt', 'a.txt', 'b')] == \
+        ['a.txt', 'a (1).txt', 'a (2).txt', 'b']